@@ -0,0 +1,92 @@
+"""
+Precompiled quiz answer keys.
+
+Options are identified by their index in the question's option list (A is
+0). A question's correct options become a bitmask with bit i set when option
+i is correct; with at most eight options every mask fits in one byte, so the
+key for a whole quiz is a byte string stored on the quiz document next to
+the question IDs in order.
+
+Grading packs the submitted selections the same way and compares the two
+byte strings with a single XOR: a question is answered correctly exactly
+when its byte of the difference is zero. Questions whose key is empty (saved
+before every question was required to have a correct answer) can never be
+answered correctly.
+"""
+from typing import Dict, List, Sequence, Union
+
+from bson import ObjectId
+
+from quiz_schema import MAX_OPTIONS
+
+ANSWER_KEY_VERSION = 1
+
+
+class InvalidAnswerError(ValueError):
+    """Raised when a submission names an option the question does not have"""
+
+
+def mask_from_letters(letters: Sequence[str]) -> int:
+    mask = 0
+    for letter in letters or []:
+        mask |= 1 << (ord(letter) - 65)
+    return mask
+
+
+def mask_from_indices(indices: Sequence[int], num_options: int) -> int:
+    mask = 0
+    for index in indices:
+        if not 0 <= index < num_options:
+            raise InvalidAnswerError(f"Option index {index} is out of range for a question with {num_options} options")
+        mask |= 1 << index
+    return mask
+
+
+def indices_from_mask(mask: int) -> List[int]:
+    return [i for i in range(MAX_OPTIONS) if mask >> i & 1]
+
+
+def build_answer_key(question_docs: List[dict]) -> dict:
+    """Key for questions in quiz order; stored on the quiz as `answer_key`"""
+    return {
+        "version": ANSWER_KEY_VERSION,
+        "question_ids": [question_doc["_id"] for question_doc in question_docs],
+        "option_counts": bytes(len(question_doc["options"]) for question_doc in question_docs),
+        "masks": bytes(mask_from_letters(question_doc["correct_answers"]) for question_doc in question_docs),
+    }
+
+
+def selection_masks(
+    answer_key: dict,
+    answers: Dict[str, List[Union[int, str]]],
+    options_by_question: Dict[ObjectId, List[str]],
+) -> bytes:
+    """
+    Pack a submission into one byte per question, in key order. Selections are
+    option indices; option texts (the pre-index API) are looked up in
+    `options_by_question`. Unanswered questions get an empty mask.
+    """
+    packed = bytearray(len(answer_key["question_ids"]))
+    for position, question_id in enumerate(answer_key["question_ids"]):
+        selected = answers.get(str(question_id))
+        if not selected:
+            continue
+        num_options = answer_key["option_counts"][position]
+        indices = []
+        for choice in selected:
+            if isinstance(choice, int):
+                indices.append(choice)
+                continue
+            try:
+                indices.append(options_by_question[question_id].index(choice))
+            except (KeyError, ValueError):
+                raise InvalidAnswerError(f"'{choice}' is not an option of question {question_id}")
+        packed[position] = mask_from_indices(indices, num_options)
+    return bytes(packed)
+
+
+def grade(key_masks: bytes, submitted_masks: bytes) -> List[bool]:
+    """Per-question correctness for two packed mask strings of equal length"""
+    length = len(key_masks)
+    difference = (int.from_bytes(key_masks, "little") ^ int.from_bytes(submitted_masks, "little")).to_bytes(length, "little")
+    return [byte == 0 and key != 0 for byte, key in zip(difference, key_masks)]
@@ -0,0 +1,210 @@
+"""
+OpenAI API key provider.
+
+Keys come from OPENAI_API_KEY (comma-separated for several) or, when that is
+empty, from the active documents of the `api_keys` collection, read through
+the application's pooled MongoDB client. The key list is cached for
+API_KEY_CACHE_TTL_SECONDS and refreshed by a background task, or as soon as
+the collection changes when API_KEY_WATCH_CHANGES is on, so keys can be
+added, rotated or deactivated without a restart. If a refresh fails (say
+MongoDB is briefly unreachable) the cached keys keep being served and the
+refresh is retried after API_KEY_REFRESH_RETRY_SECONDS; only a cold start
+with no keys loaded yet fails.
+
+Which key serves a completion is decided by llm_dispatcher. A key document
+may set `requests_per_minute` (API_KEY_DEFAULT_RPM otherwise, 0 for no
+limit), a local budget the dispatcher honours on top of the limits the API
+reports. Uses are counted in memory and written to `last_used` /
+`use_count` with one bulk write every API_KEY_USAGE_FLUSH_SECONDS instead of
+one write per completion.
+"""
+import asyncio
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from bson import ObjectId
+
+import db
+from config import config
+
+
+class NoApiKeyError(Exception):
+    """Raised when neither the environment nor the database provides a key"""
+
+
+@dataclass
+class ApiKey:
+    """An API key with its per-minute request budget (a token bucket)"""
+    value: str
+    id: Optional[ObjectId] = None  # None for keys from the environment
+    name: str = ""
+    requests_per_minute: int = 0
+    tokens: float = 0.0
+    refilled_at: float = field(default_factory=time.monotonic)
+
+    def __post_init__(self):
+        self.tokens = float(self.requests_per_minute)
+
+    def _refill(self, now: float):
+        if self.requests_per_minute:
+            rate = self.requests_per_minute / 60
+            self.tokens = min(self.requests_per_minute, self.tokens + (now - self.refilled_at) * rate)
+        self.refilled_at = now
+
+    def try_take(self, now: float) -> bool:
+        if not self.requests_per_minute:
+            return True
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def wait_time(self, now: float) -> float:
+        """Seconds until the budget has room for one more request"""
+        if not self.requests_per_minute:
+            return 0.0
+        self._refill(now)
+        return max(0.0, (1 - self.tokens) * 60 / self.requests_per_minute)
+
+    @property
+    def label(self) -> str:
+        return self.name or f"...{self.value[-4:]}"
+
+
+def _environment_keys() -> List[str]:
+    return [key.strip() for key in (config.OPENAI_API_KEY or "").split(",") if key.strip()]
+
+
+class KeyProvider:
+    """Process-wide source of API keys; see the module docstring"""
+
+    def __init__(self):
+        self._keys: List[ApiKey] = []
+        self._loaded_at: Optional[float] = None
+        self._retry_at = 0.0
+        self._refresh_lock = asyncio.Lock()
+        self._usage: Dict[ObjectId, Tuple[datetime, int]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.refreshes = 0
+        self.refresh_failures = 0
+
+    async def keys(self) -> List[ApiKey]:
+        """The current key list, reloaded when older than the cache TTL"""
+        self._ensure_background_task()
+        if self._is_stale():
+            async with self._refresh_lock:
+                if self._is_stale():
+                    try:
+                        await self.refresh()
+                    except Exception as e:
+                        if not self._keys:
+                            raise
+                        self.refresh_failures += 1
+                        self._retry_at = time.monotonic() + config.API_KEY_REFRESH_RETRY_SECONDS
+                        print(f"Could not refresh API keys, serving the {len(self._keys)} cached: {str(e)}")
+        return self._keys
+
+    def _is_stale(self) -> bool:
+        if self._loaded_at is None:
+            return True
+        now = time.monotonic()
+        return now - self._loaded_at >= config.API_KEY_CACHE_TTL_SECONDS and now >= self._retry_at
+
+    async def refresh(self):
+        """Reload keys, keeping the budget state of keys that are still active"""
+        environment_keys = _environment_keys()
+        if environment_keys:
+            loaded = [ApiKey(value=key, requests_per_minute=config.API_KEY_DEFAULT_RPM) for key in environment_keys]
+        else:
+            loaded = [
+                ApiKey(
+                    value=doc["api_key"],
+                    id=doc["_id"],
+                    name=doc.get("name", ""),
+                    requests_per_minute=doc.get("requests_per_minute") or config.API_KEY_DEFAULT_RPM,
+                )
+                for doc in await db.find_active_api_keys()
+            ]
+        previous = {key.value: key for key in self._keys}
+        for key in loaded:
+            old = previous.get(key.value)
+            if old and old.requests_per_minute == key.requests_per_minute:
+                key.tokens, key.refilled_at = old.tokens, old.refilled_at
+        self._keys = loaded
+        self._loaded_at = time.monotonic()
+        self.refreshes += 1
+
+    def record_use(self, key: ApiKey):
+        if key.id is None:
+            return
+        _, count = self._usage.get(key.id, (None, 0))
+        self._usage[key.id] = (datetime.utcnow(), count + 1)
+
+    async def flush_usage(self):
+        usage, self._usage = self._usage, {}
+        try:
+            await db.record_api_key_usage(usage)
+        except Exception as e:
+            print(f"Could not record API key usage: {str(e)}")
+            # Keep the counts for the next flush
+            for key_id, (last_used, count) in usage.items():
+                newer, pending = self._usage.get(key_id, (last_used, 0))
+                self._usage[key_id] = (max(last_used, newer), count + pending)
+
+    def _ensure_background_task(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        flush = asyncio.create_task(self._flush_loop())
+        try:
+            if config.API_KEY_WATCH_CHANGES and not _environment_keys():
+                try:
+                    await self._watch()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    print(f"API key change stream unavailable, polling instead: {str(e)}")
+            while True:
+                await asyncio.sleep(config.API_KEY_CACHE_TTL_SECONDS)
+                try:
+                    async with self._refresh_lock:
+                        await self.refresh()
+                except Exception as e:
+                    print(f"Could not refresh API keys: {str(e)}")
+        finally:
+            flush.cancel()
+
+    async def _watch(self):
+        stream = await db.watch_api_keys()
+        async with stream:
+            async for _ in stream:
+                async with self._refresh_lock:
+                    await self.refresh()
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(config.API_KEY_USAGE_FLUSH_SECONDS)
+            await self.flush_usage()
+
+    async def close(self):
+        """Stop background refreshes and write out buffered usage"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush_usage()
+
+    def stats(self) -> dict:
+        return {
+            "keys": [key.label for key in self._keys],
+            "refreshes": self.refreshes,
+            "refresh_failures": self.refresh_failures,
+            "pending_usage_writes": len(self._usage),
+        }
+
+
+key_provider = KeyProvider()
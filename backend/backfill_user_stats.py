@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Build the user_stats documents from the attempts already stored.
+
+    python backfill_user_stats.py              # tag attempts with their quiz's difficulty and subject, rebuild every user's stats
+    python backfill_user_stats.py --dry-run    # print what would be written
+
+An attempt is counted in its user's stats once it carries the difficulty
+key of its quiz (see user_stats.py); attempts submitted before the stats
+existed do not, so they are tagged first, together with the quiz's
+subject_key that question_bank uses to find the subject quizzes a user has
+attempted (None for file quizzes). Each user's document is then recomputed
+from scratch with a server-side $group and replaced, which also repairs
+totals left behind by an interrupted write. The script can be re-run
+at any time; an attempt submitted or deleted while a user is being rebuilt
+may be missed until the next run. Stats documents of users without counted
+attempts are removed.
+"""
+import argparse
+import sys
+from datetime import datetime
+
+from pymongo import MongoClient, ReplaceOne, UpdateMany
+from config import config
+import user_stats
+
+
+def batches(cursor, size):
+    batch = []
+    for doc in cursor:
+        batch.append(doc)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def tag_attempts(database, batch_size, dry_run):
+    attempts = database["quiz_attempts"]
+    # Attempts from before the subject_key was copied have a difficulty but no subject
+    untagged = {"$or": [{"difficulty": {"$exists": False}}, {"subject_key": {"$exists": False}}]}
+    print(f"Attempts without a difficulty or subject: {attempts.count_documents(untagged)}")
+
+    tagged = orphaned = 0
+    quiz_ids = attempts.distinct("quiz_id", untagged)
+    for batch in batches(iter(quiz_ids), batch_size):
+        tags = {}
+        for quiz in database["quizzes"].find({"_id": {"$in": batch}}, {"difficulty": 1, "subject_key": 1}):
+            tags[quiz["_id"]] = {
+                "difficulty": user_stats.difficulty_key(quiz.get("difficulty")),
+                # An explicit None marks attempts at file quizzes as tagged too
+                "subject_key": quiz.get("subject_key"),
+            }
+        # Attempts of deleted quizzes are left alone; delete_quiz_cascade removes them
+        orphaned += len(batch) - len(tags)
+        writes = [
+            UpdateMany({"quiz_id": quiz_id, **untagged}, {"$set": fields})
+            for quiz_id, fields in tags.items()
+        ]
+        if not dry_run and writes:
+            tagged += attempts.bulk_write(writes, ordered=False).modified_count
+        print(f"  tagged attempts of {len(tags)} quizzes ({tagged} attempts so far)")
+
+    if orphaned:
+        print(f"Skipped attempts of {orphaned} quizzes that no longer exist")
+
+
+def build_stats_doc(user_id, rows, now):
+    """A user_stats document from the per-difficulty $group rows of one user"""
+    doc = {"_id": user_id, **dict.fromkeys(user_stats.COUNTERS, 0), "best_score": 0, "by_difficulty": {}, "updated_at": now}
+    for row in rows:
+        totals = {name: row[name] for name in user_stats.COUNTERS}
+        doc["by_difficulty"][row["_id"]["difficulty"]] = {**totals, "best_score": row["best_score"]}
+        for name, value in totals.items():
+            doc[name] += value
+        doc["best_score"] = max(doc["best_score"], row["best_score"])
+    return doc
+
+
+def rebuild_stats(database, batch_size, dry_run):
+    group = {"_id": {"user_id": "$user_id", "difficulty": "$difficulty"}, "best_score": {"$max": "$score"}}
+    group.update({
+        "total_attempts": {"$sum": 1},
+        "total_correct": {"$sum": "$correct_answers"},
+        "total_questions": {"$sum": "$total_questions"},
+        "total_time_seconds": {"$sum": {"$ifNull": ["$time_taken_seconds", 0]}},
+        "total_score": {"$sum": "$score"},
+    })
+    rows = database["quiz_attempts"].aggregate([
+        {"$match": {"difficulty": {"$exists": True}}},
+        {"$group": group},
+        {"$sort": {"_id.user_id": 1}},
+    ], allowDiskUse=True)
+
+    now = datetime.utcnow()
+    rebuilt = set()
+    writes = []
+
+    def flush():
+        if not dry_run and writes:
+            database["user_stats"].bulk_write(writes, ordered=False)
+        writes.clear()
+        print(f"  rebuilt stats of {len(rebuilt)} users")
+
+    user_id, user_rows = None, []
+    for row in rows:
+        if row["_id"]["user_id"] != user_id and user_rows:
+            writes.append(ReplaceOne({"_id": user_id}, build_stats_doc(user_id, user_rows, now), upsert=True))
+            rebuilt.add(user_id)
+            user_rows = []
+            if len(writes) == batch_size:
+                flush()
+        user_id = row["_id"]["user_id"]
+        user_rows.append(row)
+    if user_rows:
+        writes.append(ReplaceOne({"_id": user_id}, build_stats_doc(user_id, user_rows, now), upsert=True))
+        rebuilt.add(user_id)
+    flush()
+
+    stale = [doc["_id"] for doc in database["user_stats"].find({}, {"_id": 1}) if doc["_id"] not in rebuilt]
+    if stale and not dry_run:
+        database["user_stats"].delete_many({"_id": {"$in": stale}})
+    print(f"Removed stats of {len(stale)} users without attempts")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    client = MongoClient(config.MONGO_URI)
+    try:
+        database = client[config.DATABASE_NAME]
+        print(f"Connected to database: {config.DATABASE_NAME}")
+        tag_attempts(database, args.batch_size, args.dry_run)
+        rebuild_stats(database, args.batch_size, args.dry_run)
+        print("Backfill completed successfully!")
+    except Exception as e:
+        print(f"Error backfilling user stats: {str(e)}")
+        sys.exit(1)
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Background refill for the question bank.
+
+Every QUESTION_BANK_REFILL_SECONDS the refill loop tops each stocked subject
+(QUESTION_BANK_SUBJECTS at every QUESTION_BANK_DIFFICULTIES, plus subjects
+popular in recent quizzes) up to QUESTION_BANK_TARGET questions, generating
+QUESTION_BANK_BATCH_SIZE questions per completion. Its completions queue in
+the LLM dispatcher under their own owner, so refills take turns with user
+generations instead of delaying them.
+
+Run standalone:
+    python bank_refill.py           # keep refilling
+    python bank_refill.py --once    # one pass, e.g. from cron
+
+or inside the API process by setting QUESTION_BANK_INPROCESS_REFILL.
+"""
+import argparse
+import asyncio
+import signal
+import traceback
+from typing import List
+
+from config import config
+import db
+import llm
+import question_bank
+from llm_dispatcher import current_owner
+from quiz_generation import generate_from_subject
+
+REFILL_OWNER = "question-bank"
+
+
+async def refill_subject(subject_key: str, difficulty: str) -> int:
+    """Generate questions until the subject reaches its target; returns how many were added"""
+    added = 0
+    stored = await question_bank.inventory(subject_key, difficulty)
+    while stored < config.QUESTION_BANK_TARGET:
+        batch = min(config.QUESTION_BANK_BATCH_SIZE, config.QUESTION_BANK_TARGET - stored)
+        # A sample of what is already banked keeps the batch from repeating it
+        existing = await db.sample_bank_questions(subject_key, difficulty, 2 * batch, [])
+        generation = await generate_from_subject(subject_key, batch, difficulty, exclude=existing)
+        if not generation.questions:
+            print(f"Question bank refill for {subject_key} ({difficulty}) produced no questions; skipping")
+            break
+        await question_bank.deposit(subject_key, difficulty, generation.questions, "refill")
+        now_stored = await question_bank.inventory(subject_key, difficulty)
+        if now_stored == stored:
+            print(f"Question bank refill for {subject_key} ({difficulty}) only produced duplicates; skipping")
+            break
+        added += now_stored - stored
+        stored = now_stored
+    return added
+
+
+async def refill_once() -> int:
+    current_owner.set(REFILL_OWNER)
+    added = 0
+    for subject_key, difficulty in await question_bank.stock_targets():
+        try:
+            count = await refill_subject(subject_key, difficulty)
+        except Exception as e:
+            print(f"Error refilling question bank for {subject_key} ({difficulty}): {str(e)}")
+            traceback.print_exc()
+            continue
+        if count:
+            print(f"Added {count} questions on {subject_key} ({difficulty}) to the question bank")
+        added += count
+    return added
+
+
+async def run(stop: asyncio.Event):
+    print("Question bank refill started")
+    while not stop.is_set():
+        try:
+            await refill_once()
+        except Exception as e:
+            print(f"Error in question bank refill: {str(e)}")
+            traceback.print_exc()
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=config.QUESTION_BANK_REFILL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+    print("Question bank refill stopped")
+
+
+def start_refill(stop: asyncio.Event) -> List[asyncio.Task]:
+    """Start the refill loop on the running event loop"""
+    return [asyncio.create_task(run(stop))]
+
+
+async def main(once: bool):
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        if once:
+            added = await refill_once()
+            print(f"Question bank refill added {added} questions")
+        else:
+            await run(stop)
+    finally:
+        await llm.close_client()
+        await db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Keep the question bank stocked")
+    parser.add_argument("--once", action="store_true", help="Run a single refill pass and exit")
+    args = parser.parse_args()
+    asyncio.run(main(args.once))
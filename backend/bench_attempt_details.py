@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Benchmark: database round trips for GET /quiz-attempt/{attempt_id}.
+
+Seeds quizzes of increasing size with a graded attempt each, then calls
+get_quiz_attempt_details and counts the commands sent to MongoDB through
+a command listener. The count must be the same for every quiz size.
+
+Requires a reachable MongoDB at MONGO_URI. Data is written to the
+DATABASE_NAME database (defaults to quizzer_bench) and removed afterwards.
+
+Usage:
+    python bench_attempt_details.py --sizes 5 25 100
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from datetime import datetime
+
+os.environ.setdefault("DATABASE_NAME", "quizzer_bench")
+
+from bson import ObjectId
+from pymongo import monitoring
+
+
+class CommandCounter(monitoring.CommandListener):
+    def __init__(self):
+        self.commands = []
+
+    def started(self, event):
+        self.commands.append(event.command_name)
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+    def reset(self):
+        self.commands = []
+
+
+counter = CommandCounter()
+monitoring.register(counter)
+
+import db  # noqa: E402  (the listener must be registered before the client is created)
+from answer_key import build_answer_key  # noqa: E402
+from main import UserResponse, get_quiz_attempt_details  # noqa: E402
+
+
+async def seed(user_id: ObjectId, num_questions: int) -> ObjectId:
+    quiz_id = ObjectId()
+    question_docs = [{
+        "_id": ObjectId(),
+        "quiz_id": quiz_id,
+        "question_text": f"Question {i + 1}",
+        "options": ["Red", "Blue", "Green", "Yellow"],
+        "correct_answers": ["A", "B"],
+        "order": i + 1
+    } for i in range(num_questions)]
+    await db.insert_quiz_with_questions({
+        "_id": quiz_id,
+        "user_id": user_id,
+        "title": f"Benchmark quiz ({num_questions} questions)",
+        "source_file": "N/A",
+        "difficulty": "medium",
+        "num_questions": num_questions,
+        "created_at": datetime.utcnow(),
+        "answer_key": build_answer_key(question_docs)
+    }, question_docs)
+
+    attempt_id = ObjectId()
+    await db.insert_attempt({
+        "_id": attempt_id,
+        "user_id": user_id,
+        "quiz_id": quiz_id,
+        "difficulty": "medium",
+        "total_questions": num_questions,
+        "correct_answers": num_questions,
+        "score": 100.0,
+        "completed_at": datetime.utcnow(),
+        "time_taken_seconds": 1.0,
+        "answer_masks": bytes([0b0011] * num_questions)
+    })
+    return attempt_id
+
+
+async def run(sizes):
+    user_id = ObjectId()
+    user = UserResponse(_id=str(user_id), username="bench_user")
+    round_trips = {}
+    try:
+        for size in sizes:
+            attempt_id = await seed(user_id, size)
+            counter.reset()
+            start = time.perf_counter()
+            details = await get_quiz_attempt_details(str(attempt_id), current_user=user)
+            elapsed = (time.perf_counter() - start) * 1000
+            assert len(details["questions"]) == size
+
+            queries = [name for name in counter.commands if name != "getMore"]
+            round_trips[size] = len(queries)
+            print(f"{size:>5} questions: {len(queries)} queries "
+                  f"({', '.join(queries)}), {counter.commands.count('getMore')} getMore, {elapsed:7.1f} ms")
+    finally:
+        await db.quizzes_collection.delete_many({"user_id": user_id})
+        attempts = await db.quiz_attempts_collection.find({"user_id": user_id}).to_list(length=None)
+        await db.questions_collection.delete_many({"quiz_id": {"$in": [a["quiz_id"] for a in attempts]}})
+        await db.quiz_attempts_collection.delete_many({"user_id": user_id})
+        await db.close()
+
+    if len(set(round_trips.values())) != 1:
+        print(f"✗ Query count depends on question count: {round_trips}")
+        return 1
+    print(f"✓ Constant query count: {next(iter(round_trips.values()))}")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[5, 25, 100])
+    sys.exit(asyncio.run(run(parser.parse_args().sizes)))
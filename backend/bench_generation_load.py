@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Load benchmark: /quiz/{id} latency while quiz generations are in flight.
+
+Starts the local fake OpenAI server, launches the API in a single uvicorn
+worker pointed at it, then measures GET /quiz/{id} latency twice: once on
+an idle server and once while N concurrent /generate-quiz requests are
+waiting on (slow) completions. With the async LLM client the p99 should
+stay flat; with a blocking client it grows to the completion latency.
+
+Requires a reachable MongoDB at MONGO_URI.
+
+Usage:
+    python bench_generation_load.py --generations 50 --latency 3
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+
+import httpx
+
+import fake_openai
+
+FAKE_PORT = 8765
+API_PORT = 8766
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def wait_for_api(client: httpx.AsyncClient):
+    for _ in range(100):
+        try:
+            await client.get("/docs")
+            return
+        except httpx.TransportError:
+            await asyncio.sleep(0.1)
+    raise RuntimeError("API server did not start")
+
+
+async def authenticate(client: httpx.AsyncClient) -> str:
+    username = f"bench_{uuid.uuid4().hex[:8]}"
+    password = "bench-password"
+    response = await client.post("/signup", json={
+        "username": username, "email": f"{username}@example.com", "password": password
+    })
+    response.raise_for_status()
+    response = await client.post("/token", data={"username": username, "password": password})
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+async def sample_quiz_latency(client, quiz_id, headers, duration):
+    latencies = []
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        response = await client.get(f"/quiz/{quiz_id}", headers=headers)
+        response.raise_for_status()
+        latencies.append((time.perf_counter() - start) * 1000)
+        await asyncio.sleep(0.01)
+    return latencies
+
+
+def report(label, latencies):
+    print(f"{label:<28} n={len(latencies):<5} "
+          f"p50={statistics.median(latencies):7.1f} ms  "
+          f"p99={percentile(latencies, 99):7.1f} ms  "
+          f"max={max(latencies):7.1f} ms")
+
+
+async def run(args):
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{API_PORT}", timeout=None) as client:
+        await wait_for_api(client)
+        headers = {"Authorization": f"Bearer {await authenticate(client)}"}
+
+        response = await client.post("/generate-quiz", headers=headers, json={
+            "subject": "Benchmarking", "num_questions": 5, "difficulty": "medium"
+        })
+        response.raise_for_status()
+        quiz_id = response.json()["quiz_id"]
+
+        idle = await sample_quiz_latency(client, quiz_id, headers, args.sample_seconds)
+
+        generations = [
+            asyncio.create_task(client.post("/generate-quiz", headers=headers, json={
+                "subject": f"Benchmarking {i}", "num_questions": 5, "difficulty": "medium"
+            }))
+            for i in range(args.generations)
+        ]
+        await asyncio.sleep(0.2)
+        loaded = await sample_quiz_latency(client, quiz_id, headers, args.sample_seconds)
+        results = await asyncio.gather(*generations)
+
+    failed = sum(1 for r in results if r.status_code != 200)
+    print(f"\n/quiz/{{id}} latency with {args.generations} generations in flight "
+          f"(fake LLM latency {args.latency}s, LLM_MAX_CONCURRENCY={os.environ['LLM_MAX_CONCURRENCY']})")
+    report("idle", idle)
+    report(f"{args.generations} generations in flight", loaded)
+    print(f"generations failed: {failed}/{args.generations}")
+
+    idle_p99 = percentile(idle, 99)
+    loaded_p99 = percentile(loaded, 99)
+    # "Flat" means the loaded p99 stays within a small multiple of idle p99 and
+    # well below the completion latency a blocked event loop would show.
+    budget = max(idle_p99 * args.max_ratio, idle_p99 + 50)
+    if loaded_p99 > budget:
+        print(f"✗ p99 regressed: {loaded_p99:.1f} ms > budget {budget:.1f} ms")
+        return 1
+    print(f"✓ p99 stayed flat ({loaded_p99:.1f} ms <= budget {budget:.1f} ms)")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--generations", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=3.0, help="fake completion latency in seconds")
+    parser.add_argument("--sample-seconds", type=float, default=2.0)
+    parser.add_argument("--max-ratio", type=float, default=3.0)
+    args = parser.parse_args()
+
+    fake_openai.start_in_thread(FAKE_PORT, latency=args.latency)
+
+    env = dict(os.environ)
+    env.setdefault("LLM_MAX_CONCURRENCY", str(args.generations))
+    env["OPENAI_BASE_URL"] = f"http://127.0.0.1:{FAKE_PORT}/v1"
+    env["OPENAI_API_KEY"] = "sk-fake-benchmark-key"
+    os.environ["LLM_MAX_CONCURRENCY"] = env["LLM_MAX_CONCURRENCY"]
+
+    api = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1",
+         "--port", str(API_PORT), "--workers", "1", "--log-level", "warning"],
+        env=env,
+    )
+    try:
+        return asyncio.run(run(args))
+    finally:
+        api.terminate()
+        api.wait()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Benchmark: MinHash LSH near-duplicate index build and query on one core.
+
+For each size, generates that many synthetic questions from templated
+wording and a large vocabulary (so unrelated questions still share phrases
+like "Which of the following"), with a share of them planted as edited
+copies of earlier ones: a changed word, dropped punctuation, different
+casing, reordered options. It then
+
+    builds    signature + band keys for every question, added to a
+              NearDuplicateIndex (questions/s, peak memory)
+    queries   planted duplicates (recall) and fresh questions (false
+              positives), timing each lookup including its signature
+
+The process is pinned to a single CPU where the platform allows it. No
+database is needed: the in-memory index does the same candidate lookup and
+verification that the `lsh_bands` index in MongoDB serves for stored
+questions. A million questions need about 2 GB of memory.
+
+Usage:
+    python bench_near_duplicates.py --sizes 10000 1000000 --queries 5000
+"""
+import argparse
+import os
+import random
+import resource
+import statistics
+import time
+
+import near_duplicates
+from config import config
+
+TEMPLATES = [
+    "Which of the following are true about {} {}?",
+    "What is the main purpose of {} in {}?",
+    "Which statement best describes the {} of {}?",
+    "In the context of {}, what does {} refer to?",
+    "Which of these is an example of {} {}?",
+    "Why is {} important for {}?",
+]
+SYLLABLES = ["ka", "lo", "mi", "ren", "tu", "vas", "po", "sel", "dri", "nu", "fen", "gor", "hal", "qui", "zet", "bra", "cor", "dex", "ul", "tam"]
+
+
+def make_vocabulary(rng: random.Random, size: int):
+    return ["".join(rng.choices(SYLLABLES, k=rng.randint(2, 4))) for _ in range(size)]
+
+
+def make_question(rng: random.Random, vocabulary):
+    template = rng.choice(TEMPLATES)
+    phrases = [" ".join(rng.choices(vocabulary, k=rng.randint(1, 3))) for _ in range(template.count("{}"))]
+    return {
+        "question": template.format(*phrases),
+        "options": [" ".join(rng.choices(vocabulary, k=rng.randint(1, 4))).capitalize() for _ in range(4)],
+    }
+
+
+def make_near_duplicate(rng: random.Random, question: dict, vocabulary):
+    """An edited copy: the kind of difference regenerated or chunked quizzes produce"""
+    words = question["question"].split()
+    edit = rng.randrange(4)
+    if edit == 0:
+        words[rng.randrange(len(words))] = rng.choice(vocabulary)
+    elif edit == 1:
+        words = [word.strip("?,.") for word in words]
+    elif edit == 2:
+        words = [word.upper() if rng.random() < 0.3 else word for word in words]
+    else:
+        words.insert(rng.randrange(len(words)), rng.choice(["the", "following", "really", "best"]))
+    options = list(question["options"])
+    rng.shuffle(options)
+    return {"question": " ".join(words), "options": options}
+
+
+def pin_to_one_core():
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, {min(os.sched_getaffinity(0))})
+        return True
+    return False
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def run(size: int, queries: int, duplicate_share: float, threshold: float, seed: int):
+    rng = random.Random(seed)
+    vocabulary = make_vocabulary(rng, 20000)
+    originals = []
+
+    index = near_duplicates.NearDuplicateIndex(threshold)
+    signing = adding = 0.0
+    for position in range(size):
+        if originals and rng.random() < duplicate_share:
+            question = make_near_duplicate(rng, rng.choice(originals), vocabulary)
+        else:
+            question = make_question(rng, vocabulary)
+            if len(originals) < 100000:
+                originals.append(question)
+        start = time.perf_counter()
+        sig = near_duplicates.signature(question)
+        keys = near_duplicates.band_keys(sig)
+        middle = time.perf_counter()
+        index.add(sig, position, keys)
+        signing += middle - start
+        adding += time.perf_counter() - middle
+    build = signing + adding
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    def timed_lookups(questions):
+        latencies, found = [], 0
+        for question in questions:
+            start = time.perf_counter()
+            match = index.query(near_duplicates.signature(question))
+            latencies.append(time.perf_counter() - start)
+            found += match is not None
+        return latencies, found
+
+    duplicates = [make_near_duplicate(rng, rng.choice(originals), vocabulary) for _ in range(queries)]
+    fresh = [make_question(rng, vocabulary) for _ in range(queries)]
+    duplicate_latencies, recalled = timed_lookups(duplicates)
+    fresh_latencies, false_positives = timed_lookups(fresh)
+    latencies = duplicate_latencies + fresh_latencies
+
+    print(f"\n{size:,} questions (threshold {threshold})")
+    print(f"  build    {build:8.1f} s  {size / build:10,.0f} questions/s  "
+          f"(signatures {signing / size * 1e6:.0f} us, index add {adding / size * 1e6:.1f} us each)")
+    print(f"  memory   {peak_mb:8.0f} MB peak RSS")
+    print(f"  query    p50 {percentile(latencies, 0.5) * 1e6:6.0f} us  p99 {percentile(latencies, 0.99) * 1e6:6.0f} us  "
+          f"mean {statistics.mean(latencies) * 1e6:6.0f} us")
+    print(f"  recall   {recalled / queries:8.1%} of {queries} edited copies found")
+    print(f"  false +  {false_positives / queries:8.2%} of {queries} fresh questions matched")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the near-duplicate question index")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 1000000])
+    parser.add_argument("--queries", type=int, default=5000)
+    parser.add_argument("--duplicate-share", type=float, default=0.05, help="Fraction of indexed questions that are edited copies")
+    parser.add_argument("--threshold", type=float, default=None)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    print("Pinned to one CPU" if pin_to_one_core() else "Could not pin to one CPU on this platform")
+    threshold = args.threshold if args.threshold is not None else config.QUESTION_DEDUP_THRESHOLD
+    for size in args.sizes:
+        run(size, args.queries, args.duplicate_share, threshold, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Benchmark: PDF text extraction on a synthetic large document.
+
+Writes a synthetic N-page PDF (one paragraph of text per page), then
+compares the old extraction (whole file in a BytesIO, `text +=` page by
+page) with ingest.extract_pdf_text, which reads the spooled file from disk
+across a process pool and joins the pages once.
+
+Usage:
+    python bench_pdf_extract.py --pages 500 --workers 4
+"""
+import argparse
+import asyncio
+import io
+import os
+import resource
+import sys
+import tempfile
+import time
+
+import PyPDF2
+
+LINE = "Photosynthesis converts light energy into chemical energy stored in glucose."
+
+
+def build_pdf(num_pages: int, lines_per_page: int = 40) -> bytes:
+    """Minimal valid PDF with a Helvetica text block on every page"""
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # page tree, filled in once page object numbers are known
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    page_refs = []
+    for page in range(num_pages):
+        text_ops = ["BT", "/F1 10 Tf", "12 TL", "40 800 Td"]
+        for line in range(lines_per_page):
+            text_ops.append(f"(Page {page + 1} line {line + 1}: {LINE}) Tj T*")
+        text_ops.append("ET")
+        stream = "\n".join(text_ops).encode()
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        content_ref = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_ref
+        )
+        page_refs.append(len(objects))
+    kids = " ".join(f"{ref} 0 R" for ref in page_refs).encode()
+    objects[1] = b"<< /Type /Pages /Kids [" + kids + b"] /Count %d >>" % num_pages
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+    xref_offset = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    for offset in offsets:
+        out.write(b"%010d 00000 n \n" % offset)
+    out.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref_offset))
+    return out.getvalue()
+
+
+def legacy_extract(pdf_content: bytes) -> str:
+    """The pre-ingest implementation, kept here for comparison"""
+    pdf_reader = PyPDF2.PdfReader(io.BytesIO(pdf_content))
+    text = ""
+    for page in pdf_reader.pages:
+        text += page.extract_text() + "\n"
+    return text
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    args = parser.parse_args()
+
+    os.environ["PDF_EXTRACT_WORKERS"] = str(args.workers)
+    os.environ.setdefault("PDF_MAX_PAGES", str(max(args.pages, 1000)))
+    import ingest
+
+    pdf_bytes = build_pdf(args.pages)
+    fd, path = tempfile.mkstemp(suffix=".pdf")
+    with os.fdopen(fd, "wb") as f:
+        f.write(pdf_bytes)
+    print(f"Synthetic PDF: {args.pages} pages, {len(pdf_bytes) / (1024 * 1024):.1f} MB")
+
+    try:
+        start = time.perf_counter()
+        legacy_text = legacy_extract(pdf_bytes)
+        legacy_seconds = time.perf_counter() - start
+        print(f"legacy (BytesIO, text +=):       {legacy_seconds:6.2f} s  "
+              f"{args.pages / legacy_seconds:7.1f} pages/s  peak RSS {peak_rss_mb():.0f} MB")
+
+        start = time.perf_counter()
+        text = asyncio.run(ingest.extract_pdf_text(path))
+        parallel_seconds = time.perf_counter() - start
+        print(f"ingest ({args.workers} workers, spooled file): {parallel_seconds:6.2f} s  "
+              f"{args.pages / parallel_seconds:7.1f} pages/s  speedup {legacy_seconds / parallel_seconds:.1f}x")
+
+        if len(text.split()) != len(legacy_text.split()):
+            print("✗ Extracted text differs from the legacy implementation")
+            return 1
+        print("✓ Same text extracted")
+        return 0
+    finally:
+        ingest.shutdown_pdf_executor()
+        os.unlink(path)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
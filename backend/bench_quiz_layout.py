@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Benchmark: split vs embedded question storage for quiz reads.
+
+For each size, seeds that many quizzes (10 questions each by default) in
+both layouts, side by side in separate collections:
+
+    split      bench_quizzes_split + bench_questions_split (quiz_id, order index)
+    embedded   bench_quizzes_embedded, questions stored in the quiz document
+
+then reads random quizzes the way db.find_quiz_with_questions does for each
+layout (find_one + sorted find in parallel, vs a single find_one) and
+reports read latency percentiles, seed throughput and storage size.
+
+Requires a reachable MongoDB at MONGO_URI. Data is written to the
+DATABASE_NAME database (defaults to quizzer_bench) and removed afterwards.
+Seeding a million quizzes takes a while and needs several GB of disk.
+
+Usage:
+    python bench_quiz_layout.py --sizes 10000 1000000 --reads 5000
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime
+
+os.environ.setdefault("DATABASE_NAME", "quizzer_bench")
+
+from bson import ObjectId
+from pymongo import AsyncMongoClient, ASCENDING
+
+from config import config
+
+SEED_BATCH = 1000
+
+
+def make_quiz(num_questions: int):
+    quiz_id = ObjectId()
+    quiz_doc = {
+        "_id": quiz_id,
+        "user_id": ObjectId(),
+        "title": "Benchmark quiz",
+        "source_file": "N/A",
+        "difficulty": "medium",
+        "num_questions": num_questions,
+        "created_at": datetime.utcnow()
+    }
+    question_docs = [{
+        "_id": ObjectId(),
+        "question_text": f"Question {i + 1} about a moderately long benchmark topic?",
+        "options": ["First option", "Second option", "Third option", "Fourth option"],
+        "correct_answers": ["A"],
+        "order": i + 1
+    } for i in range(num_questions)]
+    return quiz_doc, question_docs
+
+
+async def seed(database, size: int, num_questions: int):
+    split_quizzes = database["bench_quizzes_split"]
+    split_questions = database["bench_questions_split"]
+    embedded_quizzes = database["bench_quizzes_embedded"]
+    await split_questions.create_index([("quiz_id", ASCENDING), ("order", ASCENDING)])
+
+    timings = {"split": 0.0, "embedded": 0.0}
+    quiz_ids = []
+    for offset in range(0, size, SEED_BATCH):
+        batch = [make_quiz(num_questions) for _ in range(min(SEED_BATCH, size - offset))]
+        quiz_ids.extend(quiz_doc["_id"] for quiz_doc, _ in batch)
+
+        start = time.perf_counter()
+        await split_quizzes.insert_many([quiz_doc for quiz_doc, _ in batch], ordered=False)
+        await split_questions.insert_many([
+            {**question, "quiz_id": quiz_doc["_id"]}
+            for quiz_doc, question_docs in batch for question in question_docs
+        ], ordered=False)
+        timings["split"] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        await embedded_quizzes.insert_many([
+            {**quiz_doc, "questions": question_docs} for quiz_doc, question_docs in batch
+        ], ordered=False)
+        timings["embedded"] += time.perf_counter() - start
+
+        if (offset // SEED_BATCH) % 100 == 99:
+            print(f"  seeded {offset + len(batch)}/{size}")
+    return quiz_ids, timings
+
+
+async def read_split(database, quiz_id):
+    quiz_doc, question_docs = await asyncio.gather(
+        database["bench_quizzes_split"].find_one({"_id": quiz_id}),
+        database["bench_questions_split"].find({"quiz_id": quiz_id}).sort("order", 1).to_list(length=None)
+    )
+    return quiz_doc, question_docs
+
+
+async def read_embedded(database, quiz_id):
+    quiz_doc = await database["bench_quizzes_embedded"].find_one({"_id": quiz_id})
+    return quiz_doc, quiz_doc["questions"]
+
+
+async def measure(database, read, quiz_ids, reads: int, num_questions: int):
+    samples = []
+    for quiz_id in random.choices(quiz_ids, k=reads):
+        start = time.perf_counter()
+        _, question_docs = await read(database, quiz_id)
+        samples.append((time.perf_counter() - start) * 1000)
+        assert len(question_docs) == num_questions
+    samples.sort()
+    return {
+        "p50": statistics.median(samples),
+        "p99": samples[min(len(samples) - 1, int(len(samples) * 0.99))],
+        "mean": statistics.fmean(samples)
+    }
+
+
+async def storage_mb(database, *collections):
+    total = 0
+    for name in collections:
+        stats = await database.command("collStats", name)
+        total += stats.get("storageSize", 0) + stats.get("totalIndexSize", 0)
+    return total / (1024 * 1024)
+
+
+async def drop(database):
+    for name in ("bench_quizzes_split", "bench_questions_split", "bench_quizzes_embedded"):
+        await database.drop_collection(name)
+
+
+async def run(sizes, reads: int, num_questions: int):
+    client = AsyncMongoClient(config.MONGO_URI)
+    database = client[config.DATABASE_NAME]
+    try:
+        for size in sizes:
+            await drop(database)
+            print(f"\n{size} quizzes x {num_questions} questions")
+            quiz_ids, seed_timings = await seed(database, size, num_questions)
+
+            # Warm both layouts the same way before timing
+            for quiz_id in random.sample(quiz_ids, min(len(quiz_ids), 200)):
+                await read_split(database, quiz_id)
+                await read_embedded(database, quiz_id)
+
+            results = {
+                "split": await measure(database, read_split, quiz_ids, reads, num_questions),
+                "embedded": await measure(database, read_embedded, quiz_ids, reads, num_questions)
+            }
+            sizes_mb = {
+                "split": await storage_mb(database, "bench_quizzes_split", "bench_questions_split"),
+                "embedded": await storage_mb(database, "bench_quizzes_embedded")
+            }
+            for layout, stats in results.items():
+                print(f"  {layout:<9} read p50 {stats['p50']:6.2f} ms  p99 {stats['p99']:6.2f} ms  "
+                      f"mean {stats['mean']:6.2f} ms  |  seed {size / seed_timings[layout]:9.0f} quizzes/s  |  "
+                      f"storage {sizes_mb[layout]:8.1f} MB")
+            speedup = results["split"]["p50"] / results["embedded"]["p50"]
+            print(f"  embedded p50 speedup: {speedup:.2f}x")
+    finally:
+        await drop(database)
+        await client.close()
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 1000000])
+    parser.add_argument("--reads", type=int, default=5000)
+    parser.add_argument("--questions", type=int, default=10)
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args.sizes, args.reads, args.questions)))
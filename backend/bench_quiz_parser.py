@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Benchmark: quiz completion parsing.
+
+Compares the old Markdown line scanner (kept here for comparison) with
+quiz_schema.parse_quiz_json and the streaming scanner used by
+/generate-quiz/stream, over a corpus of completions. Besides throughput it
+reports how many parsed questions are actually usable (at least one correct
+answer, every answer naming an option); the old parser happily returns
+questions with no answers or options past D.
+
+Corpus sources, in order of preference:
+    --corpus FILE         JSONL, one completion per line (a JSON string or {"text": ...})
+    --export-corpus FILE  first dump the completions recorded in the generation_cache
+                          collection to FILE, then benchmark them
+    (neither)             a synthetic corpus rendered in both formats, with a share
+                          of malformed items
+
+Usage:
+    python bench_quiz_parser.py --completions 2000 --malformed 0.1
+"""
+import argparse
+import json
+import random
+import re
+import sys
+import time
+
+import quiz_schema
+
+
+def legacy_parse_quiz_response(quiz_text: str) -> list:
+    """The pre-JSON Markdown parser"""
+    questions = []
+    current_question = None
+    current_options = []
+    current_correct_answers = None
+
+    for line in quiz_text.split('\n'):
+        line = line.strip()
+        if not line:
+            continue
+
+        if line[0].isdigit() and '. ' in line:
+            if current_question:
+                questions.append({
+                    'question': current_question,
+                    'options': current_options,
+                    'correct_answers': current_correct_answers
+                })
+            current_question = line.split('. ', 1)[1]
+            current_options = []
+            current_correct_answers = None
+        elif line.startswith(('A.', 'B.', 'C.', 'D.')):
+            option_text = line.split('. ', 1)[1]
+            current_options.append(option_text)
+        elif line.startswith('**Correct Answers:'):
+            match = re.search(r'\b[A-D](?:, [A-D])*\b', line)
+            if match:
+                answers_str = match.group(0)
+                current_correct_answers = [ans.strip() for ans in answers_str.split(',')]
+            else:
+                current_correct_answers = []
+
+    if current_question:
+        questions.append({
+            'question': current_question,
+            'options': current_options,
+            'correct_answers': current_correct_answers
+        })
+
+    return questions
+
+
+def is_usable(question: dict) -> bool:
+    answers = question.get("correct_answers")
+    options = question.get("options") or []
+    return bool(answers) and len(options) >= 2 and all(
+        len(answer) == 1 and 0 <= ord(answer) - 65 < len(options) for answer in answers
+    )
+
+
+def synthetic_quiz(rng: random.Random, malformed: float) -> list:
+    questions = []
+    for i in range(rng.randint(5, 20)):
+        num_options = rng.choice([4, 4, 4, 5, 6])
+        options = [f"Option {chr(65 + j)} for question {i + 1}, with some explanatory text" for j in range(num_options)]
+        answers = sorted(rng.sample([chr(65 + j) for j in range(num_options)], rng.randint(1, 2)))
+        question = {"question": f"Synthetic question {i + 1} about topic {rng.randint(1, 10 ** 6)}?", "options": options, "correct_answers": answers}
+        if rng.random() < malformed:
+            question["correct_answers"] = []
+        questions.append(question)
+    return questions
+
+
+def render_markdown(questions: list) -> str:
+    blocks = []
+    for i, question in enumerate(questions):
+        lines = [f"{i + 1}. {question['question']}"]
+        lines += [f"{chr(65 + j)}. {option}" for j, option in enumerate(question["options"])]
+        lines.append(f"**Correct Answers:** {', '.join(question['correct_answers'])}")
+        blocks.append("\n".join(lines))
+    return "\n\n".join(blocks)
+
+
+def render_json(questions: list) -> str:
+    return json.dumps({"questions": questions}, indent=2)
+
+
+def load_corpus(path: str) -> list:
+    texts = []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                texts.append(entry["text"] if isinstance(entry, dict) else entry)
+    return texts
+
+
+def export_corpus(path: str) -> int:
+    from pymongo import MongoClient
+    from config import config
+
+    client = MongoClient(config.MONGO_URI)
+    count = 0
+    with open(path, "w") as f:
+        for doc in client[config.DATABASE_NAME]["generation_cache"].find({}, {"quiz_text": 1}):
+            f.write(json.dumps({"text": doc["quiz_text"]}) + "\n")
+            count += 1
+    client.close()
+    return count
+
+
+def parse_json_safely(text: str) -> list:
+    try:
+        return quiz_schema.parse_quiz_json(text).questions
+    except quiz_schema.QuizFormatError:
+        return []
+
+
+def parse_streamed(text: str, delta_size: int = 16) -> list:
+    scanner = quiz_schema.StreamingQuestionScanner()
+    questions = []
+    for start in range(0, len(text), delta_size):
+        for item in scanner.feed(text[start:start + delta_size]):
+            question = quiz_schema.validate_question(item)
+            if question is not None:
+                questions.append(question)
+    return questions
+
+
+def run(name: str, parse, texts: list, repeat: int):
+    parsed = []
+    start = time.perf_counter()
+    for _ in range(repeat):
+        parsed = [parse(text) for text in texts]
+    seconds = (time.perf_counter() - start) / repeat
+    total = sum(len(questions) for questions in parsed)
+    usable = sum(is_usable(question) for questions in parsed for question in questions)
+    per_question = seconds / max(total, 1) * 1e6
+    print(f"{name:<28} {len(texts) / seconds:9.0f} completions/s  {per_question:6.1f} us/question  "
+          f"{total:6d} parsed  {usable:6d} usable")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus")
+    parser.add_argument("--export-corpus")
+    parser.add_argument("--completions", type=int, default=2000)
+    parser.add_argument("--malformed", type=float, default=0.1, help="Share of synthetic items with no correct answer")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    if args.export_corpus:
+        print(f"Exported {export_corpus(args.export_corpus)} recorded completions to {args.export_corpus}")
+        args.corpus = args.export_corpus
+
+    if args.corpus:
+        texts = load_corpus(args.corpus)
+        json_texts = [text for text in texts if text.lstrip().startswith(("{", "```"))]
+        markdown_texts = [text for text in texts if text not in json_texts]
+        print(f"Recorded corpus: {len(json_texts)} JSON and {len(markdown_texts)} Markdown completions")
+    else:
+        rng = random.Random(args.seed)
+        quizzes = [synthetic_quiz(rng, args.malformed) for _ in range(args.completions)]
+        markdown_texts = [render_markdown(questions) for questions in quizzes]
+        json_texts = [render_json(questions) for questions in quizzes]
+        expected = sum(len(questions) for questions in quizzes)
+        usable = sum(is_usable(question) for questions in quizzes for question in questions)
+        print(f"Synthetic corpus: {len(quizzes)} completions, {expected} questions, {usable} well-formed")
+
+    if markdown_texts:
+        run("legacy Markdown scanner", legacy_parse_quiz_response, markdown_texts, args.repeat)
+    if json_texts:
+        run("parse_quiz_json", parse_json_safely, json_texts, args.repeat)
+        run("streaming scanner", parse_streamed, json_texts, args.repeat)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,4 +1,5 @@
 import os
+import time
 from typing import Optional
 
 # Environment Configuration
@@ -11,9 +12,100 @@ class Config:
     # Database
     MONGO_URI: str = os.getenv("MONGO_URI", "mongodb://localhost:27017/")
     DATABASE_NAME: str = os.getenv("DATABASE_NAME", "quizzer_db")
+    MONGO_MAX_POOL_SIZE: int = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+    MONGO_MIN_POOL_SIZE: int = int(os.getenv("MONGO_MIN_POOL_SIZE", "5"))
+    MONGO_MAX_IDLE_TIME_MS: int = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "60000"))
+    MONGO_WAIT_QUEUE_TIMEOUT_MS: int = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "10000"))
+    MONGO_SERVER_SELECTION_TIMEOUT_MS: int = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+    # Multi-document transactions need a replica set or sharded cluster
+    MONGO_USE_TRANSACTIONS: bool = os.getenv("MONGO_USE_TRANSACTIONS", "false").lower() == "true"
+    # Store new quizzes with their questions embedded (see db.py and migrate_embed_questions.py)
+    QUIZ_EMBED_QUESTIONS: bool = os.getenv("QUIZ_EMBED_QUESTIONS", "false").lower() == "true"
     
     # OpenAI - Will be loaded from database or environment
     OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY", "")
+    OPENAI_BASE_URL: Optional[str] = os.getenv("OPENAI_BASE_URL") or None
+    OPENAI_MODEL: str = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
+    # Key rotation without restarts (see api_keys.py)
+    API_KEY_CACHE_TTL_SECONDS: float = float(os.getenv("API_KEY_CACHE_TTL_SECONDS", "60"))
+    API_KEY_REFRESH_RETRY_SECONDS: float = float(os.getenv("API_KEY_REFRESH_RETRY_SECONDS", "5"))
+    API_KEY_WATCH_CHANGES: bool = os.getenv("API_KEY_WATCH_CHANGES", "false").lower() == "true"
+    API_KEY_DEFAULT_RPM: int = int(os.getenv("API_KEY_DEFAULT_RPM", "0"))
+    API_KEY_USAGE_FLUSH_SECONDS: float = float(os.getenv("API_KEY_USAGE_FLUSH_SECONDS", "30"))
+    
+    # Largest page a paginated endpoint will return
+    MAX_PAGE_SIZE: int = int(os.getenv("MAX_PAGE_SIZE", "100"))
+    # Filtered catalog totals stop counting here and are reported as estimates
+    COUNT_ESTIMATE_CAP: int = int(os.getenv("COUNT_ESTIMATE_CAP", "10000"))
+    
+    # Password hashing
+    BCRYPT_ROUNDS: int = int(os.getenv("BCRYPT_ROUNDS", "12"))
+    PASSWORD_HASH_POOL: str = os.getenv("PASSWORD_HASH_POOL", "thread")  # "thread" or "process"
+    PASSWORD_HASH_WORKERS: int = int(os.getenv("PASSWORD_HASH_WORKERS", "4"))
+    PASSWORD_HASH_QUEUE_LIMIT: int = int(os.getenv("PASSWORD_HASH_QUEUE_LIMIT", "32"))
+    PASSWORD_HASH_RETRY_AFTER_SECONDS: int = int(os.getenv("PASSWORD_HASH_RETRY_AFTER_SECONDS", "2"))
+    PASSWORD_REHASH_ON_LOGIN: bool = os.getenv("PASSWORD_REHASH_ON_LOGIN", "true").lower() == "true"
+    
+    # Authenticated-user cache (per worker process)
+    USER_CACHE_MAX_SIZE: int = int(os.getenv("USER_CACHE_MAX_SIZE", "10000"))
+    USER_CACHE_TTL_SECONDS: float = float(os.getenv("USER_CACHE_TTL_SECONDS", "60"))
+
+    # Hot quiz cache for GET /quiz/{quiz_id} (per worker process)
+    QUIZ_CACHE_MAX_BYTES: int = int(os.getenv("QUIZ_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+    QUIZ_CACHE_MAX_ENTRIES: int = int(os.getenv("QUIZ_CACHE_MAX_ENTRIES", "2000"))
+    QUIZ_CACHE_TTL_SECONDS: float = float(os.getenv("QUIZ_CACHE_TTL_SECONDS", "300"))
+    
+    # Generation cache (shared through MongoDB)
+    GENERATION_CACHE_ENABLED: bool = os.getenv("GENERATION_CACHE_ENABLED", "true").lower() == "true"
+    GENERATION_CACHE_TTL_SECONDS: int = int(os.getenv("GENERATION_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+    GENERATION_CACHE_MAX_ENTRIES: int = int(os.getenv("GENERATION_CACHE_MAX_ENTRIES", "50000"))
+    
+    # Upload ingestion
+    UPLOAD_MAX_BYTES: int = int(os.getenv("UPLOAD_MAX_BYTES", str(50 * 1024 * 1024)))
+    PDF_MAX_PAGES: int = int(os.getenv("PDF_MAX_PAGES", "1000"))
+    PDF_EXTRACT_WORKERS: int = int(os.getenv("PDF_EXTRACT_WORKERS", str(os.cpu_count() or 2)))
+    PDF_PARALLEL_MIN_PAGES: int = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "32"))
+    
+    # LLM client limits
+    LLM_MAX_CONCURRENCY: int = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+    LLM_TIMEOUT_SECONDS: float = float(os.getenv("LLM_TIMEOUT_SECONDS", "120"))
+    LLM_MAX_RETRIES: int = int(os.getenv("LLM_MAX_RETRIES", "2"))
+    # Rate-limit handling across keys (see llm_dispatcher.py)
+    LLM_RATE_LIMIT_RETRIES: int = int(os.getenv("LLM_RATE_LIMIT_RETRIES", "5"))
+    LLM_BACKOFF_BASE_SECONDS: float = float(os.getenv("LLM_BACKOFF_BASE_SECONDS", "1"))
+    LLM_BACKOFF_MAX_SECONDS: float = float(os.getenv("LLM_BACKOFF_MAX_SECONDS", "30"))
+    LLM_COMPLETION_TOKENS_ESTIMATE: int = int(os.getenv("LLM_COMPLETION_TOKENS_ESTIMATE", "1500"))
+    
+    # Documents above this many (estimated) tokens are generated chunk by chunk
+    GENERATION_CHUNK_TOKENS: int = int(os.getenv("GENERATION_CHUNK_TOKENS", "3000"))
+    GENERATION_CHUNK_CONCURRENCY: int = int(os.getenv("GENERATION_CHUNK_CONCURRENCY", "4"))
+    GENERATION_REPAIR_ATTEMPTS: int = int(os.getenv("GENERATION_REPAIR_ATTEMPTS", "2"))
+
+    # Question bank for subject quizzes (question_bank.py, bank_refill.py)
+    QUESTION_BANK_ENABLED: bool = os.getenv("QUESTION_BANK_ENABLED", "true").lower() == "true"
+    QUESTION_BANK_SUBJECTS: list = [s.strip() for s in os.getenv("QUESTION_BANK_SUBJECTS", "").split(",") if s.strip()]
+    QUESTION_BANK_DIFFICULTIES: list = [d.strip() for d in os.getenv("QUESTION_BANK_DIFFICULTIES", "easy,medium,hard").split(",") if d.strip()]
+    QUESTION_BANK_TARGET: int = int(os.getenv("QUESTION_BANK_TARGET", "300"))
+    QUESTION_BANK_BATCH_SIZE: int = int(os.getenv("QUESTION_BANK_BATCH_SIZE", "10"))
+    QUESTION_BANK_POPULAR_DAYS: int = int(os.getenv("QUESTION_BANK_POPULAR_DAYS", "7"))
+    QUESTION_BANK_POPULAR_MIN_QUIZZES: int = int(os.getenv("QUESTION_BANK_POPULAR_MIN_QUIZZES", "20"))
+    QUESTION_BANK_POPULAR_LIMIT: int = int(os.getenv("QUESTION_BANK_POPULAR_LIMIT", "50"))
+    QUESTION_BANK_REFILL_SECONDS: float = float(os.getenv("QUESTION_BANK_REFILL_SECONDS", "300"))
+    QUESTION_BANK_INPROCESS_REFILL: bool = os.getenv("QUESTION_BANK_INPROCESS_REFILL", "false").lower() == "true"
+
+    # Near-duplicate questions (near_duplicates.py)
+    QUESTION_DEDUP_THRESHOLD: float = float(os.getenv("QUESTION_DEDUP_THRESHOLD", "0.75"))
+    QUESTION_DEDUP_STORAGE: bool = os.getenv("QUESTION_DEDUP_STORAGE", "false").lower() == "true"
+
+    # Background generation jobs (POST /generate-quiz?mode=job, worker.py)
+    JOB_LEASE_SECONDS: int = int(os.getenv("JOB_LEASE_SECONDS", "60"))
+    JOB_HEARTBEAT_SECONDS: int = int(os.getenv("JOB_HEARTBEAT_SECONDS", "15"))
+    JOB_MAX_ATTEMPTS: int = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+    JOB_RETRY_BACKOFF_SECONDS: int = int(os.getenv("JOB_RETRY_BACKOFF_SECONDS", "10"))
+    JOB_POLL_SECONDS: float = float(os.getenv("JOB_POLL_SECONDS", "1"))
+    JOB_EVENTS_POLL_SECONDS: float = float(os.getenv("JOB_EVENTS_POLL_SECONDS", "1"))
+    JOB_WORKER_CONCURRENCY: int = int(os.getenv("JOB_WORKER_CONCURRENCY", "4"))
+    JOB_INPROCESS_WORKERS: int = int(os.getenv("JOB_INPROCESS_WORKERS", "0"))
     
     # CORS
     ALLOWED_ORIGINS: list = os.getenv("ALLOWED_ORIGINS", "*").split(",")
@@ -22,36 +114,45 @@ class Config:
     HOST: str = os.getenv("HOST", "0.0.0.0")
     PORT: int = int(os.getenv("PORT", "8000"))
     
+    _key_client = None
+    _cached_key: Optional[str] = None
+    _cached_key_expires_at: float = 0.0
+
     def get_openai_api_key(self) -> str:
-        """Get OpenAI API key from database or environment"""
-        # First try environment variable
+        """
+        Get the OpenAI API key from the environment or the database.
+
+        For synchronous scripts; the application itself gets keys from
+        api_keys.key_provider. Database lookups reuse one client and are
+        cached for API_KEY_CACHE_TTL_SECONDS.
+        """
+        # First try environment variable (the first key when several are listed)
         if self.OPENAI_API_KEY:
-            return self.OPENAI_API_KEY
+            return self.OPENAI_API_KEY.split(",")[0].strip()
+        
+        if Config._cached_key is not None and time.monotonic() < Config._cached_key_expires_at:
+            return Config._cached_key
         
         # If not in environment, try to get from database
+        api_key = ""
         try:
-            from pymongo import MongoClient
-            client = MongoClient(self.MONGO_URI)
-            database = client[self.DATABASE_NAME]
-            
-            if "api_keys" in database.list_collection_names():
-                api_keys_collection = database["api_keys"]
-                # Look for an active OpenAI API key
-                api_key_doc = api_keys_collection.find_one({
-                    "is_active": True,
-                    "api_key": {"$regex": "^sk-proj-"}
-                })
-                
-                if api_key_doc:
-                    client.close()
-                    return api_key_doc["api_key"]
-            
-            client.close()
+            if Config._key_client is None:
+                from pymongo import MongoClient
+                Config._key_client = MongoClient(self.MONGO_URI, serverSelectionTimeoutMS=self.MONGO_SERVER_SELECTION_TIMEOUT_MS)
+            # Look for an active OpenAI API key
+            api_key_doc = Config._key_client[self.DATABASE_NAME]["api_keys"].find_one(
+                {"is_active": True, "api_key": {"$regex": "^sk-proj-"}},
+                {"api_key": 1}
+            )
+            if api_key_doc:
+                api_key = api_key_doc["api_key"]
         except Exception:
-            pass
+            # Return empty string if no key found; retry on the next call
+            return ""
         
-        # Return empty string if no key found
-        return ""
+        Config._cached_key = api_key
+        Config._cached_key_expires_at = time.monotonic() + self.API_KEY_CACHE_TTL_SECONDS
+        return api_key
 
 # Production Configuration
 class ProductionConfig(Config):
@@ -0,0 +1,821 @@
+"""
+Async MongoDB data layer.
+
+A single AsyncMongoClient with an explicitly sized connection pool is shared
+by the whole process. Endpoints never touch collections directly; they call
+the repository functions below, grouped per collection.
+
+Questions are stored in one of two layouts. By default they live in the
+`questions` collection keyed by quiz_id and order. With QUIZ_EMBED_QUESTIONS
+new quizzes carry them in a `questions` array on the quiz document, so a quiz
+and its questions are one read and one atomic write. Reads accept either
+layout per quiz, so data can be migrated (migrate_embed_questions.py) while
+the application is running.
+
+Question documents carry a near-duplicate signature (`minhash`, `lsh_bands`;
+see near_duplicates.py). With QUESTION_DEDUP_STORAGE a question in the
+`questions` collection that nearly duplicates a stored one is written as a
+reference (`duplicate_of`) without its own content, and reads fill the
+content in from the referenced question.
+"""
+import asyncio
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from bson import ObjectId
+from gridfs import AsyncGridFSBucket
+from pymongo import AsyncMongoClient, ASCENDING, DESCENDING, ReturnDocument, UpdateMany, UpdateOne
+
+from config import config
+import user_stats
+
+client = AsyncMongoClient(
+    config.MONGO_URI,
+    maxPoolSize=config.MONGO_MAX_POOL_SIZE,
+    minPoolSize=config.MONGO_MIN_POOL_SIZE,
+    maxIdleTimeMS=config.MONGO_MAX_IDLE_TIME_MS,
+    waitQueueTimeoutMS=config.MONGO_WAIT_QUEUE_TIMEOUT_MS,
+    serverSelectionTimeoutMS=config.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+)
+database = client[config.DATABASE_NAME]
+
+users_collection = database["users"]
+quizzes_collection = database["quizzes"]
+questions_collection = database["questions"]
+quiz_attempts_collection = database["quiz_attempts"]
+user_answers_collection = database["user_answers"]
+api_keys_collection = database["api_keys"]
+generation_cache_collection = database["generation_cache"]
+generation_jobs_collection = database["generation_jobs"]
+question_bank_collection = database["question_bank"]
+user_stats_collection = database["user_stats"]
+job_uploads_bucket = AsyncGridFSBucket(database, bucket_name="job_uploads")
+
+
+async def close():
+    """Close the shared client (called on application shutdown)"""
+    await client.close()
+
+
+# Users
+
+async def find_user_by_username(username: str) -> Optional[dict]:
+    return await users_collection.find_one({"username": username})
+
+
+async def find_user_by_email(email: str) -> Optional[dict]:
+    return await users_collection.find_one({"email": email})
+
+
+async def find_user_by_id(user_id: ObjectId) -> Optional[dict]:
+    return await users_collection.find_one({"_id": user_id})
+
+
+async def insert_user(user_doc: dict) -> ObjectId:
+    result = await users_collection.insert_one(user_doc)
+    return result.inserted_id
+
+
+async def update_user(user_id: ObjectId, fields: dict):
+    await users_collection.update_one({"_id": user_id}, {"$set": fields})
+
+
+# Quizzes
+
+async def find_quiz(quiz_id: ObjectId) -> Optional[dict]:
+    """Quiz metadata only; embedded questions are left out"""
+    return await quizzes_collection.find_one({"_id": quiz_id}, {"questions": 0})
+
+
+# Signatures are only read by near-duplicate lookups
+SIGNATURE_PROJECTION = {"minhash": 0, "lsh_bands": 0}
+EMBEDDED_SIGNATURE_PROJECTION = {"questions.minhash": 0, "questions.lsh_bands": 0}
+QUESTION_CONTENT_FIELDS = ("question_text", "options", "correct_answers")
+REFERENCE_FIELDS = ("_id", "quiz_id", "order", "duplicate_of")
+
+
+def stored_question(question_doc: dict) -> dict:
+    """A question as written to the questions collection: references keep no content or signature"""
+    if "duplicate_of" in question_doc:
+        return {key: question_doc[key] for key in REFERENCE_FIELDS}
+    return question_doc
+
+
+def embed_question(question_doc: dict) -> dict:
+    """A question as stored inside its quiz: the quiz_id is implied"""
+    return {key: value for key, value in question_doc.items() if key != "quiz_id"}
+
+
+def _unembed_questions(quiz_doc: dict) -> List[dict]:
+    questions = quiz_doc.pop("questions")
+    return [{**question, "quiz_id": quiz_doc["_id"]} for question in sorted(questions, key=lambda q: q["order"])]
+
+
+async def find_quiz_with_questions(quiz_id: ObjectId) -> Tuple[Optional[dict], List[dict]]:
+    """
+    A quiz and its questions in order, whichever layout the quiz is stored in.
+    Question documents come back in the collection layout (with quiz_id).
+    """
+    if config.QUIZ_EMBED_QUESTIONS:
+        # Expect the embedded layout: one read, plus a fallback for quizzes
+        # that have not been migrated yet
+        quiz_doc = await quizzes_collection.find_one({"_id": quiz_id}, EMBEDDED_SIGNATURE_PROJECTION)
+        if not quiz_doc:
+            return None, []
+        if "questions" in quiz_doc:
+            return quiz_doc, _unembed_questions(quiz_doc)
+        return quiz_doc, await find_questions_for_quiz(quiz_id)
+
+    quiz_doc, question_docs = await asyncio.gather(
+        quizzes_collection.find_one({"_id": quiz_id}, EMBEDDED_SIGNATURE_PROJECTION),
+        find_questions_for_quiz(quiz_id)
+    )
+    if quiz_doc and "questions" in quiz_doc:
+        question_docs = _unembed_questions(quiz_doc)
+    return quiz_doc, question_docs
+
+
+async def insert_quiz_with_questions(quiz_doc: dict, question_docs: List[dict]):
+    """
+    Persist a quiz and all of its questions as one unit.
+
+    Documents must already carry their `_id`. In the embedded layout this is a
+    single insert. Otherwise, with MONGO_USE_TRANSACTIONS the writes commit
+    atomically (requires a replica set); without it questions are written
+    first with a single insert_many and removed again if the quiz insert
+    fails, so a quiz is never visible without its questions.
+    """
+    if config.QUIZ_EMBED_QUESTIONS:
+        await quizzes_collection.insert_one({**quiz_doc, "questions": [embed_question(q) for q in question_docs]})
+        return
+
+    if config.MONGO_USE_TRANSACTIONS:
+        async def write(session):
+            if question_docs:
+                await questions_collection.insert_many([stored_question(q) for q in question_docs], session=session)
+            await quizzes_collection.insert_one(quiz_doc, session=session)
+
+        async with client.start_session() as session:
+            await session.with_transaction(write)
+        return
+
+    try:
+        if question_docs:
+            await questions_collection.insert_many([stored_question(q) for q in question_docs])
+        await quizzes_collection.insert_one(quiz_doc)
+    except Exception:
+        await questions_collection.delete_many({"quiz_id": quiz_doc["_id"]})
+        raise
+
+
+async def insert_quiz(quiz_doc: dict):
+    """Insert a quiz on its own; used by streamed generation, which adds questions one by one"""
+    if config.QUIZ_EMBED_QUESTIONS:
+        quiz_doc = {**quiz_doc, "questions": []}
+    await quizzes_collection.insert_one(quiz_doc)
+
+
+async def update_quiz(quiz_id: ObjectId, fields: dict):
+    await quizzes_collection.update_one({"_id": quiz_id}, {"$set": fields})
+
+
+async def delete_quiz_with_questions(quiz_id: ObjectId):
+    await _hand_over_shared_questions(quiz_id)
+    await questions_collection.delete_many({"quiz_id": quiz_id})
+    await quizzes_collection.delete_one({"_id": quiz_id})
+
+
+async def delete_quiz_cascade(quiz_id: ObjectId) -> int:
+    """
+    Delete a quiz with its questions, attempts and the attempts' answers,
+    taking the attempts out of their users' stats.
+
+    Dependents go first so an interrupted delete leaves the quiz visible and
+    the delete can simply be retried. Returns the number of quizzes deleted.
+    """
+    async def delete(session=None):
+        attempts = await quiz_attempts_collection.find({"quiz_id": quiz_id}, ATTEMPT_STATS_PROJECTION, session=session).to_list(length=None)
+        if attempts:
+            attempt_ids = [attempt["_id"] for attempt in attempts]
+            await user_answers_collection.delete_many({"quiz_attempt_id": {"$in": attempt_ids}}, session=session)
+            await quiz_attempts_collection.delete_many({"_id": {"$in": attempt_ids}}, session=session)
+            await _uncount_attempts(attempts, session=session)
+        await _hand_over_shared_questions(quiz_id, session=session)
+        await questions_collection.delete_many({"quiz_id": quiz_id}, session=session)
+        result = await quizzes_collection.delete_one({"_id": quiz_id}, session=session)
+        return result.deleted_count
+
+    if config.MONGO_USE_TRANSACTIONS:
+        async with client.start_session() as session:
+            return await session.with_transaction(delete)
+    return await delete()
+
+
+QUIZ_SUMMARY_PROJECTION = {
+    "title": 1,
+    "difficulty": 1,
+    "num_questions": 1,
+    "created_at": 1,
+    "user_id": 1
+}
+
+
+async def find_quizzes_by_user(user_id: ObjectId) -> List[dict]:
+    cursor = quizzes_collection.find({"user_id": user_id}, QUIZ_SUMMARY_PROJECTION).sort("created_at", DESCENDING)
+    return await cursor.to_list(length=None)
+
+
+async def count_quizzes_by_user(user_id: ObjectId) -> int:
+    return await quizzes_collection.count_documents({"user_id": user_id})
+
+
+async def find_quizzes_page(query: dict, after: dict, limit: int) -> List[dict]:
+    """One page of the quiz catalog, newest first, summary fields only"""
+    cursor = (
+        quizzes_collection.find({**query, **after}, QUIZ_SUMMARY_PROJECTION)
+        .sort([("created_at", DESCENDING), ("_id", DESCENDING)])
+        .limit(limit)
+    )
+    return await cursor.to_list(length=None)
+
+
+async def estimate_quiz_count(query: dict) -> int:
+    """
+    Cheap total for the catalog: collection metadata when unfiltered,
+    otherwise an index count capped at COUNT_ESTIMATE_CAP.
+    """
+    if not query:
+        return await quizzes_collection.estimated_document_count()
+    return await quizzes_collection.count_documents(query, limit=config.COUNT_ESTIMATE_CAP)
+
+
+# Questions
+
+async def find_questions_for_quiz(quiz_id: ObjectId) -> List[dict]:
+    cursor = questions_collection.find({"quiz_id": quiz_id}, SIGNATURE_PROJECTION).sort("order", ASCENDING)
+    return await _resolve_references(await cursor.to_list(length=None))
+
+
+async def _resolve_references(question_docs: List[dict]) -> List[dict]:
+    """Fill in the content of questions stored as references to a shared question"""
+    shared_ids = list({doc["duplicate_of"] for doc in question_docs if "duplicate_of" in doc})
+    if not shared_ids:
+        return question_docs
+    cursor = questions_collection.find({"_id": {"$in": shared_ids}}, dict.fromkeys(QUESTION_CONTENT_FIELDS, 1))
+    shared = {doc["_id"]: doc async for doc in cursor}
+    for doc in question_docs:
+        if "duplicate_of" in doc and doc["duplicate_of"] in shared:
+            doc.update({field: shared[doc["duplicate_of"]][field] for field in QUESTION_CONTENT_FIELDS})
+    return question_docs
+
+
+async def find_near_duplicate_candidates(band_keys: List[int], exclude_quiz_id: ObjectId, limit: int = 1000) -> List[dict]:
+    """Stored questions sharing an LSH band key with `band_keys`, outside the given quiz"""
+    cursor = questions_collection.find(
+        {"lsh_bands": {"$in": band_keys}, "quiz_id": {"$ne": exclude_quiz_id}},
+        {"minhash": 1, "lsh_bands": 1, **dict.fromkeys(QUESTION_CONTENT_FIELDS, 1)}
+    ).limit(limit)
+    return await cursor.to_list(length=None)
+
+
+async def _hand_over_shared_questions(quiz_id: ObjectId, session=None):
+    """
+    Before a quiz's questions are deleted, move the content of any that other
+    questions refer to onto the oldest of those references, and point the
+    remaining references at it, so no reference is left dangling.
+    """
+    question_ids = await questions_collection.distinct("_id", {"quiz_id": quiz_id}, session=session)
+    if not question_ids:
+        return
+    referrers = await (
+        questions_collection.find({"duplicate_of": {"$in": question_ids}, "quiz_id": {"$ne": quiz_id}}, {"duplicate_of": 1}, session=session)
+        .sort("_id", ASCENDING)
+        .to_list(length=None)
+    )
+    if not referrers:
+        return
+    heirs = {}
+    for referrer in referrers:
+        heirs.setdefault(referrer["duplicate_of"], referrer["_id"])
+    writes = []
+    cursor = questions_collection.find(
+        {"_id": {"$in": list(heirs)}},
+        {"minhash": 1, "lsh_bands": 1, **dict.fromkeys(QUESTION_CONTENT_FIELDS, 1)},
+        session=session
+    )
+    async for shared in cursor:
+        heir = heirs[shared["_id"]]
+        content = {field: value for field, value in shared.items() if field != "_id"}
+        writes.append(UpdateOne({"_id": heir}, {"$set": content, "$unset": {"duplicate_of": ""}}))
+        writes.append(UpdateMany({"duplicate_of": shared["_id"], "_id": {"$ne": heir}}, {"$set": {"duplicate_of": heir}}))
+    if writes:
+        await questions_collection.bulk_write(writes, session=session)
+
+
+async def insert_questions(question_docs: List[dict]):
+    """Add questions to an existing quiz (all `question_docs` share one quiz_id)"""
+    if not question_docs:
+        return
+    if config.QUIZ_EMBED_QUESTIONS:
+        await quizzes_collection.update_one(
+            {"_id": question_docs[0]["quiz_id"]},
+            {"$push": {"questions": {"$each": [embed_question(q) for q in question_docs]}}}
+        )
+        return
+    await questions_collection.insert_many([stored_question(q) for q in question_docs])
+
+
+# Quiz attempts
+
+async def find_attempt(attempt_id: ObjectId) -> Optional[dict]:
+    return await quiz_attempts_collection.find_one({"_id": attempt_id})
+
+
+async def find_history_page(user_id: ObjectId, after: dict, limit: Optional[int]) -> List[dict]:
+    """
+    One page of a user's attempts, newest first, joined with quiz title and
+    difficulty in the same aggregation.
+
+    `after` is a keyset filter from pagination.keyset_filter. Pass
+    `limit + 1` to detect whether another page exists. Attempts whose quiz
+    was deleted are returned with `quiz` set to None so page boundaries stay
+    stable; callers skip them.
+    """
+    pipeline = [
+        {"$match": {"user_id": user_id, **after}},
+        {"$sort": {"completed_at": DESCENDING, "_id": DESCENDING}},
+    ]
+    if limit:
+        pipeline.append({"$limit": limit})
+    pipeline += [
+        {"$lookup": {
+            "from": "quizzes",
+            "localField": "quiz_id",
+            "foreignField": "_id",
+            "pipeline": [{"$project": {"_id": 0, "title": 1, "difficulty": 1}}],
+            "as": "quiz"
+        }},
+        {"$project": {
+            "quiz_id": 1,
+            "score": 1,
+            "total_questions": 1,
+            "correct_answers": 1,
+            "completed_at": 1,
+            "time_taken_seconds": 1,
+            "quiz": {"$first": "$quiz"}
+        }}
+    ]
+    cursor = await quiz_attempts_collection.aggregate(pipeline)
+    return await cursor.to_list(length=None)
+
+
+async def insert_attempt(attempt_doc: dict):
+    """
+    Persist a graded attempt and count it in the user's stats. Its answers
+    travel inside the document as `answer_masks` (see main.submit_quiz).
+
+    With MONGO_USE_TRANSACTIONS both writes commit together; otherwise the
+    attempt is written first, so a failure in between leaves it uncounted
+    until backfill_user_stats.py runs, never counted without the attempt.
+    """
+    async def write(session=None):
+        await quiz_attempts_collection.insert_one(attempt_doc, session=session)
+        await _count_attempt(attempt_doc, session=session)
+
+    if config.MONGO_USE_TRANSACTIONS:
+        async with client.start_session() as session:
+            await session.with_transaction(write)
+        return
+    await write()
+
+
+async def delete_attempt(attempt_doc: dict) -> int:
+    """Delete an attempt and take it out of the user's stats; returns the number deleted"""
+    async def delete(session=None):
+        result = await quiz_attempts_collection.delete_one({"_id": attempt_doc["_id"]}, session=session)
+        # Only the request that actually deleted the attempt subtracts it
+        if result.deleted_count:
+            await _uncount_attempts([attempt_doc], session=session)
+        return result.deleted_count
+
+    if config.MONGO_USE_TRANSACTIONS:
+        async with client.start_session() as session:
+            return await session.with_transaction(delete)
+    return await delete()
+
+
+# User stats (materialized attempt totals; see user_stats.py)
+
+ATTEMPT_STATS_PROJECTION = {
+    "user_id": 1,
+    "difficulty": 1,
+    "score": 1,
+    "correct_answers": 1,
+    "total_questions": 1,
+    "time_taken_seconds": 1
+}
+
+
+async def find_user_stats(user_id: ObjectId) -> Optional[dict]:
+    return await user_stats_collection.find_one({"_id": user_id})
+
+
+async def _count_attempt(attempt_doc: dict, session=None):
+    """Add a new attempt, which carries its quiz's difficulty key, to the user's stats"""
+    difficulty = attempt_doc["difficulty"]
+    await user_stats_collection.update_one(
+        {"_id": attempt_doc["user_id"]},
+        {
+            "$inc": user_stats.increments([attempt_doc]),
+            "$max": {"best_score": attempt_doc["score"], f"by_difficulty.{difficulty}.best_score": attempt_doc["score"]},
+            "$set": {"updated_at": datetime.utcnow()}
+        },
+        upsert=True,
+        session=session
+    )
+
+
+async def _best_score(user_id: ObjectId, difficulty: Optional[str] = None, session=None) -> Optional[float]:
+    query = {"user_id": user_id, "difficulty": {"$exists": True} if difficulty is None else difficulty}
+    best = await quiz_attempts_collection.find_one(query, {"score": 1}, sort=[("score", DESCENDING)], session=session)
+    return best["score"] if best else None
+
+
+async def _uncount_attempts(attempts: List[dict], session=None):
+    """
+    Subtract deleted attempts from their users' stats. Maxima cannot be
+    subtracted, so when a deleted attempt held a best score it is looked up
+    again among the attempts left (one indexed read); a difficulty with no
+    attempts left is dropped from the breakdown.
+    """
+    by_user: Dict[ObjectId, List[dict]] = {}
+    for attempt in attempts:
+        # Attempts without a difficulty predate the stats and were never counted
+        if "difficulty" in attempt:
+            by_user.setdefault(attempt["user_id"], []).append(attempt)
+
+    for user_id, user_attempts in by_user.items():
+        stats_doc = await user_stats_collection.find_one_and_update(
+            {"_id": user_id},
+            {"$inc": user_stats.increments(user_attempts, sign=-1), "$set": {"updated_at": datetime.utcnow()}},
+            return_document=ReturnDocument.AFTER,
+            session=session
+        )
+        if not stats_doc:
+            continue
+        update = {}
+        if max(attempt["score"] for attempt in user_attempts) >= stats_doc.get("best_score", 0):
+            update["$set"] = {"best_score": await _best_score(user_id, session=session) or 0}
+        for difficulty in {attempt["difficulty"] for attempt in user_attempts}:
+            totals = stats_doc.get("by_difficulty", {}).get(difficulty, {})
+            if totals.get("total_attempts", 0) <= 0:
+                update.setdefault("$unset", {})[f"by_difficulty.{difficulty}"] = ""
+            elif max(attempt["score"] for attempt in user_attempts if attempt["difficulty"] == difficulty) >= totals.get("best_score", 0):
+                best = await _best_score(user_id, difficulty, session=session)
+                update.setdefault("$set", {})[f"by_difficulty.{difficulty}.best_score"] = best or 0
+        if update:
+            await user_stats_collection.update_one({"_id": user_id}, update, session=session)
+
+
+# User answers (attempts stored before answers were embedded; see migrate_attempt_answers.py)
+
+async def find_answers_for_attempt(attempt_id: ObjectId) -> List[dict]:
+    cursor = user_answers_collection.find(
+        {"quiz_attempt_id": attempt_id},
+        {"question_id": 1, "selected_answers": 1, "is_correct": 1}
+    )
+    return await cursor.to_list(length=None)
+
+
+async def delete_answers_for_attempt(attempt_id: ObjectId) -> int:
+    result = await user_answers_collection.delete_many({"quiz_attempt_id": attempt_id})
+    return result.deleted_count
+
+
+# Generation cache
+
+async def find_cached_generation(cache_key: str) -> Optional[dict]:
+    """Return a live cache entry and record the hit"""
+    return await generation_cache_collection.find_one_and_update(
+        {"_id": cache_key, "expires_at": {"$gt": datetime.utcnow()}},
+        {"$inc": {"hits": 1}, "$set": {"last_used_at": datetime.utcnow()}},
+        projection={"quiz_text": 1, "questions": 1}
+    )
+
+
+async def store_cached_generation(cache_key: str, quiz_text: str, questions: List[dict]):
+    now = datetime.utcnow()
+    await generation_cache_collection.replace_one(
+        {"_id": cache_key},
+        {
+            "quiz_text": quiz_text,
+            "questions": questions,
+            "hits": 0,
+            "created_at": now,
+            "last_used_at": now,
+            "expires_at": now + timedelta(seconds=config.GENERATION_CACHE_TTL_SECONDS)
+        },
+        upsert=True
+    )
+    await evict_generation_cache(config.GENERATION_CACHE_MAX_ENTRIES)
+
+
+async def evict_generation_cache(max_entries: int) -> int:
+    """
+    Trim the cache to `max_entries`, least recently used first.
+
+    Expired entries are removed by the TTL index on expires_at; this handles
+    the size bound. The metadata count keeps the common (under-limit) case to
+    a single cheap command.
+    """
+    surplus = await generation_cache_collection.estimated_document_count() - max_entries
+    if surplus <= 0:
+        return 0
+    oldest = await (
+        generation_cache_collection.find({}, {"_id": 1})
+        .sort("last_used_at", ASCENDING)
+        .limit(surplus)
+        .to_list(length=None)
+    )
+    result = await generation_cache_collection.delete_many({"_id": {"$in": [doc["_id"] for doc in oldest]}})
+    return result.deleted_count
+
+
+# Generation jobs
+#
+# A job is claimed by atomically flipping it to "running" with a lease. The
+# worker extends the lease while it works; a job whose lease lapses (worker
+# crashed or was killed) becomes claimable again until JOB_MAX_ATTEMPTS is
+# used up. Uploaded files live in GridFS for the lifetime of the job so any
+# worker host can pick it up.
+
+JOB_UPLOAD_READ_BYTES = 1024 * 1024
+
+
+async def store_job_upload(file_name: str, upload_path: str) -> ObjectId:
+    """Copy a spooled upload into GridFS, reading the file in a worker thread so the event loop does no file I/O"""
+    grid_in = job_uploads_bucket.open_upload_stream(file_name)
+    source = await asyncio.to_thread(open, upload_path, "rb")
+    try:
+        while True:
+            chunk = await asyncio.to_thread(source.read, JOB_UPLOAD_READ_BYTES)
+            if not chunk:
+                break
+            await grid_in.write(chunk)
+        await grid_in.close()
+    except BaseException:
+        # Remove the chunks written so far
+        await grid_in.abort()
+        raise
+    finally:
+        await asyncio.to_thread(source.close)
+    return grid_in._id
+
+
+async def enqueue_generation_job(
+    user_id: ObjectId,
+    request_doc: dict,
+    upload_path: Optional[str] = None,
+    upload_sha256: Optional[str] = None,
+) -> ObjectId:
+    upload_id = None
+    if upload_path:
+        upload_id = await store_job_upload(request_doc.get("file_name") or "upload", upload_path)
+    now = datetime.utcnow()
+    result = await generation_jobs_collection.insert_one({
+        "user_id": user_id,
+        "status": "queued",
+        "request": request_doc,
+        "upload_id": upload_id,
+        "upload_sha256": upload_sha256,
+        "progress": {"stage": "queued", "percent": 0},
+        "attempts": 0,
+        "run_after": now,
+        "lease_expires_at": None,
+        "worker_id": None,
+        "result": None,
+        "error": None,
+        "created_at": now,
+        "updated_at": now
+    })
+    return result.inserted_id
+
+
+async def claim_generation_job(worker_id: str) -> Optional[dict]:
+    """Claim the oldest runnable job: queued and due, or running with an expired lease"""
+    now = datetime.utcnow()
+    return await generation_jobs_collection.find_one_and_update(
+        {
+            "$or": [
+                {"status": "queued", "run_after": {"$lte": now}},
+                {"status": "running", "lease_expires_at": {"$lt": now}, "attempts": {"$lt": config.JOB_MAX_ATTEMPTS}}
+            ]
+        },
+        {
+            "$set": {
+                "status": "running",
+                "worker_id": worker_id,
+                "lease_expires_at": now + timedelta(seconds=config.JOB_LEASE_SECONDS),
+                "progress": {"stage": "starting", "percent": 0},
+                "updated_at": now
+            },
+            "$inc": {"attempts": 1}
+        },
+        sort=[("created_at", ASCENDING)],
+        return_document=ReturnDocument.AFTER
+    )
+
+
+async def renew_generation_job_lease(job_id: ObjectId, worker_id: str) -> bool:
+    """Extend the lease; False means the job was taken over and the worker should stop"""
+    now = datetime.utcnow()
+    result = await generation_jobs_collection.update_one(
+        {"_id": job_id, "status": "running", "worker_id": worker_id},
+        {"$set": {"lease_expires_at": now + timedelta(seconds=config.JOB_LEASE_SECONDS), "updated_at": now}}
+    )
+    return result.matched_count == 1
+
+
+async def update_generation_job_progress(job_id: ObjectId, worker_id: str, stage: str, percent: int):
+    await generation_jobs_collection.update_one(
+        {"_id": job_id, "status": "running", "worker_id": worker_id},
+        {"$set": {"progress": {"stage": stage, "percent": percent}, "updated_at": datetime.utcnow()}}
+    )
+
+
+async def complete_generation_job(job_id: ObjectId, worker_id: str, quiz_id: str):
+    result = await generation_jobs_collection.find_one_and_update(
+        {"_id": job_id, "status": "running", "worker_id": worker_id},
+        {"$set": {
+            "status": "succeeded",
+            "result": {"quiz_id": quiz_id},
+            "progress": {"stage": "done", "percent": 100},
+            "lease_expires_at": None,
+            "error": None,
+            "updated_at": datetime.utcnow()
+        }}
+    )
+    if result and result.get("upload_id"):
+        await delete_job_upload(result["upload_id"])
+
+
+async def fail_generation_job(job_id: ObjectId, worker_id: str, error: str, retry: bool):
+    """Requeue with backoff while attempts remain and `retry` is set; otherwise fail for good"""
+    job_doc = await generation_jobs_collection.find_one({"_id": job_id, "worker_id": worker_id}, {"attempts": 1, "upload_id": 1})
+    if not job_doc:
+        return
+    now = datetime.utcnow()
+    attempts = job_doc.get("attempts", 0)
+    if retry and attempts < config.JOB_MAX_ATTEMPTS:
+        backoff = config.JOB_RETRY_BACKOFF_SECONDS * (2 ** (attempts - 1))
+        update = {
+            "status": "queued",
+            "run_after": now + timedelta(seconds=backoff),
+            "progress": {"stage": "retrying", "percent": 0},
+        }
+    else:
+        update = {"status": "failed", "progress": {"stage": "failed", "percent": 100}}
+    update.update({"error": error, "lease_expires_at": None, "updated_at": now})
+    await generation_jobs_collection.update_one({"_id": job_id, "worker_id": worker_id}, {"$set": update})
+    if update["status"] == "failed" and job_doc.get("upload_id"):
+        await delete_job_upload(job_doc["upload_id"])
+
+
+async def fail_abandoned_generation_jobs() -> int:
+    """Mark jobs whose lease lapsed on their final attempt as failed"""
+    now = datetime.utcnow()
+    query = {"status": "running", "lease_expires_at": {"$lt": now}, "attempts": {"$gte": config.JOB_MAX_ATTEMPTS}}
+    abandoned = await generation_jobs_collection.find(query, {"upload_id": 1}).to_list(length=None)
+    if not abandoned:
+        return 0
+    result = await generation_jobs_collection.update_many(
+        {**query, "_id": {"$in": [doc["_id"] for doc in abandoned]}},
+        {"$set": {
+            "status": "failed",
+            "error": "Worker stopped responding on the final attempt",
+            "progress": {"stage": "failed", "percent": 100},
+            "lease_expires_at": None,
+            "updated_at": now
+        }}
+    )
+    for doc in abandoned:
+        if doc.get("upload_id"):
+            await delete_job_upload(doc["upload_id"])
+    return result.modified_count
+
+
+async def find_generation_job(job_id: ObjectId) -> Optional[dict]:
+    return await generation_jobs_collection.find_one({"_id": job_id}, {"request": 0})
+
+
+async def download_job_upload(upload_id: ObjectId, destination) -> int:
+    """Stream a job's uploaded file into the writable file object `destination`"""
+    await job_uploads_bucket.download_to_stream(upload_id, destination)
+    return destination.tell()
+
+
+async def delete_job_upload(upload_id: ObjectId):
+    try:
+        await job_uploads_bucket.delete(upload_id)
+    except Exception as e:
+        print(f"Could not delete job upload {upload_id}: {str(e)}")
+
+
+# API keys
+
+async def find_active_api_keys() -> List[dict]:
+    """Active OpenAI keys, oldest first so round-robin order is stable"""
+    cursor = api_keys_collection.find(
+        {"is_active": True, "api_key": {"$regex": "^sk-proj-"}},
+        {"api_key": 1, "name": 1, "requests_per_minute": 1}
+    ).sort("_id", ASCENDING)
+    return await cursor.to_list(length=None)
+
+
+async def record_api_key_usage(usage: Dict[ObjectId, Tuple[datetime, int]]):
+    """Apply buffered uses (last use time, count) per key in one bulk write"""
+    if not usage:
+        return
+    await api_keys_collection.bulk_write([
+        UpdateOne({"_id": key_id}, {"$max": {"last_used": last_used}, "$inc": {"use_count": count}})
+        for key_id, (last_used, count) in usage.items()
+    ], ordered=False)
+
+
+async def watch_api_keys():
+    """Change stream over api_keys (requires a replica set)"""
+    return await api_keys_collection.watch()
+
+
+# Question bank
+#
+# Pre-generated questions per normalized subject and difficulty (see
+# question_bank.py). Quizzes assembled from the bank list the entries they
+# used in `bank_question_ids`, which is how a user's already-seen questions
+# are found.
+
+async def sample_bank_questions(subject_key: str, difficulty: str, count: int, exclude_ids: List[ObjectId]) -> List[dict]:
+    """Up to `count` random bank questions, skipping `exclude_ids`"""
+    cursor = await question_bank_collection.aggregate([
+        {"$match": {"subject_key": subject_key, "difficulty": difficulty, "_id": {"$nin": exclude_ids}}},
+        {"$sample": {"size": count}},
+        {"$project": {"question": 1, "options": 1, "correct_answers": 1}}
+    ])
+    return await cursor.to_list(length=None)
+
+
+async def find_seen_bank_question_ids(user_id: ObjectId, subject_key: str, difficulty: str) -> List[ObjectId]:
+    """
+    Bank questions in quizzes the user created or attempted for this subject
+    and difficulty. Attempts carry their quiz's subject_key, so only the
+    user's attempts on this subject are read, from a covering index.
+    """
+    attempted = await quiz_attempts_collection.distinct("quiz_id", {"user_id": user_id, "subject_key": subject_key})
+    return await quizzes_collection.distinct("bank_question_ids", {
+        "subject_key": subject_key,
+        "difficulty": difficulty,
+        "$or": [{"user_id": user_id}, {"_id": {"$in": attempted}}]
+    })
+
+
+async def upsert_bank_questions(subject_key: str, difficulty: str, question_docs: List[dict]) -> List[ObjectId]:
+    """
+    Add questions to the bank, keyed by their normalized text so a question
+    generated twice is stored once, and return the entry IDs in input order.
+    """
+    if not question_docs:
+        return []
+    await question_bank_collection.bulk_write([
+        UpdateOne(
+            {"subject_key": subject_key, "difficulty": difficulty, "text_key": doc["text_key"]},
+            {"$setOnInsert": doc},
+            upsert=True
+        )
+        for doc in question_docs
+    ], ordered=False)
+    text_keys = [doc["text_key"] for doc in question_docs]
+    cursor = question_bank_collection.find(
+        {"subject_key": subject_key, "difficulty": difficulty, "text_key": {"$in": text_keys}},
+        {"text_key": 1}
+    )
+    ids = {doc["text_key"]: doc["_id"] async for doc in cursor}
+    return [ids[text_key] for text_key in text_keys]
+
+
+async def count_bank_questions(subject_key: str, difficulty: str) -> int:
+    return await question_bank_collection.count_documents({"subject_key": subject_key, "difficulty": difficulty})
+
+
+async def find_popular_subjects(since: datetime, min_quizzes: int, limit: int) -> List[dict]:
+    """(subject_key, difficulty) pairs with at least `min_quizzes` subject quizzes since `since`, most requested first"""
+    cursor = await quizzes_collection.aggregate([
+        {"$match": {"created_at": {"$gte": since}, "subject_key": {"$exists": True}}},
+        {"$group": {"_id": {"subject_key": "$subject_key", "difficulty": "$difficulty"}, "quizzes": {"$sum": 1}}},
+        {"$match": {"quizzes": {"$gte": min_quizzes}}},
+        {"$sort": {"quizzes": DESCENDING}},
+        {"$limit": limit}
+    ])
+    return [
+        {"subject_key": doc["_id"]["subject_key"], "difficulty": doc["_id"]["difficulty"], "quizzes": doc["quizzes"]}
+        for doc in await cursor.to_list(length=None)
+    ]
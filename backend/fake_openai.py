@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+Local fake of the OpenAI chat completions API.
+
+Used by the benchmark scripts so quiz generation can be exercised without
+network access or API spend. Each completion sleeps for a configurable
+latency and returns a canned quiz in the same Markdown format the real
+prompt asks for, or as a JSON quiz document when the request carries a
+`response_format`. JSON questions are made of pseudo-words that change with
+every question served, so they never look like near-duplicates of each other. With `stream: true` the same content is sent as Server-Sent
+Events, one line per chunk, spread evenly over the latency.
+
+With `requests_per_minute` / `tokens_per_minute` each API key gets its own
+limits, enforced like OpenAI's: budgets refill continuously, every response
+carries x-ratelimit-* headers, and a request over budget is answered with a
+429 and a retry-after header. `window` shortens the minute so tests do not
+have to wait for real per-minute refills.
+
+Run standalone with:
+    python fake_openai.py --port 8765 --latency 2.0 --rpm 60 --tpm 40000
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import threading
+import time
+import uuid
+from typing import Dict, Optional
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+CANNED_QUESTION = """{n}. Which of the following are primary colors (set {n})?
+A. Red
+B. Blue
+C. Green
+D. Yellow
+**Correct Answers:** A, B
+"""
+
+
+def build_quiz_text(num_questions: int) -> str:
+    return "\n".join(CANNED_QUESTION.format(n=i + 1) for i in range(num_questions))
+
+
+SYLLABLES = ["ka", "lo", "mi", "ren", "tu", "vas", "po", "sel", "dri", "nu", "fen", "gor", "hal", "qui", "zet", "bra"]
+_question_numbers = itertools.count(1)
+
+
+def _pseudo_words(rng: random.Random, count: int) -> str:
+    return " ".join("".join(rng.choices(SYLLABLES, k=3)) for _ in range(count))
+
+
+def build_quiz_json(num_questions: int) -> str:
+    questions = []
+    for _ in range(num_questions):
+        rng = random.Random(next(_question_numbers))
+        questions.append({
+            "question": f"Which of the following describe {_pseudo_words(rng, 3)}?",
+            "options": [_pseudo_words(rng, 2).capitalize() for _ in range(4)],
+            "correct_answers": ["A", "B"],
+        })
+    return json.dumps({"questions": questions}, indent=2)
+
+
+def format_duration(seconds: float) -> str:
+    """OpenAI's reset header format: 20ms, 1.5s, 6m0s"""
+    if seconds < 1:
+        return f"{int(seconds * 1000)}ms"
+    minutes, seconds = divmod(seconds, 60)
+    return f"{int(minutes)}m{seconds:.0f}s" if minutes else f"{seconds:.3g}s"
+
+
+class Budget:
+    """A budget of `limit` per `window` seconds, refilled continuously"""
+
+    def __init__(self, limit: int, window: float):
+        self.limit = limit
+        self.window = window
+        self.remaining = float(limit)
+        self.updated_at = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.remaining = min(self.limit, self.remaining + (now - self.updated_at) * self.limit / self.window)
+        self.updated_at = now
+
+    def reset_seconds(self) -> float:
+        return (self.limit - self.remaining) * self.window / self.limit
+
+    def seconds_until(self, amount: float) -> float:
+        return max(0.0, (amount - self.remaining) * self.window / self.limit)
+
+
+class RateLimiter:
+    """Request and token budgets per API key"""
+
+    def __init__(self, requests_per_minute: Optional[int], tokens_per_minute: Optional[int], window: float = 60):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.window = window
+        self.budgets: Dict[str, Dict[str, Budget]] = {}
+        self.rejected = 0
+
+    def check(self, api_key: str, tokens: int):
+        """Charge one request; returns (headers, retry_after) where retry_after is None when allowed"""
+        budgets = self.budgets.get(api_key)
+        if budgets is None:
+            budgets = self.budgets[api_key] = {}
+            if self.requests_per_minute:
+                budgets["requests"] = Budget(self.requests_per_minute, self.window)
+            if self.tokens_per_minute:
+                budgets["tokens"] = Budget(self.tokens_per_minute, self.window)
+        cost = {"requests": 1, "tokens": tokens}
+        for budget in budgets.values():
+            budget.refill()
+        waits = [budget.seconds_until(cost[name]) for name, budget in budgets.items()]
+        retry_after = max(waits, default=0.0)
+        if retry_after > 0:
+            self.rejected += 1
+        else:
+            for name, budget in budgets.items():
+                budget.remaining -= cost[name]
+        headers = {}
+        for name, budget in budgets.items():
+            headers[f"x-ratelimit-limit-{name}"] = str(budget.limit)
+            headers[f"x-ratelimit-remaining-{name}"] = str(max(int(budget.remaining), 0))
+            headers[f"x-ratelimit-reset-{name}"] = format_duration(budget.reset_seconds())
+        return headers, (retry_after if retry_after > 0 else None)
+
+
+def create_app(
+    latency: float = 1.0,
+    num_questions: int = 5,
+    requests_per_minute: Optional[int] = None,
+    tokens_per_minute: Optional[int] = None,
+    window: float = 60,
+) -> FastAPI:
+    app = FastAPI()
+    app.state.latency = latency
+    app.state.num_questions = num_questions
+    app.state.rate_limiter = RateLimiter(requests_per_minute, tokens_per_minute, window)
+    app.state.requests_by_key = {}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        api_key = request.headers.get("authorization", "").removeprefix("Bearer ")
+        if body.get("response_format"):
+            content = build_quiz_json(app.state.num_questions)
+        else:
+            content = build_quiz_text(app.state.num_questions)
+        prompt_tokens = sum(len(m.get("content", "")) // 4 for m in body.get("messages", []))
+        completion_tokens = len(content) // 4
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+
+        headers, retry_after = app.state.rate_limiter.check(api_key, usage["total_tokens"])
+        if retry_after is not None:
+            return JSONResponse(
+                status_code=429,
+                headers={**headers, "retry-after": f"{retry_after:.3f}"},
+                content={"error": {
+                    "message": f"Rate limit reached for key ...{api_key[-4:]}",
+                    "type": "requests",
+                    "code": "rate_limit_exceeded",
+                }},
+            )
+        app.state.requests_by_key[api_key] = app.state.requests_by_key.get(api_key, 0) + 1
+
+        if body.get("stream"):
+            include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+            return StreamingResponse(
+                stream_chunks(content, body.get("model", "gpt-3.5-turbo"), usage if include_usage else None),
+                media_type="text/event-stream",
+                headers=headers,
+            )
+        await asyncio.sleep(app.state.latency)
+        return JSONResponse(headers=headers, content={
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "gpt-3.5-turbo"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": usage,
+        })
+
+    async def stream_chunks(content: str, model: str, usage):
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        lines = content.splitlines(keepends=True)
+        delay = app.state.latency / max(len(lines), 1)
+
+        def event(choices, usage=None) -> str:
+            return "data: " + json.dumps({
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": choices,
+                "usage": usage,
+            }) + "\n\n"
+
+        for line in lines:
+            await asyncio.sleep(delay)
+            yield event([{"index": 0, "delta": {"content": line}, "finish_reason": None}])
+        yield event([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+        if usage:
+            yield event([], usage)
+        yield "data: [DONE]\n\n"
+
+    return app
+
+
+def start_in_thread(
+    port: int,
+    latency: float = 1.0,
+    num_questions: int = 5,
+    requests_per_minute: Optional[int] = None,
+    tokens_per_minute: Optional[int] = None,
+    window: float = 60,
+) -> uvicorn.Server:
+    """Start the fake server on a daemon thread and wait until it accepts requests"""
+    server = uvicorn.Server(uvicorn.Config(
+        create_app(latency, num_questions, requests_per_minute, tokens_per_minute, window),
+        host="127.0.0.1", port=port, log_level="warning"
+    ))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake OpenAI chat completions server")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=1.0)
+    parser.add_argument("--num-questions", type=int, default=5)
+    parser.add_argument("--rpm", type=int, default=None, help="Requests per minute per API key")
+    parser.add_argument("--tpm", type=int, default=None, help="Tokens per minute per API key")
+    parser.add_argument("--window", type=float, default=60, help="Length of a rate-limit \"minute\" in seconds")
+    args = parser.parse_args()
+    uvicorn.run(create_app(args.latency, args.num_questions, args.rpm, args.tpm, args.window), host="127.0.0.1", port=args.port)
@@ -0,0 +1,37 @@
+"""
+Content-addressed cache keys for quiz generation.
+
+Two requests share a cache entry when they would send the LLM the same
+prompt: same source, difficulty, question count, model and prompt version.
+Uploads are addressed by a hash of their raw bytes so a hit skips text
+extraction as well as the completion; subjects are normalized so casing and
+whitespace differences still hit.
+"""
+import hashlib
+import json
+
+# Bump whenever the generation prompt or the stored question format changes
+# so entries produced by the old prompt stop matching.
+PROMPT_VERSION = 2
+
+
+def normalize_subject(subject: str) -> str:
+    return " ".join(subject.split()).casefold()
+
+
+def normalize_difficulty(difficulty: str) -> str:
+    """The form difficulties are stored and compared in, so "Easy" and "easy" match"""
+    return " ".join(difficulty.split()).casefold()
+
+
+def make_cache_key(source_kind: str, source: str, difficulty: str, num_questions: int, model: str) -> str:
+    """`source_kind` is "file" (source is a content hash) or "subject" (source is the normalized subject)"""
+    material = json.dumps({
+        "kind": source_kind,
+        "source": source,
+        "difficulty": normalize_difficulty(difficulty),
+        "num_questions": int(num_questions),
+        "model": model,
+        "prompt_version": PROMPT_VERSION,
+    }, sort_keys=True)
+    return hashlib.sha256(material.encode()).hexdigest()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Add near-duplicate signatures to questions stored before they existed, and
+optionally de-duplicate the questions collection by reference.
+
+    python index_question_signatures.py            # write minhash / lsh_bands where missing
+    python index_question_signatures.py --share    # ...and store near-duplicates as references
+
+New questions get their signature when generate_quiz stores them; this fills
+in older ones in _id order. With --share a question that nearly duplicates
+one indexed before it (in another quiz) is rewritten as a reference
+(`duplicate_of`, see db.stored_question), which is what QUESTION_DEDUP_STORAGE
+does for new questions. Unlike new questions, a stored one may already
+have attempts recorded against its options, so it is only shared when the
+options and correct answers are identical and just the wording differs.
+Each question is updated with a conditional write, so the script can be
+stopped and re-run at any time. Embedded quizzes are not touched.
+"""
+import argparse
+import sys
+
+from pymongo import MongoClient, UpdateOne
+from config import config
+import near_duplicates
+
+CONTENT_FIELDS = ("question_text", "options", "correct_answers")
+
+
+def batches(cursor, size):
+    batch = []
+    for doc in cursor:
+        batch.append(doc)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def as_question(doc):
+    return {"question": doc["question_text"], "options": doc["options"]}
+
+
+def same_answers(shared, doc):
+    """Attempt answer masks stay valid only if the options and answers match exactly"""
+    return shared["options"] == doc["options"] and shared["correct_answers"] == doc["correct_answers"]
+
+
+def index_signatures(database, batch_size, share, threshold, dry_run):
+    questions = database["questions"]
+    pending = {"minhash": {"$exists": False}, "duplicate_of": {"$exists": False}}
+    total = questions.count_documents(pending)
+    print(f"Questions to index: {total}")
+
+    indexed = shared = 0
+    cursor = questions.find(pending, {"quiz_id": 1, **dict.fromkeys(CONTENT_FIELDS, 1)}).sort("_id", 1)
+    for batch in batches(cursor, batch_size):
+        signed = []
+        for doc in batch:
+            sig = near_duplicates.signature(as_question(doc))
+            signed.append((doc, sig, near_duplicates.band_keys(sig)))
+
+        # Earlier questions in this batch count as stored for the later ones
+        index = near_duplicates.NearDuplicateIndex(threshold)
+        if share:
+            keys = sorted({key for _, _, doc_keys in signed for key in doc_keys})
+            projection = {"quiz_id": 1, "minhash": 1, "lsh_bands": 1, "options": 1, "correct_answers": 1}
+            for candidate in questions.find({"lsh_bands": {"$in": keys}}, projection):
+                index.add(candidate["minhash"], candidate, candidate["lsh_bands"])
+
+        writes = []
+        for doc, sig, keys in signed:
+            match = index.query(sig, keys) if share else None
+            if match is not None and same_answers(match[0], doc) and match[0]["quiz_id"] != doc["quiz_id"]:
+                unset = dict.fromkeys(CONTENT_FIELDS, "")
+                writes.append(UpdateOne(
+                    {"_id": doc["_id"], "minhash": {"$exists": False}},
+                    {"$set": {"duplicate_of": match[0]["_id"]}, "$unset": unset}
+                ))
+                shared += 1
+                continue
+            writes.append(UpdateOne(
+                {"_id": doc["_id"], "minhash": {"$exists": False}},
+                {"$set": {"minhash": sig, "lsh_bands": keys}}
+            ))
+            if share:
+                index.add(sig, doc, keys)
+
+        if not dry_run and writes:
+            questions.bulk_write(writes, ordered=False)
+        indexed += len(batch)
+        print(f"  indexed {indexed}/{total} ({shared} stored as references)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--share", action="store_true", help="Store near-duplicates of earlier questions as references")
+    parser.add_argument("--threshold", type=float, default=config.QUESTION_DEDUP_THRESHOLD)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    client = MongoClient(config.MONGO_URI)
+    try:
+        database = client[config.DATABASE_NAME]
+        print(f"Connected to database: {config.DATABASE_NAME}")
+        index_signatures(database, args.batch_size, args.share, args.threshold, args.dry_run)
+        print("Indexing completed successfully!")
+    except Exception as e:
+        print(f"Error indexing questions: {str(e)}")
+        sys.exit(1)
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Upload ingestion for quiz generation.
+
+Uploads are streamed to a temporary file in fixed-size chunks (hashing and
+enforcing the byte cap on the way) instead of being read into memory. PDF
+text is then extracted page range by page range across a process pool, each
+worker opening the spooled file itself, and the page texts are joined once.
+"""
+import asyncio
+import hashlib
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import List, Optional
+
+import PyPDF2
+
+from config import config
+
+CHUNK_SIZE = 1024 * 1024
+
+_pdf_executor: Optional[ProcessPoolExecutor] = None
+
+
+class UploadTooLargeError(ValueError):
+    """Raised when an upload exceeds UPLOAD_MAX_BYTES or PDF_MAX_PAGES"""
+
+
+class PdfExtractionError(ValueError):
+    """Raised when a PDF cannot be read or no text can be extracted from it"""
+
+
+# What PyPDF2 raises for corrupt, truncated or non-PDF input besides its own
+# errors; reported as PdfExtractionError so callers answer 400 and the
+# worker does not retry the job
+PDF_READ_ERRORS = (PyPDF2.errors.PyPdfError, ValueError, KeyError, IndexError, TypeError, AttributeError)
+
+
+@dataclass
+class SpooledUpload:
+    path: str
+    size: int
+    sha256: str
+
+    def read_bytes(self) -> bytes:
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def cleanup(self):
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+async def spool_upload(upload, max_bytes: int) -> SpooledUpload:
+    """Stream an UploadFile to a temporary file, hashing it and enforcing `max_bytes`"""
+    digest = hashlib.sha256()
+    size = 0
+    fd, path = tempfile.mkstemp(prefix="quiz-upload-")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = await upload.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLargeError(f"Upload exceeds the {max_bytes // (1024 * 1024)} MB limit")
+                digest.update(chunk)
+                out.write(chunk)
+    except BaseException:
+        os.unlink(path)
+        raise
+    return SpooledUpload(path=path, size=size, sha256=digest.hexdigest())
+
+
+def _get_pdf_executor() -> ProcessPoolExecutor:
+    global _pdf_executor
+    if _pdf_executor is None:
+        _pdf_executor = ProcessPoolExecutor(max_workers=config.PDF_EXTRACT_WORKERS)
+    return _pdf_executor
+
+
+def shutdown_pdf_executor():
+    global _pdf_executor
+    if _pdf_executor is not None:
+        _pdf_executor.shutdown(wait=False, cancel_futures=True)
+        _pdf_executor = None
+
+
+def count_pdf_pages(path: str) -> int:
+    try:
+        return len(PyPDF2.PdfReader(path).pages)
+    except PDF_READ_ERRORS as e:
+        raise PdfExtractionError(f"Could not read the PDF: {str(e)}") from e
+
+
+def extract_page_texts(path: str, start: int, end: int) -> List[str]:
+    """Extract pages [start, end) (0-based); runs inside pool workers"""
+    try:
+        reader = PyPDF2.PdfReader(path)
+        return [reader.pages[i].extract_text() or "" for i in range(start, end)]
+    except PDF_READ_ERRORS as e:
+        raise PdfExtractionError(f"Could not read page text from the PDF: {str(e)}") from e
+
+
+def resolve_page_range(total_pages: int, page_start: Optional[int], page_end: Optional[int]) -> range:
+    """Turn an optional 1-based inclusive range into 0-based page indexes, enforcing PDF_MAX_PAGES"""
+    start = max(1, page_start or 1)
+    end = min(total_pages, page_end or total_pages)
+    if start > end:
+        raise PdfExtractionError(f"Page range {start}-{end} is empty for a {total_pages}-page PDF")
+    if end - start + 1 > config.PDF_MAX_PAGES:
+        raise UploadTooLargeError(
+            f"PDF has {end - start + 1} pages in range; at most {config.PDF_MAX_PAGES} can be processed. "
+            "Use page_start/page_end to select a section."
+        )
+    return range(start - 1, end)
+
+
+async def extract_pdf_text(path: str, page_start: Optional[int] = None, page_end: Optional[int] = None) -> str:
+    loop = asyncio.get_running_loop()
+    total_pages = await loop.run_in_executor(None, count_pdf_pages, path)
+    pages = resolve_page_range(total_pages, page_start, page_end)
+
+    if len(pages) < config.PDF_PARALLEL_MIN_PAGES or config.PDF_EXTRACT_WORKERS <= 1:
+        # Not worth the process hop for short documents or a single worker
+        batches = [await loop.run_in_executor(None, extract_page_texts, path, pages.start, pages.stop)]
+    else:
+        workers = config.PDF_EXTRACT_WORKERS
+        step = -(-len(pages) // workers)
+        executor = _get_pdf_executor()
+        batches = await asyncio.gather(*(
+            loop.run_in_executor(executor, extract_page_texts, path, start, min(start + step, pages.stop))
+            for start in range(pages.start, pages.stop, step)
+        ))
+
+    text = "\n".join(page_text for batch in batches for page_text in batch)
+    if not text.strip():
+        raise PdfExtractionError("No text could be extracted from the PDF")
+    return text
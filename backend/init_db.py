@@ -24,7 +24,11 @@ def init_database():
             "questions",
             "quiz_attempts",
             "user_answers",
-            "api_keys"
+            "api_keys",
+            "generation_cache",
+            "generation_jobs",
+            "question_bank",
+            "user_stats"
         ]
         
         for collection_name in collections:
@@ -46,12 +50,26 @@ def init_database():
         quizzes_collection = database["quizzes"]
         quizzes_collection.create_index([("user_id", ASCENDING)])
         quizzes_collection.create_index([("created_at", DESCENDING)])
+        # Back the keyset-paginated /quizzes catalog and its filters
+        quizzes_collection.create_index([("created_at", DESCENDING), ("_id", DESCENDING)])
+        quizzes_collection.create_index([("difficulty", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)])
+        quizzes_collection.create_index([("user_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)])
+        quizzes_collection.create_index([("title", ASCENDING)])
+        # Popular-subject counts and already-seen bank questions per user
+        quizzes_collection.create_index(
+            [("created_at", DESCENDING), ("subject_key", ASCENDING), ("difficulty", ASCENDING)],
+            partialFilterExpression={"subject_key": {"$exists": True}}
+        )
+        quizzes_collection.create_index([("user_id", ASCENDING), ("subject_key", ASCENDING), ("difficulty", ASCENDING)])
         print("Created indexes for quizzes collection")
         
         # Questions collection indexes
         questions_collection = database["questions"]
-        questions_collection.create_index([("quiz_id", ASCENDING)])
-        questions_collection.create_index([("order", ASCENDING)])
+        # Serves find({"quiz_id": ...}).sort("order") without an in-memory sort
+        questions_collection.create_index([("quiz_id", ASCENDING), ("order", ASCENDING)])
+        # Near-duplicate lookups by LSH band key, and references to shared questions
+        questions_collection.create_index([("lsh_bands", ASCENDING)], sparse=True)
+        questions_collection.create_index([("duplicate_of", ASCENDING)], sparse=True)
         print("Created indexes for questions collection")
         
         # Quiz attempts collection indexes
@@ -59,9 +77,20 @@ def init_database():
         quiz_attempts_collection.create_index([("user_id", ASCENDING)])
         quiz_attempts_collection.create_index([("quiz_id", ASCENDING)])
         quiz_attempts_collection.create_index([("completed_at", DESCENDING)])
+        # Covers the keyset-paginated history query
+        quiz_attempts_collection.create_index([("user_id", ASCENDING), ("completed_at", DESCENDING), ("_id", DESCENDING)])
+        # Best-score lookups when an attempt is deleted from the user's stats
+        quiz_attempts_collection.create_index([("user_id", ASCENDING), ("score", DESCENDING)])
+        quiz_attempts_collection.create_index([("user_id", ASCENDING), ("difficulty", ASCENDING), ("score", DESCENDING)])
+        # Covers the quizzes a user attempted per subject (already-seen bank questions)
+        quiz_attempts_collection.create_index(
+            [("user_id", ASCENDING), ("subject_key", ASCENDING), ("quiz_id", ASCENDING)],
+            partialFilterExpression={"subject_key": {"$exists": True}}
+        )
         print("Created indexes for quiz_attempts collection")
         
-        # User answers collection indexes
+        # User answers collection indexes (attempts stored before answers were
+        # embedded in quiz_attempts; see migrate_attempt_answers.py)
         user_answers_collection = database["user_answers"]
         user_answers_collection.create_index([("quiz_attempt_id", ASCENDING)])
         user_answers_collection.create_index([("question_id", ASCENDING)])
@@ -74,6 +103,28 @@ def init_database():
         api_keys_collection.create_index([("is_active", ASCENDING)])
         print("Created indexes for api_keys collection")
         
+        # Generation cache indexes: expiry via TTL, LRU eviction by last use
+        generation_cache_collection = database["generation_cache"]
+        generation_cache_collection.create_index([("expires_at", ASCENDING)], expireAfterSeconds=0)
+        generation_cache_collection.create_index([("last_used_at", ASCENDING)])
+        print("Created indexes for generation_cache collection")
+        
+        # Generation job indexes: claiming queued and lease-expired jobs, per-user lookups
+        generation_jobs_collection = database["generation_jobs"]
+        generation_jobs_collection.create_index([("status", ASCENDING), ("run_after", ASCENDING), ("created_at", ASCENDING)])
+        generation_jobs_collection.create_index([("status", ASCENDING), ("lease_expires_at", ASCENDING)])
+        generation_jobs_collection.create_index([("user_id", ASCENDING), ("created_at", DESCENDING)])
+        print("Created indexes for generation_jobs collection")
+        
+        # Question bank indexes: sampling and inventory counts per subject and
+        # difficulty; one entry per normalized question text
+        question_bank_collection = database["question_bank"]
+        question_bank_collection.create_index(
+            [("subject_key", ASCENDING), ("difficulty", ASCENDING), ("text_key", ASCENDING)],
+            unique=True
+        )
+        print("Created indexes for question_bank collection")
+        
         print("\nDatabase initialization completed successfully!")
         
         # Show collection stats
@@ -0,0 +1,175 @@
+"""
+Async LLM client for quiz generation.
+
+All completions go through AsyncOpenAI so the event loop is never blocked
+while a completion is in flight, and every call carries its own timeout.
+Streamed completions share one overall deadline.
+
+Each completion runs under a lease from llm_dispatcher, which picks the API
+key with the most rate-limit headroom, caps how many completions run at once
+and queues the rest fairly per user. Streamed completions hold their lease
+until the stream is drained. There is one client (and connection pool) per
+key, created on first use and kept until shutdown, so rotating keys never
+needs a restart.
+
+Retries happen here rather than inside the OpenAI client, so a retried
+request can move to another key: a 429 cools the key down and the request
+is dispatched again, and connection errors and 5xx responses are retried up
+to LLM_MAX_RETRIES times with jittered backoff.
+"""
+import asyncio
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+import openai
+from openai import AsyncOpenAI, NOT_GIVEN
+
+from api_keys import key_provider
+from config import config
+from llm_dispatcher import KeyLease, backoff_delay, dispatcher
+
+_clients: Dict[str, AsyncOpenAI] = {}
+
+
+class LLMTimeoutError(Exception):
+    """Raised when a completion does not finish within LLM_TIMEOUT_SECONDS"""
+
+
+@dataclass
+class Completion:
+    text: str
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+
+    def usage(self) -> dict:
+        return {"prompt_tokens": self.prompt_tokens, "completion_tokens": self.completion_tokens}
+
+
+def get_client(api_key: str) -> AsyncOpenAI:
+    """Return the shared AsyncOpenAI client for `api_key`, creating it on first use"""
+    client = _clients.get(api_key)
+    if client is None:
+        client = _clients[api_key] = AsyncOpenAI(
+            api_key=api_key,
+            base_url=config.OPENAI_BASE_URL,
+            timeout=config.LLM_TIMEOUT_SECONDS,
+            max_retries=0,
+        )
+    return client
+
+
+def _estimate_tokens(prompt: str) -> int:
+    """Tokens a request is charged against the key's budget before its usage is known"""
+    return len(prompt) // 4 + config.LLM_COMPLETION_TOKENS_ESTIMATE
+
+
+async def _start(prompt: str, timeout: float, response_format: Optional[dict], **kwargs) -> Tuple[KeyLease, object]:
+    """
+    Send a completion request on the best key and return the lease with the
+    parsed response. The caller releases the lease once the response is consumed.
+    """
+    tokens = _estimate_tokens(prompt)
+    rate_limited = failures = 0
+    while True:
+        lease = await dispatcher.acquire(tokens)
+        try:
+            raw = await asyncio.wait_for(
+                get_client(lease.key.value).chat.completions.with_raw_response.create(
+                    model=config.OPENAI_MODEL,
+                    messages=[{"role": "user", "content": prompt}],
+                    response_format=response_format or NOT_GIVEN,
+                    **kwargs,
+                ),
+                timeout=timeout,
+            )
+        except asyncio.TimeoutError:
+            dispatcher.release(lease)
+            raise LLMTimeoutError(f"LLM completion timed out after {timeout} seconds")
+        except openai.RateLimitError as e:
+            dispatcher.rate_limited(lease, e.response.headers)
+            dispatcher.release(lease)
+            rate_limited += 1
+            if rate_limited > config.LLM_RATE_LIMIT_RETRIES:
+                raise
+            print(f"Rate limited on key {lease.key.label}, retrying ({rate_limited}/{config.LLM_RATE_LIMIT_RETRIES})")
+            continue
+        except (openai.APIConnectionError, openai.InternalServerError) as e:
+            dispatcher.release(lease)
+            failures += 1
+            if failures > config.LLM_MAX_RETRIES:
+                raise
+            print(f"LLM request failed ({str(e)}), retrying ({failures}/{config.LLM_MAX_RETRIES})")
+            await asyncio.sleep(backoff_delay(failures))
+            continue
+        except BaseException:
+            dispatcher.release(lease)
+            raise
+        dispatcher.observe(lease, raw.headers)
+        return lease, raw.parse()
+
+
+async def create_completion(prompt: str, timeout: Optional[float] = None, response_format: Optional[dict] = None) -> Completion:
+    """Run a single chat completion and return its content and token usage"""
+    timeout = timeout if timeout is not None else config.LLM_TIMEOUT_SECONDS
+    lease, response = await _start(prompt, timeout, response_format)
+    dispatcher.release(lease)
+    usage = response.usage
+    return Completion(
+        text=response.choices[0].message.content,
+        prompt_tokens=usage.prompt_tokens if usage else 0,
+        completion_tokens=usage.completion_tokens if usage else 0,
+    )
+
+
+class CompletionStream:
+    """
+    Async iterator over the content deltas of a streamed completion. Once it
+    is exhausted, `completion` holds the full text and token usage.
+    """
+
+    def __init__(self, prompt: str, timeout: Optional[float] = None, response_format: Optional[dict] = None):
+        self.prompt = prompt
+        self.timeout = timeout if timeout is not None else config.LLM_TIMEOUT_SECONDS
+        self.response_format = response_format
+        self.completion = Completion(text="")
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+        parts = []
+        lease, stream = await _start(
+            self.prompt,
+            self.timeout,
+            self.response_format,
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+        try:
+            chunks = stream.__aiter__()
+            while True:
+                try:
+                    # The deadline covers the whole stream, not each chunk
+                    chunk = await asyncio.wait_for(chunks.__anext__(), timeout=max(deadline - loop.time(), 0))
+                except StopAsyncIteration:
+                    break
+                except asyncio.TimeoutError:
+                    raise LLMTimeoutError(f"LLM completion timed out after {self.timeout} seconds")
+                if chunk.usage:
+                    self.completion.prompt_tokens = chunk.usage.prompt_tokens
+                    self.completion.completion_tokens = chunk.usage.completion_tokens
+                if chunk.choices and chunk.choices[0].delta.content:
+                    delta = chunk.choices[0].delta.content
+                    parts.append(delta)
+                    yield delta
+        finally:
+            dispatcher.release(lease)
+            await stream.close()
+            self.completion.text = "".join(parts)
+
+
+async def close_client():
+    """Close the shared clients and flush key usage (called on application shutdown)"""
+    await key_provider.close()
+    for client in _clients.values():
+        await client.close()
+    _clients.clear()
@@ -0,0 +1,333 @@
+"""
+Rate-limit-aware routing of completions across API keys.
+
+Every completion runs under a lease from the dispatcher. For each key the
+dispatcher tracks the request and token budgets OpenAI reports in its
+x-ratelimit-* response headers, charges leases that are still in flight
+against them locally, and grants the key with the most headroom left. A key
+that answers 429 cools down for the server's retry-after or an exponential
+backoff with full jitter, whichever is longer, and the request is retried on
+whatever key is best then.
+
+The dispatcher also enforces LLM_MAX_CONCURRENCY. When that is reached, or no
+key has budget left, requests wait in one queue per owner (the user a
+generation runs for, see `current_owner`) and the queues are served
+round-robin, so a user generating a large quiz cannot starve everyone else.
+"""
+import asyncio
+import random
+import re
+import time
+from collections import OrderedDict, deque
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Deque, Dict, List, Mapping, Optional, Tuple
+
+from api_keys import ApiKey, NoApiKeyError, key_provider
+from config import config
+
+# Set to the user ID at the start of a generation; tasks it spawns inherit it
+current_owner: ContextVar[str] = ContextVar("llm_owner", default="")
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """Seconds in an x-ratelimit-reset-* value ("20ms", "1.5s", "6m0s") or a plain number"""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    scale = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+    return sum(float(amount) * scale[unit] for amount, unit in parts)
+
+
+def retry_after_seconds(headers: Mapping[str, str]) -> Optional[float]:
+    if headers.get("retry-after-ms"):
+        return float(headers["retry-after-ms"]) / 1000
+    return parse_duration(headers.get("retry-after"))
+
+
+def backoff_delay(attempt: int) -> float:
+    """Exponential backoff with full jitter for the `attempt`-th consecutive failure"""
+    ceiling = min(config.LLM_BACKOFF_MAX_SECONDS, config.LLM_BACKOFF_BASE_SECONDS * 2 ** (attempt - 1))
+    return random.uniform(0, ceiling)
+
+
+@dataclass
+class Budget:
+    """
+    A request or token budget as last reported by the API. OpenAI refills
+    budgets continuously; the refill rate follows from how long the reported
+    remainder takes to reset to the limit. The remainder is rounded down, so
+    the rate is taken as the lowest one consistent with the headers.
+    """
+    limit: float
+    remaining: float
+    rate: float
+    updated_at: float
+
+    @classmethod
+    def from_headers(cls, limit: float, remaining: float, reset: Optional[float], now: float) -> "Budget":
+        if reset and remaining + 1 < limit:
+            rate = (limit - remaining - 1) / reset
+        else:
+            rate = limit / 60
+        return cls(limit=limit, remaining=remaining, rate=rate, updated_at=now)
+
+    def refill(self, now: float):
+        self.remaining = min(self.limit, self.remaining + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def cost(self, amount: float) -> float:
+        # A request larger than the whole budget can still run once the budget is full
+        return min(amount, self.limit)
+
+    def seconds_until(self, amount: float, now: float) -> float:
+        self.refill(now)
+        return max(0.0, (self.cost(amount) - self.remaining) / self.rate) if self.rate else 0.0
+
+
+@dataclass
+class KeyState:
+    """What the dispatcher knows about one key's rate limits"""
+    requests: Optional[Budget] = None
+    tokens: Optional[Budget] = None
+    cooldown_until: float = 0.0
+    strikes: int = 0
+    in_flight: int = 0
+    granted: int = 0
+    granted_tokens: int = 0
+    rate_limited: int = 0
+
+    def _charges(self, tokens: int):
+        return [(budget, amount) for budget, amount in ((self.requests, 1), (self.tokens, tokens)) if budget is not None]
+
+    def headroom(self, tokens: int, now: float) -> Optional[float]:
+        """Smallest fraction of a budget left after this request, or None if it does not fit"""
+        if now < self.cooldown_until:
+            return None
+        fractions = [1.0]
+        for budget, amount in self._charges(tokens):
+            budget.refill(now)
+            if budget.remaining < budget.cost(amount):
+                return None
+            fractions.append((budget.remaining - budget.cost(amount)) / max(budget.limit, 1))
+        return min(fractions)
+
+    def available_at(self, tokens: int, now: float) -> float:
+        """Earliest time this key could take the request, assuming nothing else changes"""
+        waits = [budget.seconds_until(amount, now) for budget, amount in self._charges(tokens)]
+        return max(now + max(waits, default=0.0), self.cooldown_until)
+
+    def reserve(self, tokens: int):
+        self.granted += 1
+        self.granted_tokens += tokens
+        self.in_flight += 1
+        for budget, amount in self._charges(tokens):
+            budget.remaining -= budget.cost(amount)
+
+    def observe(self, headers: Mapping[str, str], lease: "KeyLease", now: float, succeeded: bool = True):
+        """
+        Adopt the budgets reported on the response to `lease`. They describe
+        the key when that request reached the API, so requests granted since
+        then are charged again on top.
+        """
+        later = {"requests": self.granted - lease.granted_before, "tokens": self.granted_tokens - lease.granted_tokens_before}
+        for name in ("requests", "tokens"):
+            limit = headers.get(f"x-ratelimit-limit-{name}")
+            remaining = headers.get(f"x-ratelimit-remaining-{name}")
+            if limit is None or remaining is None:
+                continue
+            reset = parse_duration(headers.get(f"x-ratelimit-reset-{name}"))
+            budget = Budget.from_headers(float(limit), float(remaining), reset, lease.granted_at)
+            budget.remaining -= budget.cost(later[name]) if name == "tokens" else later[name]
+            budget.refill(now)
+            setattr(self, name, budget)
+        if succeeded:
+            self.strikes = 0
+
+    def back_off(self, retry_after: Optional[float], now: float):
+        self.rate_limited += 1
+        self.strikes += 1
+        delay = backoff_delay(self.strikes)
+        if retry_after is not None:
+            # Spread the retries of everything that hit the limit at once
+            delay = max(delay, retry_after * random.uniform(1.0, 1.2))
+        self.cooldown_until = max(self.cooldown_until, now + delay)
+
+
+@dataclass
+class KeyLease:
+    key: ApiKey
+    state: KeyState
+    tokens: int
+    granted_at: float
+    # The key's grant counters right after this lease was charged
+    granted_before: int
+    granted_tokens_before: int
+    released: bool = False
+
+
+class Dispatcher:
+    """Process-wide key router and fair queue; see the module docstring"""
+
+    def __init__(self):
+        self._keys: List[ApiKey] = []
+        self._states: Dict[str, KeyState] = {}
+        self._queues: "OrderedDict[str, Deque[Tuple[asyncio.Future, int]]]" = OrderedDict()
+        self._in_flight = 0
+        self._rotation = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.queued = 0
+
+    def _state(self, key: ApiKey) -> KeyState:
+        state = self._states.get(key.value)
+        if state is None:
+            state = self._states[key.value] = KeyState()
+        return state
+
+    def _pick(self, tokens: int, now: float) -> Optional[ApiKey]:
+        """The key with the most headroom for `tokens`, rotating among equals"""
+        if self._in_flight >= config.LLM_MAX_CONCURRENCY:
+            return None
+        best, best_index, best_room = None, 0, -1.0
+        for offset in range(len(self._keys)):
+            index = (self._rotation + offset) % len(self._keys)
+            key = self._keys[index]
+            room = self._state(key).headroom(tokens, now)
+            if room is None or key.wait_time(now) > 0:
+                continue
+            if room > best_room:
+                best, best_index, best_room = key, index, room
+        if best is not None:
+            self._rotation = best_index + 1
+        return best
+
+    def _grant(self, key: ApiKey, tokens: int, now: float) -> KeyLease:
+        key.try_take(now)
+        key_provider.record_use(key)
+        state = self._state(key)
+        state.reserve(tokens)
+        self._in_flight += 1
+        return KeyLease(
+            key=key,
+            state=state,
+            tokens=tokens,
+            granted_at=now,
+            granted_before=state.granted,
+            granted_tokens_before=state.granted_tokens,
+        )
+
+    async def acquire(self, tokens: int) -> KeyLease:
+        """Lease the best key for a request of about `tokens` tokens, waiting fairly if none has room"""
+        self._keys = await key_provider.keys()
+        if not self._keys:
+            raise NoApiKeyError("No OpenAI API key configured (set OPENAI_API_KEY or add one with add_api_key.py)")
+        now = time.monotonic()
+        if not self._queues:
+            key = self._pick(tokens, now)
+            if key is not None:
+                return self._grant(key, tokens, now)
+
+        owner = current_owner.get()
+        waiter = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(owner, deque()).append((waiter, tokens))
+        self.queued += 1
+        self._dispatch()
+        try:
+            return await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release(waiter.result())
+            self._discard(owner, waiter)
+            raise
+
+    def _discard(self, owner: str, waiter: asyncio.Future):
+        queue = self._queues.get(owner)
+        if queue is None:
+            return
+        remaining = deque(entry for entry in queue if entry[0] is not waiter)
+        if remaining:
+            self._queues[owner] = remaining
+        else:
+            del self._queues[owner]
+
+    def _dispatch(self):
+        """Grant queued requests, one owner at a time, while keys have room"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        now = time.monotonic()
+        while self._queues:
+            owner, queue = next(iter(self._queues.items()))
+            waiter, tokens = queue[0]
+            if waiter.done():
+                queue.popleft()
+                if not queue:
+                    del self._queues[owner]
+                continue
+            key = self._pick(tokens, now)
+            if key is None:
+                break
+            queue.popleft()
+            # The owner just served moves to the back of the line
+            del self._queues[owner]
+            if queue:
+                self._queues[owner] = queue
+            waiter.set_result(self._grant(key, tokens, now))
+
+        if self._queues and self._in_flight < config.LLM_MAX_CONCURRENCY and self._keys:
+            # Every key is out of budget: look again when the first one has room
+            _, queue = next(iter(self._queues.items()))
+            tokens = queue[0][1]
+            ready_at = min(
+                max(self._state(key).available_at(tokens, now), now + key.wait_time(now))
+                for key in self._keys
+            )
+            self._timer = asyncio.get_running_loop().call_later(max(ready_at - now, 0.01), self._dispatch)
+
+    def observe(self, lease: KeyLease, headers: Mapping[str, str]):
+        lease.state.observe(headers, lease, time.monotonic())
+
+    def rate_limited(self, lease: KeyLease, headers: Mapping[str, str]):
+        now = time.monotonic()
+        lease.state.observe(headers, lease, now, succeeded=False)
+        lease.state.back_off(retry_after_seconds(headers), now)
+
+    def release(self, lease: KeyLease):
+        if lease.released:
+            return
+        lease.released = True
+        lease.state.in_flight -= 1
+        self._in_flight -= 1
+        if self._queues:
+            self._dispatch()
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            "in_flight": self._in_flight,
+            "waiting": sum(len(queue) for queue in self._queues.values()),
+            "waiting_owners": len(self._queues),
+            "queued_total": self.queued,
+            "keys": {
+                key.label: {
+                    "remaining_requests": int(self._state(key).requests.remaining) if self._state(key).requests else None,
+                    "remaining_tokens": int(self._state(key).tokens.remaining) if self._state(key).tokens else None,
+                    "cooling_down_seconds": round(max(self._state(key).cooldown_until - now, 0), 3),
+                    "in_flight": self._state(key).in_flight,
+                    "granted": self._state(key).granted,
+                    "rate_limited": self._state(key).rate_limited,
+                }
+                for key in self._keys
+            },
+        }
+
+
+dispatcher = Dispatcher()
@@ -1,38 +1,44 @@
+import asyncio
+import hashlib
 import os
 import re
 import secrets
 
-from fastapi import FastAPI, UploadFile, File, HTTPException, Form, Depends, status, Request
+from fastapi import FastAPI, UploadFile, File, HTTPException, Form, Depends, status, Request, Response, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 import traceback
-from openai import OpenAI
-import PyPDF2
-import io
+from contextlib import asynccontextmanager
 import json
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple, Union
 from datetime import datetime, timedelta
-from auth import get_password_hash, verify_password, create_access_token, decode_access_token
+from auth import create_access_token, decode_access_token_payload, PasswordHashPool, HashingPoolFullError
 from pydantic import BaseModel, Field, BeforeValidator
 from typing_extensions import Annotated
-from pymongo import MongoClient
 from bson import ObjectId
 from config import config
+import db
+import llm
+from api_keys import key_provider
+from llm_dispatcher import dispatcher
+from quiz_generation import GenerationRequest, GenerationInputError, create_quiz, stream_quiz
+from cache import TTLCache, ByteLRUCache
+from answer_key import InvalidAnswerError, build_answer_key, grade, indices_from_mask, selection_masks
+from ingest import SpooledUpload, spool_upload, shutdown_pdf_executor, UploadTooLargeError, PdfExtractionError
+from worker import start_workers
+from bank_refill import start_refill
+import question_bank
+import user_stats
+from generation_cache import normalize_difficulty
+from pagination import NEXT_CURSOR_HEADER, InvalidCursorError, encode_cursor, keyset_filter
 
 # Configuration for JWT
 SECRET_KEY = "your-super-secret-key-please-change-me" # WARNING: Hardcoded for user request. CHANGE THIS IN PRODUCTION!
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 30 # 30 days
 
-# MongoDB connection
-client = MongoClient(config.MONGO_URI)
-database = client[config.DATABASE_NAME]
-users_collection = database["users"]
-quizzes_collection = database["quizzes"]
-questions_collection = database["questions"]
-quiz_attempts_collection = database["quiz_attempts"]
-user_answers_collection = database["user_answers"]
-
 # Pydantic's ObjectId type for MongoDB
 PyObjectId = Annotated[str, BeforeValidator(str)]
 
@@ -125,11 +131,28 @@ class UserAnswerModel(BaseModel):
         json_encoders = {ObjectId: str}
 
 class QuizSubmission(BaseModel):
-    answers: dict
+    # Question ID -> selected option indices (0 = A); option texts are still accepted
+    answers: Dict[str, List[Union[int, str]]]
     start_time: Optional[str] = None
     time_taken_seconds: Optional[float] = None
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    stop_workers = asyncio.Event()
+    workers = start_workers(config.JOB_INPROCESS_WORKERS, stop_workers) if config.JOB_INPROCESS_WORKERS > 0 else []
+    if config.QUESTION_BANK_ENABLED and config.QUESTION_BANK_INPROCESS_REFILL:
+        workers += start_refill(stop_workers)
+    yield
+    stop_workers.set()
+    for task in workers:
+        task.cancel()
+    await asyncio.gather(*workers, return_exceptions=True)
+    password_pool.shutdown()
+    shutdown_pdf_executor()
+    await llm.close_client()
+    await db.close()
+
+app = FastAPI(lifespan=lifespan)
 
 # OAuth2PasswordBearer for token extraction from requests
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
@@ -141,39 +164,72 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, "ETag"],
+)
+
+# bcrypt runs on its own bounded pool; when it is saturated requests get a
+# 503 with Retry-After instead of queueing behind the login storm.
+password_pool = PasswordHashPool(
+    workers=config.PASSWORD_HASH_WORKERS,
+    queue_limit=config.PASSWORD_HASH_QUEUE_LIMIT,
+    kind=config.PASSWORD_HASH_POOL,
 )
 
-openai_client = OpenAI(api_key=config.get_openai_api_key())
+@app.exception_handler(HashingPoolFullError)
+async def hashing_pool_full_handler(request: Request, exc: HashingPoolFullError):
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Server is busy, please retry shortly"},
+        headers={"Retry-After": str(config.PASSWORD_HASH_RETRY_AFTER_SECONDS)},
+    )
+
+# Authenticated users keyed by bearer token. Entries never outlive the token
+# itself and are dropped when the user's profile changes.
+user_cache = TTLCache(maxsize=config.USER_CACHE_MAX_SIZE, ttl=config.USER_CACHE_TTL_SECONDS)
+
+# Serialized GET /quiz/{quiz_id} payloads with their ETags. Quizzes do not
+# change once generated, so entries only go away on delete, eviction or TTL.
+quiz_cache = ByteLRUCache(
+    max_bytes=config.QUIZ_CACHE_MAX_BYTES,
+    maxsize=config.QUIZ_CACHE_MAX_ENTRIES,
+    ttl=config.QUIZ_CACHE_TTL_SECONDS
+)
 
 # Dependency to get current user based on token (updated for MongoDB)
-def get_current_user(token: str = Depends(oauth2_scheme)):
-    username = decode_access_token(token, config.SECRET_KEY, config.ALGORITHM)
-    if username is None:
+async def get_current_user(token: str = Depends(oauth2_scheme)):
+    cached_user = user_cache.get(token)
+    if cached_user is not None:
+        return cached_user
+
+    payload = decode_access_token_payload(token, config.SECRET_KEY, config.ALGORITHM)
+    if payload is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid authentication credentials",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    user_doc = users_collection.find_one({"username": username})
+    user_doc = await db.find_user_by_username(payload["sub"])
     if user_doc is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Could not validate credentials",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    return UserResponse(**user_doc)
+    user = UserResponse(**user_doc)
+    user_cache.set(token, user, expires_at=payload.get("exp"))
+    return user
 
 @app.post("/signup", response_model=UserResponse)
-def signup(user: UserCreate):
+async def signup(user: UserCreate):
     try:
         # Check if username or email already exists
-        if users_collection.find_one({"username": user.username}):
+        if await db.find_user_by_username(user.username):
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Username already registered")
-        if users_collection.find_one({"email": user.email}):
+        if await db.find_user_by_email(user.email):
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Email already registered")
         
         # Hash password and create user document
-        hashed_password = get_password_hash(user.password)
+        hashed_password = await password_pool.hash(user.password)
         user_doc = {
             "username": user.username,
             "email": user.email,
@@ -183,25 +239,36 @@ def signup(user: UserCreate):
         }
         
         # Insert user into MongoDB
-        result = users_collection.insert_one(user_doc)
-        new_user = users_collection.find_one({"_id": result.inserted_id})
+        user_id = await db.insert_user(user_doc)
+        new_user = await db.find_user_by_id(user_id)
         
         return UserResponse(**new_user)
+    except (HTTPException, HashingPoolFullError):
+        raise
     except Exception as e:
         print(f"Error in signup: {str(e)}")
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/token", response_model=Token)
-def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
     try:
-        user_doc = users_collection.find_one({"username": form_data.username})
-        if not user_doc or not verify_password(form_data.password, user_doc["hashed_password"]):
+        user_doc = await db.find_user_by_username(form_data.username)
+        password_ok, new_hash = False, None
+        if user_doc:
+            if config.PASSWORD_REHASH_ON_LOGIN:
+                password_ok, new_hash = await password_pool.verify_and_update(form_data.password, user_doc["hashed_password"])
+            else:
+                password_ok = await password_pool.verify(form_data.password, user_doc["hashed_password"])
+        if not password_ok:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Incorrect username or password",
                 headers={"WWW-Authenticate": "Bearer"},
             )
+        if new_hash:
+            # Stored hash used an old cost factor; upgrade it while we have the plaintext
+            await db.update_user(user_doc["_id"], {"hashed_password": new_hash})
         access_token_expires = timedelta(minutes=config.ACCESS_TOKEN_EXPIRE_MINUTES)
         access_token = create_access_token(
             data={"sub": user_doc["username"]},
@@ -219,13 +286,15 @@ def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
             "created_at": user_doc.get("created_at"),
             "preferences": user_doc.get("preferences", {})
         }
+    except (HTTPException, HashingPoolFullError):
+        raise
     except Exception as e:
         print(f"Error in login_for_access_token: {str(e)}")
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.put("/users/{username}", response_model=UserResponse)
-def update_user_profile(
+async def update_user_profile(
     username: str,
     user_update: UserUpdate,
     current_user: UserResponse = Depends(get_current_user)
@@ -233,19 +302,19 @@ def update_user_profile(
     if current_user.username != username:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized to update this profile")
 
-    user_doc = users_collection.find_one({"username": username})
+    user_doc = await db.find_user_by_username(username)
     if not user_doc:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
 
     update_fields = {}
 
     if user_update.username is not None and user_update.username != user_doc.get("username"):
-        if users_collection.find_one({"username": user_update.username}):
+        if await db.find_user_by_username(user_update.username):
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Username already taken")
         update_fields["username"] = user_update.username
     
     if user_update.email is not None and user_update.email != user_doc.get("email"):
-        if users_collection.find_one({"email": user_update.email}):
+        if await db.find_user_by_email(user_update.email):
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Email already taken")
         update_fields["email"] = user_update.email
 
@@ -256,213 +325,241 @@ def update_user_profile(
         if not user_update.current_password:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Current password is required to change password")
         
-        if not verify_password(user_update.current_password, user_doc["hashed_password"]):
+        if not await password_pool.verify(user_update.current_password, user_doc["hashed_password"]):
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Incorrect current password")
         
         # Add password strength validation here if desired (e.g., regex)
         
-        update_fields["hashed_password"] = get_password_hash(user_update.new_password)
+        update_fields["hashed_password"] = await password_pool.hash(user_update.new_password)
     
     if not update_fields:
         return UserResponse(**user_doc) # No changes, return current user info
 
-    users_collection.update_one(
-        {"_id": user_doc["_id"]},
-        {"$set": update_fields}
-    )
+    await db.update_user(user_doc["_id"], update_fields)
+    user_cache.invalidate_where(lambda cached_user: cached_user.id == str(user_doc["_id"]))
 
-    updated_user_doc = users_collection.find_one({"_id": user_doc["_id"]})
+    updated_user_doc = await db.find_user_by_id(user_doc["_id"])
     return UserResponse(**updated_user_doc)
 
-def extract_text_from_pdf(pdf_content: bytes) -> str:
-    try:
-        # Create a BytesIO object from the PDF content
-        pdf_file = io.BytesIO(pdf_content)
-        
-        # Create a PDF reader object
-        pdf_reader = PyPDF2.PdfReader(pdf_file)
+async def read_generation_request(request: Request) -> Tuple[GenerationRequest, Optional[SpooledUpload]]:
+    """Parse a JSON (subject) or multipart (file) generation request, spooling any upload to disk"""
+    content_type = request.headers.get("Content-Type", "")
+    generation_request = GenerationRequest() # Default values
+
+    print(f"Content-Type: {content_type}")
+
+    if "application/json" in content_type:
+        data = await request.json()
+        generation_request.subject = data.get("subject")
+        generation_request.num_questions = data.get("num_questions", generation_request.num_questions)
+        generation_request.difficulty = data.get("difficulty", generation_request.difficulty)
+        generation_request.fresh = bool(data.get("fresh", False))
+        print(f"Received JSON request: subject={generation_request.subject}, num_questions={generation_request.num_questions}, difficulty={generation_request.difficulty}")
+
+        if not generation_request.subject:
+            raise HTTPException(status_code=400, detail="Subject is required for subject-based quiz generation")
+        return generation_request, None
+
+    if "multipart/form-data" in content_type:
+        form = await request.form()
+        print(f"Form data keys: {list(form.keys())}")
         
-        # Extract text from each page
-        text = ""
-        for page in pdf_reader.pages:
-            text += page.extract_text() + "\n"
+        file = form.get("file")
+        print(f"File object type: {type(file)}")
         
-        if not text.strip():
-            raise ValueError("No text could be extracted from the PDF")
-            
-        return text
-    except Exception as e:
-        print(f"Error extracting text from PDF: {str(e)}")
-        raise HTTPException(status_code=400, detail=f"Error processing PDF: {str(e)}")
+        if file and hasattr(file, 'filename') and hasattr(file, 'read'):
+            # It's an UploadFile object
+            generation_request.file_name = file.filename
+            generation_request.difficulty = form.get("difficulty", generation_request.difficulty)
+            generation_request.fresh = str(form.get("fresh", "false")).lower() == "true"
+            try:
+                generation_request.num_questions = int(form.get("num_questions", generation_request.num_questions))
+                generation_request.page_start = int(form["page_start"]) if form.get("page_start") else None
+                generation_request.page_end = int(form["page_end"]) if form.get("page_end") else None
+            except ValueError:
+                raise HTTPException(status_code=400, detail="num_questions, page_start and page_end must be whole numbers")
+            print(f"Received file upload: filename={generation_request.file_name}, num_questions={generation_request.num_questions}, difficulty={generation_request.difficulty}")
 
-def parse_quiz_response(quiz_text: str) -> list:
-    """Parse the quiz response from OpenAI into structured data."""
-    questions = []
-    current_question = None
-    current_options = []
-    current_correct_answers = None
-    
-    for line in quiz_text.split('\n'):
-        line = line.strip()
-        if not line:
-            continue
-            
-        # Check for question number
-        if line[0].isdigit() and '. ' in line:
-            if current_question:
-                questions.append({
-                    'question': current_question,
-                    'options': current_options,
-                    'correct_answers': current_correct_answers
-                })
-            current_question = line.split('. ', 1)[1]
-            current_options = []
-            current_correct_answers = None
-        # Check for options
-        elif line.startswith(('A.', 'B.', 'C.', 'D.')):
-            option_text = line.split('. ', 1)[1]
-            current_options.append(option_text)
-        # Check for correct answers
-        elif line.startswith('**Correct Answers:'):
-            match = re.search(r'\b[A-D](?:, [A-D])*\b', line)
-            if match:
-                answers_str = match.group(0)
-                current_correct_answers = [ans.strip() for ans in answers_str.split(',')]
-            else:
-                current_correct_answers = [] # Handle cases where no valid answers are found
-    
-    # Add the last question
-    if current_question:
-        questions.append({
-            'question': current_question,
-            'options': current_options,
-            'correct_answers': current_correct_answers
-        })
-    
-    return questions
+            upload = await spool_upload(file, config.UPLOAD_MAX_BYTES)
+            if upload.size == 0:
+                upload.cleanup()
+                raise HTTPException(status_code=400, detail="Empty file uploaded")
+            return generation_request, upload
+
+        print(f"File not found in form data. Available keys: {list(form.keys())}")
+        raise HTTPException(status_code=400, detail="File not provided in form data")
+
+    raise HTTPException(status_code=400, detail=f"Unsupported content type: {content_type}")
 
 @app.post("/generate-quiz")
 async def generate_quiz(
     request: Request,
+    mode: str = Query("sync", pattern="^(sync|job)$"),
     current_user: UserResponse = Depends(get_current_user),
 ):
-    try:
-        content_type = request.headers.get("Content-Type", "")
-        
-        num_questions: int = 5 # Default values
-        difficulty: str = "medium" # Default values
-        
-        file_content: Optional[bytes] = None
-        file_name: Optional[str] = None
-        subject: Optional[str] = None
-
-        print(f"Content-Type: {content_type}")
+    """
+    Generate a quiz from a subject (JSON) or an uploaded file (multipart).
 
-        if "application/json" in content_type:
-            data = await request.json()
-            subject = data.get("subject")
-            num_questions = data.get("num_questions", num_questions)
-            difficulty = data.get("difficulty", difficulty)
-            print(f"Received JSON request: subject={subject}, num_questions={num_questions}, difficulty={difficulty}")
-
-            if not subject:
-                raise HTTPException(status_code=400, detail="Subject is required for subject-based quiz generation")
-
-        elif "multipart/form-data" in content_type:
-            form = await request.form()
-            print(f"Form data keys: {list(form.keys())}")
-            
-            file = form.get("file")
-            print(f"File object type: {type(file)}")
-            
-            if file and hasattr(file, 'filename') and hasattr(file, 'read'):
-                # It's an UploadFile object
-                file_content = await file.read()
-                file_name = file.filename
-                num_questions = int(form.get("num_questions", num_questions))
-                difficulty = form.get("difficulty", difficulty)
-                print(f"Received file upload: filename={file_name}, num_questions={num_questions}, difficulty={difficulty}")
-
-                if not file_content:
-                    raise HTTPException(status_code=400, detail="Empty file uploaded")
-            else:
-                print(f"File not found in form data. Available keys: {list(form.keys())}")
-                raise HTTPException(status_code=400, detail="File not provided in form data")
-        else:
-            raise HTTPException(status_code=400, detail=f"Unsupported content type: {content_type}")
+    With `mode=job` the request is queued instead: the response is a 202 with
+    a job ID that can be polled at /jobs/{job_id} or followed through
+    /jobs/{job_id}/events, and a worker process does the generation.
+    """
+    upload = None # Spooled to a temporary file, never held in memory whole
+    try:
+        generation_request, upload = await read_generation_request(request)
 
-        prompt = ""
-        source_identifier = ""
-        
-        if file_content and file_name:
-            if file_name.lower().endswith('.pdf'):
-                print(f"Processing PDF file: {file_name}")
-                file_text = extract_text_from_pdf(file_content)
-            else:
-                print(f"Processing text file: {file_name}")
-                try:
-                    file_text = file_content.decode("utf-8")
-                except UnicodeDecodeError:
-                    raise HTTPException(status_code=400, detail="Invalid text file encoding. Please use UTF-8 encoding.")
-            
-            if not file_text.strip():
-                raise HTTPException(status_code=400, detail="No text content could be extracted from the file")
-                
-            print(f"Extracted text length: {len(file_text)} characters")
-            prompt = f"Generate {num_questions} multiple-select quiz questions (MSQ) with options and correct answers based on the following text: {file_text}\n\nDifficulty: {difficulty}.\n\nFor each question, provide the question, four options (A, B, C, D), and then list ALL correct answer labels (e.g., A, C) on a new line starting with **Correct Answers:**. Use Markdown format.\n\nExample:\n1. Which of the following are primary colors?\nA. Red\nB. Blue\nC. Green\nD. Yellow\n**Correct Answers:** A, B\n\n2. Which of these animals lay eggs?\nA. Chicken\nB. Cow\nC. Snake\nD. Dog\n**Correct Answers:** A, C"
-            source_identifier = f"Quiz from {file_name}"
-        elif subject:
-            print(f"Generating quiz for subject: {subject}")
-            prompt = f"Generate {num_questions} multiple-select quiz questions (MSQ) with options and correct answers about the subject: {subject}\n\nDifficulty: {difficulty}.\n\nFor each question, provide the question, four options (A, B, C, D), and then list ALL correct answer labels (e.g., A, C) on a new line starting with **Correct Answers:**. Use Markdown format.\n\nExample:\n1. Which of the following are primary colors?\nA. Red\nB. Blue\nC. Green\nD. Yellow\n**Correct Answers:** A, B\n\n2. Which of these animals lay eggs?\nA. Chicken\nB. Cow\nC. Snake\nD. Dog\n**Correct Answers:** A, C"
-            source_identifier = f"Quiz on {subject}"
-        else:
-            raise HTTPException(status_code=400, detail="Either a file or a subject must be provided")
+        if mode == "job":
+            job_id = await db.enqueue_generation_job(
+                ObjectId(current_user.id),
+                generation_request.to_doc(),
+                upload.path if upload else None,
+                upload.sha256 if upload else None
+            )
+            return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content={
+                "job_id": str(job_id),
+                "status": "queued",
+                "status_url": f"/jobs/{job_id}",
+                "events_url": f"/jobs/{job_id}/events"
+            })
 
-        response = openai_client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[{"role": "user", "content": prompt}]
-        )
-        quiz_text = response.choices[0].message.content
-        
-        parsed_questions = parse_quiz_response(quiz_text)
-        
-        # Save quiz to MongoDB
-        quiz_doc = {
-            "title": source_identifier,
-            "source_file": file_name if file_name else "N/A",
-            "difficulty": difficulty,
-            "num_questions": num_questions,
-            "created_at": datetime.utcnow()
-        }
-        result = quizzes_collection.insert_one(quiz_doc)
-        quiz_id = result.inserted_id
-
-        # Save questions to MongoDB
-        questions_with_ids = []
-        for i, question_data in enumerate(parsed_questions):
-            question_doc = {
-                "quiz_id": quiz_id,
-                "question_text": question_data['question'],
-                "options": question_data['options'],
-                "correct_answers": question_data['correct_answers'],
-                "order": i + 1
-            }
-            result = questions_collection.insert_one(question_doc)
-            question_data['id'] = str(result.inserted_id) 
-            questions_with_ids.append(question_data)
-        
-        return {
-            "quiz": quiz_text,
-            "quiz_id": str(quiz_id),
-            "parsed_questions": questions_with_ids # Return questions with IDs
-        }
+        return await create_quiz(ObjectId(current_user.id), generation_request, upload)
+    except HTTPException:
+        raise
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+    except PdfExtractionError as e:
+        print(f"Error extracting text from PDF: {str(e)}")
+        raise HTTPException(status_code=400, detail=f"Error processing PDF: {str(e)}")
+    except GenerationInputError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except llm.LLMTimeoutError as e:
+        print(f"Error in generate_quiz: {str(e)}")
+        raise HTTPException(status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail=str(e))
     except Exception as e:
         print(f"Error in generate_quiz: {str(e)}")
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if upload:
+            upload.cleanup()
+
+@app.post("/generate-quiz/stream")
+async def generate_quiz_stream(
+    request: Request,
+    current_user: UserResponse = Depends(get_current_user),
+):
+    """
+    Streamed variant of /generate-quiz. Takes the same JSON or multipart body
+    and responds with newline-delimited JSON: a `quiz` line once the quiz is
+    created, a `question` line for each question as soon as the model has
+    finished it (already stored, with its ID), then `done`. Failures after the
+    stream has started arrive as an `error` line with a `status` code.
+    """
+    try:
+        generation_request, upload = await read_generation_request(request)
+    except HTTPException:
+        raise
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+    except Exception as e:
+        print(f"Error in generate_quiz_stream: {str(e)}")
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+    async def events():
+        try:
+            async for event in stream_quiz(ObjectId(current_user.id), generation_request, upload):
+                yield json.dumps(event) + "\n"
+        except (GenerationInputError, PdfExtractionError) as e:
+            yield json.dumps({"type": "error", "status": 400, "detail": str(e)}) + "\n"
+        except UploadTooLargeError as e:
+            yield json.dumps({"type": "error", "status": 413, "detail": str(e)}) + "\n"
+        except llm.LLMTimeoutError as e:
+            yield json.dumps({"type": "error", "status": 504, "detail": str(e)}) + "\n"
+        except Exception as e:
+            print(f"Error in generate_quiz_stream: {str(e)}")
+            traceback.print_exc()
+            yield json.dumps({"type": "error", "status": 500, "detail": str(e)}) + "\n"
+        finally:
+            if upload:
+                upload.cleanup()
+
+    return StreamingResponse(events(), media_type="application/x-ndjson", headers={"Cache-Control": "no-cache"})
+
+def serialize_job(job_doc: dict) -> dict:
+    return {
+        "job_id": str(job_doc["_id"]),
+        "status": job_doc["status"],
+        "progress": job_doc.get("progress"),
+        "attempts": job_doc.get("attempts", 0),
+        "quiz_id": job_doc["result"]["quiz_id"] if job_doc.get("result") else None,
+        "error": job_doc.get("error"),
+        "created_at": job_doc["created_at"].isoformat(),
+        "updated_at": job_doc["updated_at"].isoformat()
+    }
+
+async def get_owned_job(job_id: str, current_user: UserResponse) -> dict:
+    if not ObjectId.is_valid(job_id):
+        raise HTTPException(status_code=404, detail="Job not found")
+    job_doc = await db.find_generation_job(ObjectId(job_id))
+    if not job_doc:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job_doc["user_id"] != ObjectId(current_user.id):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized to view this job")
+    return job_doc
+
+@app.get("/jobs/{job_id}")
+async def get_generation_job(
+    job_id: str,
+    current_user: UserResponse = Depends(get_current_user),
+):
+    return serialize_job(await get_owned_job(job_id, current_user))
+
+@app.get("/jobs/{job_id}/events")
+async def stream_generation_job_events(
+    job_id: str,
+    request: Request,
+    current_user: UserResponse = Depends(get_current_user),
+):
+    """Server-Sent Events: a `progress` event on every change, then `done` or `failed`"""
+    job_doc = await get_owned_job(job_id, current_user)
+
+    async def events():
+        last_payload = None
+        current = job_doc
+        while True:
+            payload = serialize_job(current)
+            if payload != last_payload:
+                last_payload = payload
+                if payload["status"] == "succeeded":
+                    yield f"event: done\ndata: {json.dumps(payload)}\n\n"
+                    return
+                if payload["status"] == "failed":
+                    yield f"event: failed\ndata: {json.dumps(payload)}\n\n"
+                    return
+                yield f"event: progress\ndata: {json.dumps(payload)}\n\n"
+            if await request.is_disconnected():
+                return
+            await asyncio.sleep(config.JOB_EVENTS_POLL_SECONDS)
+            current = await db.find_generation_job(job_doc["_id"])
+            if current is None:
+                return
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+async def quiz_answer_key(quiz_doc: dict, question_docs: List[dict]) -> dict:
+    """
+    The answer key compiled when the quiz was generated; quizzes stored before
+    keys existed get theirs built and saved now.
+    """
+    answer_key = quiz_doc.get("answer_key")
+    if not answer_key or answer_key["question_ids"] != [q["_id"] for q in question_docs]:
+        answer_key = build_answer_key(question_docs)
+        await db.update_quiz(quiz_doc["_id"], {"answer_key": answer_key})
+    return answer_key
 
 @app.post("/quiz/{quiz_id}/submit")
-def submit_quiz(
+async def submit_quiz(
     quiz_id: str,
     submission: QuizSubmission,
     current_user: UserResponse = Depends(get_current_user),
@@ -471,12 +568,10 @@ def submit_quiz(
     print(f"Time taken: {submission.time_taken_seconds} seconds")
     try:
         quiz_obj_id = ObjectId(quiz_id)
-        quiz_doc = quizzes_collection.find_one({"_id": quiz_obj_id})
+        quiz_doc, question_docs = await db.find_quiz_with_questions(quiz_obj_id)
         if not quiz_doc:
             raise HTTPException(status_code=404, detail="Quiz not found")
         
-        question_docs = list(questions_collection.find({"quiz_id": quiz_obj_id}))
-        
         # Calculate time taken
         completed_at = datetime.utcnow()
         
@@ -492,61 +587,49 @@ def submit_quiz(
         else:
             time_taken = 0.0
 
-        # Create quiz attempt
-        quiz_attempt_doc = {
-            "user_id": ObjectId(current_user.id), # Ensure user_id is stored as ObjectId
-            "quiz_id": quiz_obj_id,
-            "total_questions": len(question_docs),
-            "correct_answers": 0,
-            "score": 0.0,
-            "completed_at": completed_at,
-            "time_taken_seconds": time_taken # Store time taken
-        }
-        result = quiz_attempts_collection.insert_one(quiz_attempt_doc)
-        attempt_id = result.inserted_id
-        
-        results = []
-        correct_count = 0
-        
-        for question_doc in question_docs:
-            question_id_str = str(question_doc["_id"])
-            user_answer = submission.answers.get(question_id_str, [])
+        answer_key = await quiz_answer_key(quiz_doc, question_docs)
+        options_by_question = {q["_id"]: q["options"] for q in question_docs}
+        try:
+            submitted_masks = selection_masks(answer_key, submission.answers, options_by_question)
+        except InvalidAnswerError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        correctness = grade(answer_key["masks"], submitted_masks)
+        correct_count = sum(correctness)
 
-            # Map options letters (A, B, C, D) to their full text content
-            option_map = {chr(65 + i): option_text for i, option_text in enumerate(question_doc["options"])}
-            
-            # Convert correct_answers (e.g., ['A', 'C']) to their text content (e.g., ["Red", "Green"])
-            correct_answer_texts = [option_map[key] for key in question_doc["correct_answers"]]
-            
-            # Compare user's selected answers (text content) with correct answer texts
-            is_correct = set(user_answer) == set(correct_answer_texts)
-            
-            if is_correct:
-                correct_count += 1
-            
-            # Save user answer
-            user_answer_doc = {
-                "question_id": question_doc["_id"],
-                "quiz_attempt_id": attempt_id,
-                "selected_answers": user_answer,
-                "is_correct": is_correct,
-                "created_at": datetime.utcnow()
-            }
-            user_answers_collection.insert_one(user_answer_doc)
-            
+        results = []
+        for question_doc, is_correct, selected_mask, correct_mask in zip(question_docs, correctness, submitted_masks, answer_key["masks"]):
+            options = question_doc["options"]
+            selected_options = indices_from_mask(selected_mask)
+            correct_options = indices_from_mask(correct_mask)
             results.append({
-                "question_id": question_id_str,
+                "question_id": str(question_doc["_id"]),
                 "is_correct": is_correct,
-                "user_answer": user_answer,
-                "correct_answers": correct_answer_texts # Return text content for correct answers
+                "user_answer": [options[i] for i in selected_options],
+                "correct_answers": [options[i] for i in correct_options if i < len(options)], # Return text content for correct answers
+                "selected_options": selected_options,
+                "correct_options": correct_options
             })
         
-        # Update quiz attempt with final score
         score = (correct_count / len(question_docs)) * 100 if len(question_docs) > 0 else 0.0
-        quiz_attempts_collection.update_one(
-            {"_id": attempt_id},
-            {"$set": {"correct_answers": correct_count, "score": score}}
-        )
+        attempt_id = ObjectId()
+        quiz_attempt_doc = {
+            "_id": attempt_id,
+            "user_id": ObjectId(current_user.id), # Ensure user_id is stored as ObjectId
+            "quiz_id": quiz_obj_id,
+            # Counted in the user's stats per difficulty (see user_stats.py)
+            "difficulty": user_stats.difficulty_key(quiz_doc.get("difficulty")),
+            # Lets the question bank find the subject quizzes a user attempted;
+            # None for file quizzes, so the stats backfill sees them as tagged
+            "subject_key": quiz_doc.get("subject_key"),
+            "total_questions": len(question_docs),
+            "correct_answers": correct_count,
+            "score": score,
+            "completed_at": completed_at,
+            "time_taken_seconds": time_taken, # Store time taken
+            # One byte per question in quiz order: the selected options as a bitmask
+            "answer_masks": submitted_masks
+        }
+        await db.insert_attempt(quiz_attempt_doc)
         
         return {
             "quiz_id": quiz_id,
@@ -557,59 +640,118 @@ def submit_quiz(
             "correct_answers": correct_count,
             "time_taken_seconds": time_taken
         }
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error in submit_quiz: {str(e)}")
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match uses weak comparison, so W/ prefixes are ignored"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
+
+async def load_quiz_payload(quiz_obj_id: ObjectId) -> Optional[Tuple[bytes, str]]:
+    """Serialized quiz with its questions and a strong ETag, or None if there is no such quiz"""
+    quiz_doc, question_docs = await db.find_quiz_with_questions(quiz_obj_id)
+    if not quiz_doc:
+        return None
+    
+    questions_data = [
+        {
+            "id": str(q["_id"]),
+            "question": q["question_text"],
+            "options": q["options"],
+            "correct_answers": q["correct_answers"]
+        }
+        for q in question_docs
+    ]
+    
+    payload = {
+        "quiz": {
+            "id": str(quiz_doc["_id"]),
+            "title": quiz_doc["title"],
+            "difficulty": quiz_doc["difficulty"],
+            "num_questions": quiz_doc["num_questions"],
+            "created_at": quiz_doc["created_at"]
+        },
+        "questions": questions_data
+    }
+    body = json.dumps(jsonable_encoder(payload), separators=(",", ":")).encode()
+    etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+    # A quiz is still filling up while it streams; only cache it once it is final
+    if quiz_doc.get("status", "ready") != "generating":
+        quiz_cache.set(quiz_obj_id, body, etag)
+    return body, etag
+
 @app.get("/quiz/{quiz_id}")
-def get_quiz(
+async def get_quiz(
     quiz_id: str, # Changed to str for ObjectId
+    request: Request,
     current_user: UserResponse = Depends(get_current_user),
 ):
     try:
         quiz_obj_id = ObjectId(quiz_id)
-        quiz_doc = quizzes_collection.find_one({"_id": quiz_obj_id})
-        if not quiz_doc:
-            raise HTTPException(status_code=404, detail="Quiz not found")
-        
         # For now, we allow any authenticated user to view any quiz if they have the ID
+        cached = quiz_cache.get(quiz_obj_id) or await load_quiz_payload(quiz_obj_id)
+        if cached is None:
+            raise HTTPException(status_code=404, detail="Quiz not found")
+        body, etag = cached
 
-        question_docs = list(questions_collection.find({"quiz_id": quiz_obj_id}).sort("order", 1))
-        
-        questions_data = [
-            {
-                "id": str(q["_id"]),
-                "question": q["question_text"],
-                "options": q["options"],
-                "correct_answers": q["correct_answers"]
-            }
-            for q in question_docs
-        ]
-        
-        return {
-            "quiz": {
-                "id": str(quiz_doc["_id"]),
-                "title": quiz_doc["title"],
-                "difficulty": quiz_doc["difficulty"],
-                "num_questions": quiz_doc["num_questions"],
-                "created_at": quiz_doc["created_at"]
-            },
-            "questions": questions_data
-        }
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+        if etag_matches(request.headers.get("If-None-Match"), etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return Response(content=body, media_type="application/json", headers=headers)
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error in get_quiz: {str(e)}")
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.delete("/quizzes/{quiz_id}")
+async def delete_quiz(
+    quiz_id: str,
+    current_user: UserResponse = Depends(get_current_user),
+):
+    """Delete a quiz the current user created, with its questions and every attempt at it"""
+    try:
+        quiz_obj_id = ObjectId(quiz_id)
+        quiz_doc = await db.find_quiz(quiz_obj_id)
+        if not quiz_doc:
+            raise HTTPException(status_code=404, detail="Quiz not found.")
+
+        if quiz_doc.get("user_id") != ObjectId(current_user.id):
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized to delete this quiz.")
+
+        deleted_count = await db.delete_quiz_cascade(quiz_obj_id)
+        quiz_cache.delete(quiz_obj_id)
+
+        if deleted_count == 0:
+            raise HTTPException(status_code=404, detail="Quiz not found or already deleted.")
+
+        return {"message": "Quiz and associated questions and attempts deleted successfully."}
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error in delete_quiz: {str(e)}")
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/quiz-attempt/{attempt_id}")
-def get_quiz_attempt_details(
+async def get_quiz_attempt_details(
     attempt_id: str, # Changed to str for ObjectId
     current_user: UserResponse = Depends(get_current_user),
 ):
     try:
         attempt_obj_id = ObjectId(attempt_id)
-        attempt_doc = quiz_attempts_collection.find_one({"_id": attempt_obj_id})
+        attempt_doc = await db.find_attempt(attempt_obj_id)
         if not attempt_doc:
             raise HTTPException(status_code=404, detail="Quiz attempt not found")
             
@@ -617,25 +759,36 @@ def get_quiz_attempt_details(
         if attempt_doc["user_id"] != ObjectId(current_user.id):
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized to view this quiz attempt")
         
-        quiz_doc = quizzes_collection.find_one({"_id": attempt_doc["quiz_id"]})
+        quiz_doc, question_docs = await db.find_quiz_with_questions(attempt_doc["quiz_id"])
         if not quiz_doc:
             raise HTTPException(status_code=404, detail="Associated quiz not found")
-            
-        questions_data = []
-        for question_doc in list(questions_collection.find({"quiz_id": attempt_doc["quiz_id"]}).sort("order", 1)):
-            user_answer_doc = user_answers_collection.find_one({
-                "question_id": question_doc["_id"],
-                "quiz_attempt_id": attempt_obj_id
-            })
-            
-            questions_data.append({
+
+        questions_data = [
+            {
                 "id": str(question_doc["_id"]),
                 "question_text": question_doc["question_text"],
                 "options": question_doc["options"],
-                "correct_answers": question_doc["correct_answers"],
-                "user_selected_answers": user_answer_doc["selected_answers"] if user_answer_doc else [],
-                "is_correct": user_answer_doc["is_correct"] if user_answer_doc else False
-            })
+                "correct_answers": question_doc["correct_answers"]
+            }
+            for question_doc in question_docs
+        ]
+
+        if "answer_masks" in attempt_doc:
+            # Answers are embedded in the attempt, one mask per question in quiz order
+            answer_key = await quiz_answer_key(quiz_doc, question_docs)
+            selected_masks = attempt_doc["answer_masks"].ljust(len(question_docs), b"\0")[:len(question_docs)]
+            correctness = grade(answer_key["masks"], selected_masks)
+            for question_data, selected_mask, is_correct in zip(questions_data, selected_masks, correctness):
+                question_data["user_selected_answers"] = [question_data["options"][i] for i in indices_from_mask(selected_mask)]
+                question_data["is_correct"] = is_correct
+        else:
+            # Attempts stored before answers were embedded keep them in user_answers
+            answer_docs = await db.find_answers_for_attempt(attempt_obj_id)
+            answers_by_question = {answer["question_id"]: answer for answer in answer_docs}
+            for question_data, question_doc in zip(questions_data, question_docs):
+                user_answer_doc = answers_by_question.get(question_doc["_id"])
+                question_data["user_selected_answers"] = user_answer_doc["selected_answers"] if user_answer_doc else []
+                question_data["is_correct"] = user_answer_doc["is_correct"] if user_answer_doc else False
             
         return {
             "attempt_id": str(attempt_doc["_id"]),
@@ -649,13 +802,15 @@ def get_quiz_attempt_details(
             "quiz_difficulty": quiz_doc["difficulty"],
             "questions": questions_data
         }
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error in get_quiz_attempt_details: {str(e)}")
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.delete("/quiz-attempt/{attempt_id}")
-def delete_quiz_attempt(
+async def delete_quiz_attempt(
     attempt_id: str,
     current_user: UserResponse = Depends(get_current_user),
 ):
@@ -663,74 +818,104 @@ def delete_quiz_attempt(
         attempt_obj_id = ObjectId(attempt_id)
         
         # Find the quiz attempt to ensure it exists and belongs to the current user
-        attempt_doc = quiz_attempts_collection.find_one({"_id": attempt_obj_id})
+        attempt_doc = await db.find_attempt(attempt_obj_id)
         if not attempt_doc:
             raise HTTPException(status_code=404, detail="Quiz attempt not found.")
         
         if attempt_doc["user_id"] != ObjectId(current_user.id):
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized to delete this quiz attempt.")
         
-        # Delete associated user answers first
-        user_answers_collection.delete_many({"quiz_attempt_id": attempt_obj_id})
+        # Attempts stored before answers were embedded also have user_answers documents
+        if "answer_masks" not in attempt_doc:
+            await db.delete_answers_for_attempt(attempt_obj_id)
         
-        # Delete the quiz attempt itself
-        delete_result = quiz_attempts_collection.delete_one({"_id": attempt_obj_id})
+        deleted_count = await db.delete_attempt(attempt_doc)
         
-        if delete_result.deleted_count == 0:
+        if deleted_count == 0:
             raise HTTPException(status_code=404, detail="Quiz attempt not found or already deleted.")
         
         return {"message": "Quiz attempt and associated answers deleted successfully."}
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error in delete_quiz_attempt: {str(e)}")
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
+def serialize_history_entry(attempt: dict) -> dict:
+    """An attempt from db.find_history_page, joined with its quiz"""
+    quiz = attempt["quiz"]
+    return {
+        "id": str(attempt["_id"]),
+        "quiz_id": str(attempt["quiz_id"]),
+        "quiz_title": quiz["title"],
+        "score": attempt["score"],
+        "total_questions": attempt["total_questions"],
+        "correct_answers": attempt["correct_answers"],
+        "completed_at": attempt["completed_at"],
+        "difficulty": quiz["difficulty"],
+        "time_taken_seconds": attempt.get("time_taken_seconds")
+    }
+
+def serialize_quiz_summary(quiz: dict) -> dict:
+    """A quiz projected with db.QUIZ_SUMMARY_PROJECTION"""
+    return {
+        "id": str(quiz["_id"]),
+        "title": quiz["title"],
+        "difficulty": quiz["difficulty"],
+        "num_questions": quiz["num_questions"],
+        "created_at": quiz["created_at"],
+        "user_id": str(quiz["user_id"]) if quiz.get("user_id") else None
+    }
+
 @app.get("/users/{username}/history")
-def get_user_history(
+async def get_user_history(
     username: str,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=config.MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
     current_user: UserResponse = Depends(get_current_user),
 ):
+    """
+    A user's quiz attempts, newest first.
+
+    Without `limit` the full history is returned. With `limit`, one page is
+    returned and the cursor for the next page, if any, is sent in the
+    X-Next-Cursor response header.
+    """
     try:
         # Ensure the requested username matches the authenticated user
         if username != current_user.username:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized to view this user's history")
 
-        user_doc = users_collection.find_one({"username": username})
-        if not user_doc:
-            raise HTTPException(status_code=404, detail="User not found")
-        
         # Ensure user_id is an ObjectId for the query
         user_obj_id = ObjectId(current_user.id)
         
-        attempts_cursor = quiz_attempts_collection.find({"user_id": user_obj_id}).sort("completed_at", -1)
+        attempts = await db.find_history_page(
+            user_obj_id,
+            after=keyset_filter("completed_at", cursor),
+            limit=limit + 1 if limit else None
+        )
+        if limit and len(attempts) > limit:
+            attempts = attempts[:limit]
+            last = attempts[-1]
+            response.headers[NEXT_CURSOR_HEADER] = encode_cursor(last["completed_at"], last["_id"])
         
-        history = []
-        for attempt in attempts_cursor:
-            quiz_doc = quizzes_collection.find_one({"_id": attempt["quiz_id"]})
-            if quiz_doc:
-                history.append({
-                    "id": str(attempt["_id"]),
-                    "quiz_id": str(attempt["quiz_id"]),
-                    "quiz_title": quiz_doc["title"],
-                    "score": attempt["score"],
-                    "total_questions": attempt["total_questions"],
-                    "correct_answers": attempt["correct_answers"],
-                    "completed_at": attempt["completed_at"],
-                    "difficulty": quiz_doc["difficulty"],
-                    "time_taken_seconds": attempt.get("time_taken_seconds")
-                })
-        print(f"Returning history: {history}")
-        return history
+        return [serialize_history_entry(attempt) for attempt in attempts if attempt.get("quiz")]
+    except HTTPException:
+        raise
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         print(f"Error in get_user_history: {str(e)}")
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/user-quizzes/count")
-def get_user_created_quizzes_count(current_user: UserResponse = Depends(get_current_user)):
+async def get_user_created_quizzes_count(current_user: UserResponse = Depends(get_current_user)):
     try:
         user_obj_id = ObjectId(current_user.id)
-        count = quizzes_collection.count_documents({"user_id": user_obj_id})
+        count = await db.count_quizzes_by_user(user_obj_id)
         return {"total_created_quizzes": count}
     except Exception as e:
         print(f"Error in get_user_created_quizzes_count: {str(e)}")
@@ -738,43 +923,175 @@ def get_user_created_quizzes_count(current_user: UserResponse = Depends(get_curr
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/user-quizzes")
-def get_user_created_quizzes(
+async def get_user_created_quizzes(
     current_user: UserResponse = Depends(get_current_user),
 ):
     try:
         user_obj_id = ObjectId(current_user.id)
-        quizzes_cursor = quizzes_collection.find({"user_id": user_obj_id}).sort("created_at", -1)
+        quizzes = await db.find_quizzes_by_user(user_obj_id)
         
-        created_quizzes = []
-        for quiz in quizzes_cursor:
-            created_quizzes.append({
-                "id": str(quiz["_id"]),
-                "title": quiz["title"],
-                "difficulty": quiz["difficulty"],
-                "num_questions": quiz["num_questions"],
-                "created_at": quiz["created_at"],
-                "user_id": str(quiz["user_id"])
-            })
-        
-        return created_quizzes
+        return [serialize_quiz_summary(quiz) for quiz in quizzes]
     except Exception as e:
         print(f"Error in get_user_created_quizzes: {str(e)}")
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/quizzes")
-def get_all_available_quizzes(
+async def get_all_available_quizzes(
+    limit: int = Query(20, ge=1, le=config.MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    difficulty: Optional[str] = None,
+    creator: Optional[str] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    title_prefix: Optional[str] = None,
     current_user: UserResponse = Depends(get_current_user),
 ):
+    """
+    Paginated quiz catalog, newest first.
+
+    Filters combine with AND; `creator` is a username. `total_estimate` counts
+    all quizzes matching the filters (capped at COUNT_ESTIMATE_CAP when
+    filtered) and `next_cursor` is null on the last page.
+    """
     try:
-        # Get all quizzes
-        quizzes = list(quizzes_collection.find())
-        return quizzes
+        query = {}
+        if difficulty:
+            query["difficulty"] = normalize_difficulty(difficulty)
+        if creator:
+            creator_doc = await db.find_user_by_username(creator)
+            if not creator_doc:
+                return {"items": [], "next_cursor": None, "total_estimate": 0}
+            query["user_id"] = creator_doc["_id"]
+        if created_after or created_before:
+            query["created_at"] = {}
+            if created_after:
+                query["created_at"]["$gte"] = created_after
+            if created_before:
+                query["created_at"]["$lt"] = created_before
+        if title_prefix:
+            # Anchored, escaped prefix so the title index can be range-scanned
+            query["title"] = {"$regex": f"^{re.escape(title_prefix)}"}
+
+        quizzes, total_estimate = await asyncio.gather(
+            db.find_quizzes_page(query, keyset_filter("created_at", cursor), limit + 1),
+            db.estimate_quiz_count(query)
+        )
+
+        next_cursor = None
+        if len(quizzes) > limit:
+            quizzes = quizzes[:limit]
+            next_cursor = encode_cursor(quizzes[-1]["created_at"], quizzes[-1]["_id"])
+
+        items = [serialize_quiz_summary(quiz) for quiz in quizzes]
+        return {"items": items, "next_cursor": next_cursor, "total_estimate": total_estimate}
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         print(f"Error in get_all_available_quizzes: {str(e)}")
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
+DASHBOARD_FIELDS = ("attempts", "counts", "created_quizzes", "stats")
+
+@app.get("/me/dashboard")
+async def get_dashboard(
+    fields: Optional[str] = None,
+    attempts_limit: int = Query(20, ge=1, le=config.MAX_PAGE_SIZE),
+    quizzes_limit: int = Query(20, ge=1, le=config.MAX_PAGE_SIZE),
+    current_user: UserResponse = Depends(get_current_user),
+):
+    """
+    Everything the profile page shows, in one request.
+
+    `fields` is a comma-separated subset of attempts, counts, created_quizzes
+    and stats (default: all). The underlying queries run concurrently.
+    `attempts` and `created_quizzes` are the newest pages of
+    /users/{username}/history and /user-quizzes; their `next_cursor` values
+    continue those lists through the paginated endpoints. `stats` covers
+    every attempt, not just the returned page (see /me/stats).
+    """
+    try:
+        requested = [field.strip() for field in fields.split(",") if field.strip()] if fields else list(DASHBOARD_FIELDS)
+        unknown = sorted(set(requested) - set(DASHBOARD_FIELDS))
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown dashboard fields: {', '.join(unknown)}")
+
+        user_obj_id = ObjectId(current_user.id)
+        queries = {}
+        if "attempts" in requested:
+            queries["attempts"] = db.find_history_page(user_obj_id, after={}, limit=attempts_limit + 1)
+        if "created_quizzes" in requested:
+            queries["created_quizzes"] = db.find_quizzes_page({"user_id": user_obj_id}, {}, quizzes_limit + 1)
+        if "counts" in requested or "stats" in requested:
+            queries["stats"] = db.find_user_stats(user_obj_id)
+        if "counts" in requested:
+            queries["created_count"] = db.count_quizzes_by_user(user_obj_id)
+        results = dict(zip(queries, await asyncio.gather(*queries.values())))
+
+        dashboard = {}
+        if "attempts" in results:
+            attempts = results["attempts"]
+            next_cursor = None
+            if len(attempts) > attempts_limit:
+                attempts = attempts[:attempts_limit]
+                next_cursor = encode_cursor(attempts[-1]["completed_at"], attempts[-1]["_id"])
+            dashboard["attempts"] = {
+                "items": [serialize_history_entry(attempt) for attempt in attempts if attempt.get("quiz")],
+                "next_cursor": next_cursor
+            }
+        if "created_quizzes" in results:
+            quizzes = results["created_quizzes"]
+            next_cursor = None
+            if len(quizzes) > quizzes_limit:
+                quizzes = quizzes[:quizzes_limit]
+                next_cursor = encode_cursor(quizzes[-1]["created_at"], quizzes[-1]["_id"])
+            dashboard["created_quizzes"] = {
+                "items": [serialize_quiz_summary(quiz) for quiz in quizzes],
+                "next_cursor": next_cursor
+            }
+        if "stats" in results:
+            stats = user_stats.serialize(results["stats"])
+        if "counts" in requested:
+            dashboard["counts"] = {
+                "attempts": stats["total_attempts"],
+                "created_quizzes": results["created_count"]
+            }
+        if "stats" in requested:
+            dashboard["stats"] = stats
+        return dashboard
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error in get_dashboard: {str(e)}")
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/me/stats")
+async def get_user_stats(current_user: UserResponse = Depends(get_current_user)):
+    """
+    Attempt totals, averages and best scores, overall and per difficulty.
+    Served from the user's user_stats document, one _id read however many
+    attempts there are.
+    """
+    try:
+        return user_stats.serialize(await db.find_user_stats(ObjectId(current_user.id)))
+    except Exception as e:
+        print(f"Error in get_user_stats: {str(e)}")
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/metrics/cache")
+async def get_cache_metrics(current_user: UserResponse = Depends(get_current_user)):
+    return {
+        "users": user_cache.stats(),
+        "quizzes": quiz_cache.stats(),
+        "password_hash_pool": password_pool.stats(),
+        "api_keys": key_provider.stats(),
+        "llm_dispatcher": dispatcher.stats(),
+        "question_bank": question_bank.stats.to_dict()
+    }
+
 # Email-related endpoints
 class PasswordResetRequest(BaseModel):
     email: str
@@ -784,11 +1101,11 @@ class PasswordResetConfirm(BaseModel):
     new_password: str
 
 @app.post("/forgot-password")
-def forgot_password(reset_request: PasswordResetRequest):
+async def forgot_password(reset_request: PasswordResetRequest):
     """Request a password reset email"""
     try:
         # Check if user exists with this email
-        user_doc = users_collection.find_one({"email": reset_request.email})
+        user_doc = await db.find_user_by_email(reset_request.email)
         if not user_doc:
             # Don't reveal if email exists or not for security
             return {"message": "If an account with that email exists, a password reset link has been sent."}
@@ -804,7 +1121,7 @@ def forgot_password(reset_request: PasswordResetRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/reset-password")
-def reset_password(reset_confirm: PasswordResetConfirm):
+async def reset_password(reset_confirm: PasswordResetConfirm):
     """Reset password using token"""
     try:
         # TODO: Verify token and update password
@@ -818,7 +1135,7 @@ def reset_password(reset_confirm: PasswordResetConfirm):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/resend-verification")
-def resend_verification_email(
+async def resend_verification_email(
     current_user: UserResponse = Depends(get_current_user)
 ):
     """Resend email verification"""
@@ -833,7 +1150,7 @@ def resend_verification_email(
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/verify-email/{token}")
-def verify_email(token: str):
+async def verify_email(token: str):
     """Verify email using token"""
     try:
         # TODO: Verify token and mark email as verified
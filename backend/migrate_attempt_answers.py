@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Move attempt answers from the user_answers collection into the attempts.
+
+    python migrate_attempt_answers.py                 # write quiz_attempts.answer_masks
+    python migrate_attempt_answers.py --drop-source   # ...and delete the migrated user_answers documents
+
+Each answer becomes one byte of the attempt's `answer_masks`, in quiz order,
+with bit i set when option i was selected (see answer_key.py). Attempts are
+updated with a conditional write, so the script can be stopped and re-run at
+any time while the application is serving traffic: attempts without
+`answer_masks` keep being read from user_answers. Once the collection is
+empty after --drop-source it can be dropped together with its indexes.
+"""
+import argparse
+import sys
+
+from pymongo import MongoClient, ASCENDING, UpdateOne
+from config import config
+from answer_key import mask_from_indices
+
+
+def batches(cursor, size):
+    batch = []
+    for doc in cursor:
+        batch.append(doc)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def load_questions(database, quiz_ids):
+    """Questions in quiz order per quiz, from either question layout"""
+    questions_by_quiz = {}
+    for quiz_doc in database["quizzes"].find({"_id": {"$in": quiz_ids}}, {"questions._id": 1, "questions.options": 1}):
+        if "questions" in quiz_doc:
+            questions_by_quiz[quiz_doc["_id"]] = quiz_doc["questions"]
+        else:
+            questions_by_quiz[quiz_doc["_id"]] = []
+    cursor = database["questions"].find(
+        {"quiz_id": {"$in": list(questions_by_quiz)}},
+        {"quiz_id": 1, "options": 1, "duplicate_of": 1}
+    ).sort([("quiz_id", ASCENDING), ("order", ASCENDING)])
+    references = []
+    for question in cursor:
+        questions_by_quiz[question["quiz_id"]].append(question)
+        if "duplicate_of" in question:
+            references.append(question)
+    if references:
+        # Questions stored as references take their options from the shared question
+        shared_ids = list({question["duplicate_of"] for question in references})
+        options = {doc["_id"]: doc["options"] for doc in database["questions"].find({"_id": {"$in": shared_ids}}, {"options": 1})}
+        for question in references:
+            question["options"] = options.get(question["duplicate_of"], [])
+    return questions_by_quiz
+
+
+def answer_mask(answer, options):
+    """Selected options of a user_answers document as a bitmask"""
+    if "selected_mask" in answer:
+        return answer["selected_mask"]
+    indices = [options.index(text) for text in answer.get("selected_answers") or [] if text in options]
+    return mask_from_indices(indices, len(options))
+
+
+def migrate(database, batch_size, drop_source, dry_run):
+    attempts = database["quiz_attempts"]
+    user_answers = database["user_answers"]
+    pending = {"answer_masks": {"$exists": False}}
+    total = attempts.count_documents(pending)
+    print(f"Attempts to migrate: {total}")
+
+    migrated = orphaned = 0
+    for batch in batches(attempts.find(pending, {"quiz_id": 1}), batch_size):
+        attempt_ids = [attempt["_id"] for attempt in batch]
+        questions_by_quiz = load_questions(database, list({attempt["quiz_id"] for attempt in batch}))
+        answers_by_attempt = {attempt_id: {} for attempt_id in attempt_ids}
+        for answer in user_answers.find({"quiz_attempt_id": {"$in": attempt_ids}}):
+            answers_by_attempt[answer["quiz_attempt_id"]][answer["question_id"]] = answer
+
+        writes = []
+        done = []
+        for attempt in batch:
+            questions = questions_by_quiz.get(attempt["quiz_id"])
+            if questions is None:
+                # The quiz is gone; delete_quiz_cascade removes such attempts
+                orphaned += 1
+                continue
+            answers = answers_by_attempt[attempt["_id"]]
+            masks = bytes(
+                answer_mask(answers[question["_id"]], question["options"]) if question["_id"] in answers else 0
+                for question in questions
+            )
+            writes.append(UpdateOne({"_id": attempt["_id"], "answer_masks": {"$exists": False}}, {"$set": {"answer_masks": masks}}))
+            done.append(attempt["_id"])
+
+        if not dry_run and writes:
+            attempts.bulk_write(writes, ordered=False)
+            if drop_source:
+                user_answers.delete_many({"quiz_attempt_id": {"$in": done}})
+
+        migrated += len(done)
+        print(f"  migrated {migrated}/{total}")
+
+    if orphaned:
+        print(f"Skipped {orphaned} attempts whose quiz no longer exists")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--drop-source", action="store_true", help="Delete user_answers documents once migrated")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    client = MongoClient(config.MONGO_URI)
+    try:
+        database = client[config.DATABASE_NAME]
+        print(f"Connected to database: {config.DATABASE_NAME}")
+        migrate(database, args.batch_size, args.drop_source, args.dry_run)
+        print("Migration completed successfully!")
+    except Exception as e:
+        print(f"Error migrating answers: {str(e)}")
+        sys.exit(1)
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
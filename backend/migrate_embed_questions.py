@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Migrate quiz questions between the two storage layouts.
+
+    python migrate_embed_questions.py                 # embed: questions collection -> quiz.questions
+    python migrate_embed_questions.py --drop-source   # ...and delete the migrated questions documents
+    python migrate_embed_questions.py --split         # roll back: quiz.questions -> questions collection
+
+Each quiz is converted with a single conditional update, so the script can be
+stopped and re-run at any time and is safe to run while the application is
+serving traffic: reads accept either layout per quiz. Quizzes that are still
+being generated are skipped. Set QUIZ_EMBED_QUESTIONS=true once the embed
+has finished so new quizzes are written in the same layout.
+"""
+import argparse
+import sys
+
+from pymongo import MongoClient, ASCENDING, ReplaceOne, UpdateOne
+from config import config
+
+
+def batches(cursor, size):
+    batch = []
+    for doc in cursor:
+        batch.append(doc)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def resolve_references(questions, batch):
+    """Give questions stored as references (see db.stored_question) their own copy of the content"""
+    shared_ids = list({question["duplicate_of"] for question in batch if "duplicate_of" in question})
+    if not shared_ids:
+        return
+    shared = {doc["_id"]: doc for doc in questions.find({"_id": {"$in": shared_ids}})}
+    for question in batch:
+        source = shared.get(question.pop("duplicate_of", None))
+        if source:
+            question.update({key: value for key, value in source.items() if key not in ("_id", "quiz_id", "order")})
+
+
+def embed(database, batch_size, drop_source, dry_run):
+    quizzes = database["quizzes"]
+    questions = database["questions"]
+    pending = {"questions": {"$exists": False}, "status": {"$ne": "generating"}}
+    total = quizzes.count_documents(pending)
+    print(f"Quizzes to embed: {total}")
+
+    migrated = 0
+    for batch in batches(quizzes.find(pending, {"_id": 1}), batch_size):
+        quiz_ids = [doc["_id"] for doc in batch]
+        grouped = {quiz_id: [] for quiz_id in quiz_ids}
+        cursor = questions.find({"quiz_id": {"$in": quiz_ids}}).sort([("quiz_id", ASCENDING), ("order", ASCENDING)])
+        for question in cursor:
+            quiz_id = question.pop("quiz_id")
+            grouped[quiz_id].append(question)
+        resolve_references(questions, [question for embedded in grouped.values() for question in embedded])
+
+        if not dry_run:
+            quizzes.bulk_write([
+                UpdateOne({"_id": quiz_id, "questions": {"$exists": False}}, {"$set": {"questions": embedded}})
+                for quiz_id, embedded in grouped.items()
+            ], ordered=False)
+            if drop_source:
+                # Only drop questions whose quiz now holds the same number embedded
+                embedded_counts = {
+                    doc["_id"]: doc["count"]
+                    for doc in quizzes.aggregate([
+                        {"$match": {"_id": {"$in": quiz_ids}}},
+                        {"$project": {"count": {"$size": {"$ifNull": ["$questions", []]}}}}
+                    ])
+                }
+                confirmed = [quiz_id for quiz_id, embedded in grouped.items() if embedded_counts.get(quiz_id) == len(embedded)]
+                # Questions other quizzes still refer to stay until those quizzes are embedded too
+                question_ids = [question["_id"] for quiz_id in confirmed for question in grouped[quiz_id]]
+                referenced = questions.distinct("duplicate_of", {"duplicate_of": {"$in": question_ids}})
+                questions.delete_many({"quiz_id": {"$in": confirmed}, "_id": {"$nin": referenced}})
+
+        migrated += len(quiz_ids)
+        print(f"  embedded {migrated}/{total}")
+
+
+def split(database, batch_size, dry_run):
+    quizzes = database["quizzes"]
+    questions = database["questions"]
+    pending = {"questions": {"$exists": True}}
+    total = quizzes.count_documents(pending)
+    print(f"Quizzes to split: {total}")
+
+    migrated = 0
+    for batch in batches(quizzes.find(pending, {"questions": 1}), batch_size):
+        if not dry_run:
+            writes = [
+                ReplaceOne({"_id": question["_id"]}, {**question, "quiz_id": quiz["_id"]}, upsert=True)
+                for quiz in batch for question in quiz["questions"]
+            ]
+            if writes:
+                questions.bulk_write(writes, ordered=False)
+            quizzes.update_many({"_id": {"$in": [quiz["_id"] for quiz in batch]}}, {"$unset": {"questions": ""}})
+        migrated += len(batch)
+        print(f"  split {migrated}/{total}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--split", action="store_true", help="Move embedded questions back to the questions collection")
+    parser.add_argument("--drop-source", action="store_true", help="Delete questions documents once embedded")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    client = MongoClient(config.MONGO_URI)
+    try:
+        database = client[config.DATABASE_NAME]
+        print(f"Connected to database: {config.DATABASE_NAME}")
+        if args.split:
+            split(database, args.batch_size, args.dry_run)
+        else:
+            embed(database, args.batch_size, args.drop_source, args.dry_run)
+        print("Migration completed successfully!")
+    except Exception as e:
+        print(f"Error migrating questions: {str(e)}")
+        sys.exit(1)
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Near-duplicate detection for quiz questions with MinHash and LSH.
+
+A question's signature is a MinHash sketch of the byte 5-gram shingles of
+its normalized text plus its options (sorted, so reordered options still
+match). Sketches use one-permutation hashing: every shingle is hashed once
+into one of SIGNATURE_BINS bins, each bin keeps its minimum, and empty bins
+borrow from the next filled one. That costs one CRC per shingle instead of
+one hash per shingle per permutation, which keeps pure Python well under a
+millisecond per question. The fraction of equal bins estimates the Jaccard
+similarity of two questions' shingle sets.
+
+For lookups the signature is cut into LSH_BANDS bands of LSH_ROWS bins.
+Each band hashes to a band key, and two questions that share a key are
+candidates; candidates whose estimated similarity reaches
+QUESTION_DEDUP_THRESHOLD count as near-duplicates. With 16 bands of 8 rows,
+pairs at 0.8 similarity share a key 95% of the time, pairs at 0.9 almost
+always, and pairs at 0.4 (questions built on the same template wording)
+only 1% of the time, so lookups stay cheap as the index grows.
+
+Band keys are stored on question documents (`lsh_bands`, multikey-indexed)
+so the index grows as questions are inserted; NearDuplicateIndex is the
+in-memory equivalent used within a quiz and by bench_near_duplicates.py.
+"""
+import operator
+import re
+import zlib
+from array import array
+from typing import Dict, Generic, List, Optional, Tuple, TypeVar, Union
+
+from config import config
+
+SHINGLE_BYTES = 5
+SIGNATURE_BINS = 128
+LSH_BANDS = 16
+LSH_ROWS = SIGNATURE_BINS // LSH_BANDS
+
+_BIN_BITS = 7  # log2(SIGNATURE_BINS)
+_VALUE_MASK = (1 << 16) - 1  # 16-bit bin values: 256-byte signatures
+_EMPTY = 1 << 16
+_MIX = 0x9E3779B1  # Spreads CRC bits before they are split into bin and value
+_NON_WORD = re.compile(r"\W+")
+
+T = TypeVar("T")
+
+
+def normalize_text(question: dict) -> str:
+    """Question text and sorted options, casefolded, with punctuation and spacing collapsed"""
+    options = sorted(_NON_WORD.sub(" ", option.casefold()).strip() for option in question.get("options") or [])
+    text = _NON_WORD.sub(" ", (question.get("question") or "").casefold()).strip()
+    return " | ".join([text, *options])
+
+
+def signature(question: dict) -> bytes:
+    """The MinHash signature of a question (SIGNATURE_BINS 16-bit values)"""
+    data = normalize_text(question).encode("utf-8")
+    bins = [_EMPTY] * SIGNATURE_BINS
+    shingles = [data[start:start + SHINGLE_BYTES] for start in range(max(len(data) - SHINGLE_BYTES + 1, 1))]
+    for crc in map(zlib.crc32, shingles):
+        mixed = (crc * _MIX) & 0xFFFFFFFF
+        index = mixed >> (32 - _BIN_BITS)
+        value = mixed & _VALUE_MASK
+        if value < bins[index]:
+            bins[index] = value
+    # Densify: an empty bin takes the value of the next filled bin to its
+    # right (wrapping around), offset by the distance so borrowed values
+    # stay distinguishable
+    filled = [index for index, value in enumerate(bins) if value != _EMPTY]
+    if len(filled) < SIGNATURE_BINS:
+        for previous, following in zip(filled, filled[1:] + [filled[0] + SIGNATURE_BINS]):
+            source = bins[following % SIGNATURE_BINS]
+            for position in range(previous + 1, following):
+                bins[position % SIGNATURE_BINS] = (source + (following - position) * 0x9E37) & _VALUE_MASK
+    return array("H", bins).tobytes()
+
+
+def band_keys(sig: bytes) -> List[int]:
+    """One 64-bit-safe integer key per band: the band number in the high bits, a CRC of its rows below"""
+    width = len(sig) // LSH_BANDS
+    return [(band << 32) | zlib.crc32(sig[band * width:(band + 1) * width]) for band in range(LSH_BANDS)]
+
+
+def similarity(a: bytes, b: bytes) -> float:
+    """Estimated Jaccard similarity: the fraction of equal bins"""
+    return sum(map(operator.eq, array("H", a), array("H", b))) / SIGNATURE_BINS
+
+
+class NearDuplicateIndex(Generic[T]):
+    """
+    In-memory LSH index mapping band keys to the items added under them.
+    Most keys belong to a single item, so a bucket is a bare position until
+    a second item arrives, which keeps a million-question index in memory.
+    """
+
+    def __init__(self, threshold: Optional[float] = None):
+        self.threshold = config.QUESTION_DEDUP_THRESHOLD if threshold is None else threshold
+        self._buckets: Dict[int, Union[int, List[int]]] = {}
+        self._signatures: List[bytes] = []
+        self._items: List[T] = []
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def add(self, sig: bytes, item: T, keys: Optional[List[int]] = None):
+        position = len(self._items)
+        self._signatures.append(sig)
+        self._items.append(item)
+        buckets = self._buckets
+        for key in keys or band_keys(sig):
+            bucket = buckets.get(key)
+            if bucket is None:
+                buckets[key] = position
+            elif isinstance(bucket, int):
+                buckets[key] = [bucket, position]
+            else:
+                bucket.append(position)
+
+    def query(self, sig: bytes, keys: Optional[List[int]] = None) -> Optional[Tuple[T, float]]:
+        """The most similar indexed item at or above the threshold, with its similarity"""
+        best, best_score = None, self.threshold
+        seen = set()
+        for key in keys or band_keys(sig):
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                continue
+            for position in (bucket,) if isinstance(bucket, int) else bucket:
+                if position in seen:
+                    continue
+                seen.add(position)
+                score = similarity(sig, self._signatures[position])
+                if score >= best_score:
+                    best, best_score = position, score
+        return (self._items[best], best_score) if best is not None else None
@@ -0,0 +1,46 @@
+"""
+Keyset (cursor) pagination helpers.
+
+Pages are ordered by a timestamp field descending with `_id` as the tie
+breaker. The opaque cursor handed to clients encodes the (timestamp, _id)
+pair of the last item on the page; the next page starts strictly after it,
+so every page is an index range scan no matter how deep the client pages.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Optional, Tuple
+
+from bson import ObjectId
+from bson.errors import InvalidId
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+class InvalidCursorError(ValueError):
+    """Raised when a client supplies a cursor this module did not produce"""
+
+
+def encode_cursor(sort_value: datetime, item_id: ObjectId) -> str:
+    payload = json.dumps({"v": sort_value.isoformat(), "id": str(item_id)})
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, ObjectId]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(payload["v"]), ObjectId(payload["id"])
+    except (ValueError, KeyError, TypeError, InvalidId) as e:
+        raise InvalidCursorError(f"Invalid cursor: {cursor}") from e
+
+
+def keyset_filter(field: str, cursor: Optional[str]) -> dict:
+    """Match filter selecting the items after `cursor` in (field, _id) descending order"""
+    if not cursor:
+        return {}
+    sort_value, item_id = decode_cursor(cursor)
+    return {"$or": [
+        {field: {"$lt": sort_value}},
+        {field: sort_value, "_id": {"$lt": item_id}}
+    ]}
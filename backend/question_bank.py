@@ -0,0 +1,143 @@
+"""
+Pre-generated question bank for subject quizzes.
+
+Questions are kept in the question_bank collection per normalized subject
+(see generation_cache.normalize_subject) and difficulty, one entry per
+normalized question text. A subject quiz is assembled by sampling questions
+the user has not seen yet, i.e. that are not in a quiz they created or
+attempted for the same subject and difficulty, which takes a couple of
+indexed reads instead of a completion. Whatever the bank cannot cover is
+generated by the LLM and deposited, so every subject request grows the
+inventory. bank_refill.py keeps popular and configured subjects stocked.
+"""
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import List, Tuple
+
+from bson import ObjectId
+
+from config import config
+import db
+from generation_cache import normalize_difficulty, normalize_subject
+import near_duplicates
+from quiz_schema import question_key
+
+
+@dataclass
+class BankDraw:
+    questions: List[dict] = field(default_factory=list)
+    ids: List[ObjectId] = field(default_factory=list)
+
+
+class BankStats:
+    """Per-process counters surfaced by /metrics/cache"""
+
+    def __init__(self):
+        self.full = 0
+        self.partial = 0
+        self.empty = 0
+        self.questions_served = 0
+        self.questions_deposited = 0
+        self.draw_seconds = 0.0
+
+    def record_draw(self, requested: int, served: int, seconds: float):
+        if served >= requested:
+            self.full += 1
+        elif served:
+            self.partial += 1
+        else:
+            self.empty += 1
+        self.questions_served += served
+        self.draw_seconds += seconds
+
+    def to_dict(self) -> dict:
+        draws = self.full + self.partial + self.empty
+        return {
+            "enabled": config.QUESTION_BANK_ENABLED,
+            "draws": draws,
+            "full": self.full,
+            "partial": self.partial,
+            "empty": self.empty,
+            "questions_served": self.questions_served,
+            "questions_deposited": self.questions_deposited,
+            "average_draw_ms": round(self.draw_seconds / draws * 1000, 2) if draws else None,
+        }
+
+
+stats = BankStats()
+
+
+def bank_key(subject: str, difficulty: str) -> Tuple[str, str]:
+    return normalize_subject(subject), normalize_difficulty(difficulty)
+
+
+async def draw(user_id: ObjectId, subject: str, difficulty: str, num_questions: int) -> BankDraw:
+    """
+    Up to `num_questions` random bank questions the user has not seen, in
+    stored question form. Entries are only unique by exact text, so a sample
+    can hold near-duplicates; all but the first of them are left out, which
+    keeps `ids` matching `questions`.
+    """
+    start = time.perf_counter()
+    subject_key, difficulty = bank_key(subject, difficulty)
+    seen = await db.find_seen_bank_question_ids(user_id, subject_key, difficulty)
+    docs = await db.sample_bank_questions(subject_key, difficulty, num_questions, seen)
+    index = near_duplicates.NearDuplicateIndex()
+    bank_draw = BankDraw()
+    for doc in docs:
+        question = {"question": doc["question"], "options": doc["options"], "correct_answers": doc["correct_answers"]}
+        sig = near_duplicates.signature(question)
+        if index.query(sig) is not None:
+            continue
+        index.add(sig, question)
+        bank_draw.questions.append(question)
+        bank_draw.ids.append(doc["_id"])
+    stats.record_draw(num_questions, len(bank_draw.questions), time.perf_counter() - start)
+    return bank_draw
+
+
+async def deposit(subject: str, difficulty: str, questions: List[dict], source: str) -> List[ObjectId]:
+    """
+    Store generated questions in the bank and return their entry IDs in the
+    same order; a question already in the bank maps to the existing entry.
+    `source` records where they came from ("refill" or "fallback").
+    """
+    subject_key, difficulty = bank_key(subject, difficulty)
+    now = datetime.utcnow()
+    docs = []
+    for question in questions:
+        docs.append({
+            "subject_key": subject_key,
+            "difficulty": difficulty,
+            "text_key": question_key(question),
+            "question": question["question"],
+            "options": question["options"],
+            "correct_answers": question["correct_answers"],
+            "model": config.OPENAI_MODEL,
+            "source": source,
+            "created_at": now,
+        })
+    ids = await db.upsert_bank_questions(subject_key, difficulty, docs)
+    stats.questions_deposited += len(ids)
+    return ids
+
+
+async def inventory(subject: str, difficulty: str) -> int:
+    return await db.count_bank_questions(*bank_key(subject, difficulty))
+
+
+async def stock_targets() -> List[Tuple[str, str]]:
+    """(subject_key, difficulty) pairs to keep stocked: configured subjects first, then popular ones"""
+    targets = [
+        bank_key(subject, difficulty)
+        for subject in config.QUESTION_BANK_SUBJECTS
+        for difficulty in config.QUESTION_BANK_DIFFICULTIES
+    ]
+    popular = await db.find_popular_subjects(
+        datetime.utcnow() - timedelta(days=config.QUESTION_BANK_POPULAR_DAYS),
+        config.QUESTION_BANK_POPULAR_MIN_QUIZZES,
+        config.QUESTION_BANK_POPULAR_LIMIT,
+    )
+    targets.extend((doc["subject_key"], doc["difficulty"]) for doc in popular)
+    return list(dict.fromkeys(targets))
@@ -0,0 +1,700 @@
+"""
+Quiz generation pipeline: prompt building, LLM calls and response parsing.
+
+Completions use a JSON-schema response format (see quiz_schema). Questions
+that fail validation are regenerated on their own, up to
+GENERATION_REPAIR_ATTEMPTS extra completions, instead of failing the quiz.
+
+Source documents larger than GENERATION_CHUNK_TOKENS are split into
+token-budgeted chunks (map), each chunk is asked for its share of the
+requested questions concurrently, and the per-chunk questions are merged,
+de-duplicated and trimmed to the requested count (reduce). Questions that
+nearly duplicate one already in the quiz (see near_duplicates) are dropped,
+and regenerated while repair attempts remain. Token usage is
+recorded per chunk.
+
+Subject quizzes are assembled from the question bank when it is enabled
+(see question_bank), with the LLM only generating what the bank lacks; the
+generation cache then only serves file quizzes.
+
+`create_quiz` is the whole pipeline from a parsed request to a stored quiz
+(bank or cache lookup, extraction, generation, persistence). It is shared by the
+synchronous /generate-quiz endpoint and the background job worker.
+`stream_quiz` is the streamed variant: completions are streamed and each
+question is validated, stored and emitted as soon as its JSON object closes.
+"""
+import asyncio
+import json
+from dataclasses import dataclass, field, asdict
+from datetime import datetime
+from functools import partial
+from typing import AsyncIterator, Awaitable, Callable, List, Optional, Tuple
+
+from bson import ObjectId
+
+from config import config
+import db
+import llm
+import near_duplicates
+import question_bank
+import quiz_schema
+from llm_dispatcher import current_owner
+from answer_key import build_answer_key
+from generation_cache import make_cache_key, normalize_difficulty, normalize_subject
+from ingest import SpooledUpload, extract_pdf_text
+
+# Rough characters-per-token ratio for English text; good enough for budgeting
+# without pulling in a tokenizer.
+CHARS_PER_TOKEN = 4
+
+FORMAT_INSTRUCTIONS = (
+    'Respond with a JSON object of the form {"questions": [{"question": "...", "options": ["...", "..."], "correct_answers": ["A"]}]}. '
+    "Give each question four options unless the material clearly calls for more (at most eight), written without letter prefixes. "
+    "List ALL correct options in correct_answers by letter, where A is the first option, B the second, and so on; "
+    "every question must have at least one correct answer.\n\n"
+    'Example: {"questions": [{"question": "Which of the following are primary colors?", "options": ["Red", "Blue", "Green", "Yellow"], "correct_answers": ["A", "B"]}]}'
+)
+
+
+class GenerationInputError(ValueError):
+    """Raised when the request or uploaded file cannot be turned into a quiz"""
+
+
+@dataclass
+class GenerationRequest:
+    num_questions: int = 5
+    difficulty: str = "medium"
+    subject: Optional[str] = None
+    file_name: Optional[str] = None
+    fresh: bool = False # Skip the generation cache when the user wants new questions
+    page_start: Optional[int] = None
+    page_end: Optional[int] = None
+
+    def to_doc(self) -> dict:
+        return asdict(self)
+
+    @classmethod
+    def from_doc(cls, doc: dict) -> "GenerationRequest":
+        return cls(**doc)
+
+
+@dataclass
+class GenerationResult:
+    quiz_text: str
+    questions: List[dict]
+    usage: List[dict] = field(default_factory=list)
+
+
+def build_text_prompt(text: str, num_questions: int, difficulty: str) -> str:
+    return f"Generate {num_questions} multiple-select quiz questions (MSQ) with options and correct answers based on the following text: {text}\n\nDifficulty: {difficulty}.\n\n{FORMAT_INSTRUCTIONS}"
+
+
+def build_subject_prompt(subject: str, num_questions: int, difficulty: str) -> str:
+    return f"Generate {num_questions} multiple-select quiz questions (MSQ) with options and correct answers about the subject: {subject}\n\nDifficulty: {difficulty}.\n\n{FORMAT_INSTRUCTIONS}"
+
+
+def with_exclusions(prompt: str, questions: List[dict]) -> str:
+    """Append already-accepted questions so a regeneration does not repeat them"""
+    if not questions:
+        return prompt
+    listed = "\n".join(f"- {question['question']}" for question in questions)
+    return f"{prompt}\n\nDo not repeat any of these questions:\n{listed}"
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+def split_into_chunks(text: str, max_tokens: int) -> List[str]:
+    """Pack whole lines into chunks of at most `max_tokens`; overlong lines are wrapped at whitespace"""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    chunks = []
+    current: List[str] = []
+    current_chars = 0
+
+    def pieces(line: str):
+        while len(line) > max_chars:
+            cut = line.rfind(" ", 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            yield line[:cut]
+            line = line[cut:].lstrip()
+        yield line
+
+    for raw_line in text.splitlines():
+        for piece in pieces(raw_line.rstrip()):
+            if current and current_chars + len(piece) + 1 > max_chars:
+                chunks.append("\n".join(current))
+                current, current_chars = [], 0
+            current.append(piece)
+            current_chars += len(piece) + 1
+    if current:
+        chunks.append("\n".join(current))
+    return [chunk for chunk in chunks if chunk.strip()]
+
+
+def allocate_questions(chunk_sizes: List[int], num_questions: int) -> List[int]:
+    """
+    Split `num_questions` across chunks in proportion to their size using the
+    largest-remainder method. When there are more chunks than questions the
+    largest chunks win and the rest get zero.
+    """
+    total = sum(chunk_sizes)
+    if total == 0:
+        return [0] * len(chunk_sizes)
+    shares = [num_questions * size / total for size in chunk_sizes]
+    quotas = [int(share) for share in shares]
+    leftover = num_questions - sum(quotas)
+    by_remainder = sorted(range(len(shares)), key=lambda i: (shares[i] - quotas[i], chunk_sizes[i]), reverse=True)
+    for i in by_remainder[:leftover]:
+        quotas[i] += 1
+    return quotas
+
+
+def admit_question(index: near_duplicates.NearDuplicateIndex, question: dict) -> bool:
+    """Add `question` to `index` unless it is blank or nearly duplicates a question already there"""
+    if not quiz_schema.question_key(question):
+        return False
+    sig = near_duplicates.signature(question)
+    if index.query(sig) is not None:
+        return False
+    index.add(sig, question)
+    return True
+
+
+def question_index(questions: List[dict] = ()) -> near_duplicates.NearDuplicateIndex:
+    index = near_duplicates.NearDuplicateIndex()
+    for question in questions:
+        admit_question(index, question)
+    return index
+
+
+def merge_questions(question_lists: List[List[dict]], num_questions: int) -> List[dict]:
+    """Concatenate per-chunk questions in document order, dropping near-duplicates, up to `num_questions`"""
+    index = question_index()
+    merged = [
+        question
+        for questions in question_lists
+        for question in questions
+        if admit_question(index, question)
+    ]
+    return merged[:num_questions]
+
+
+PromptBuilder = Callable[[int], str]
+
+
+def _parse_completion(text: str, requested: int) -> quiz_schema.ParsedQuiz:
+    try:
+        return quiz_schema.parse_quiz_json(text)
+    except quiz_schema.QuizFormatError as e:
+        print(f"Discarding completion: {str(e)}")
+        return quiz_schema.ParsedQuiz(questions=[], invalid=requested)
+
+
+async def _generate(build_prompt: PromptBuilder, num_questions: int, exclude: List[dict] = ()) -> Tuple[List[llm.Completion], List[dict]]:
+    """
+    Ask for `num_questions` and then only for what is still missing: items
+    the model left out, failed validation or that nearly duplicate an
+    accepted (or excluded) question, up to GENERATION_REPAIR_ATTEMPTS extra
+    completions.
+    """
+    completions = []
+    questions = []
+    index = question_index(exclude)
+    to_generate = num_questions
+    for _ in range(1 + config.GENERATION_REPAIR_ATTEMPTS):
+        prompt = with_exclusions(build_prompt(to_generate), [*exclude, *questions])
+        completion = await llm.create_completion(prompt, response_format=quiz_schema.RESPONSE_FORMAT)
+        completions.append(completion)
+        parsed = _parse_completion(completion.text, to_generate)
+        questions.extend(question for question in parsed.questions if admit_question(index, question))
+        # Whatever is still missing, whether rejected or never returned
+        to_generate = num_questions - len(questions)
+        if to_generate <= 0:
+            break
+        print(f"Regenerating {to_generate} missing, invalid or duplicate questions")
+    return completions, questions[:num_questions]
+
+
+def _usage_entry(index: int, quota: int, completions: List[llm.Completion]) -> dict:
+    return {
+        "chunk": index,
+        "questions_requested": quota,
+        "prompt_tokens": sum(completion.prompt_tokens for completion in completions),
+        "completion_tokens": sum(completion.completion_tokens for completion in completions),
+        "repair_completions": len(completions) - 1
+    }
+
+
+async def generate_from_subject(subject: str, num_questions: int, difficulty: str, exclude: List[dict] = ()) -> GenerationResult:
+    completions, questions = await _generate(lambda n: build_subject_prompt(subject, n, difficulty), num_questions, exclude=exclude)
+    return GenerationResult(
+        quiz_text="\n\n".join(completion.text for completion in completions),
+        questions=questions,
+        usage=[_usage_entry(0, num_questions, completions)]
+    )
+
+
+async def generate_from_text(text: str, num_questions: int, difficulty: str) -> GenerationResult:
+    chunks = split_into_chunks(text, config.GENERATION_CHUNK_TOKENS)
+    if len(chunks) <= 1:
+        completions, questions = await _generate(lambda n: build_text_prompt(text, n, difficulty), num_questions)
+        return GenerationResult(
+            quiz_text="\n\n".join(completion.text for completion in completions),
+            questions=questions,
+            usage=[_usage_entry(0, num_questions, completions)]
+        )
+
+    quotas = allocate_questions([estimate_tokens(chunk) for chunk in chunks], num_questions)
+    semaphore = asyncio.Semaphore(config.GENERATION_CHUNK_CONCURRENCY)
+
+    async def run_chunk(chunk: str, quota: int) -> tuple:
+        async with semaphore:
+            return await _generate(lambda n: build_text_prompt(chunk, n, difficulty), quota)
+
+    selected = [(index, chunk, quota) for index, (chunk, quota) in enumerate(zip(chunks, quotas)) if quota > 0]
+    outputs = await asyncio.gather(*(run_chunk(chunk, quota) for _, chunk, quota in selected))
+
+    usage = [
+        _usage_entry(index, quota, completions)
+        for (index, _, quota), (completions, _) in zip(selected, outputs)
+    ]
+    return GenerationResult(
+        quiz_text="\n\n".join(completion.text for completions, _ in outputs for completion in completions),
+        questions=merge_questions([questions for _, questions in outputs], num_questions),
+        usage=usage
+    )
+
+
+ProgressCallback = Callable[[str, int], Awaitable[None]]
+
+
+def uses_question_bank(request: GenerationRequest, upload: Optional[SpooledUpload]) -> bool:
+    return config.QUESTION_BANK_ENABLED and bool(request.subject) and not (upload and request.file_name)
+
+
+async def complete_from_bank(request: GenerationRequest, bank_draw: question_bank.BankDraw) -> GenerationResult:
+    """
+    Top a bank draw up to the requested count with generated questions, which
+    are deposited in the bank; `bank_draw.ids` is extended to match.
+    """
+    drawn = len(bank_draw.questions)
+    missing = request.num_questions - drawn
+    if missing <= 0:
+        print(f"Assembled quiz on {request.subject} from the question bank")
+        return GenerationResult(quiz_text=json.dumps({"questions": bank_draw.questions}), questions=list(bank_draw.questions))
+
+    print(f"Question bank had {drawn} of {request.num_questions} questions on {request.subject}; generating {missing}")
+    # The draw holds no near-duplicates and the generation excludes it, so
+    # the quiz is the draw followed by the generated questions, in `ids` order
+    generation = await generate_from_subject(request.subject, missing, request.difficulty, exclude=bank_draw.questions)
+    bank_draw.ids.extend(await question_bank.deposit(request.subject, request.difficulty, generation.questions, "fallback"))
+    questions = [*bank_draw.questions, *generation.questions]
+    return GenerationResult(quiz_text=generation.quiz_text, questions=questions, usage=generation.usage)
+
+
+def resolve_source(request: GenerationRequest, upload: Optional[SpooledUpload]) -> Tuple[str, str]:
+    """Return the quiz title and generation cache key for a request"""
+    if upload and request.file_name:
+        source_key = f"{upload.sha256}:{request.page_start or ''}-{request.page_end or ''}"
+        cache_key = make_cache_key("file", source_key, request.difficulty, request.num_questions, config.OPENAI_MODEL)
+        return f"Quiz from {request.file_name}", cache_key
+    if request.subject:
+        cache_key = make_cache_key("subject", normalize_subject(request.subject), request.difficulty, request.num_questions, config.OPENAI_MODEL)
+        return f"Quiz on {request.subject}", cache_key
+    raise GenerationInputError("Either a file or a subject must be provided")
+
+
+def is_cacheable(request: GenerationRequest, questions: List[dict]) -> bool:
+    """
+    Only complete generations are cached: a short or empty one (a truncated
+    or failed completion) would otherwise be served to every identical
+    request until the entry expires.
+    """
+    return bool(questions) and len(questions) == request.num_questions
+
+
+async def load_source_text(request: GenerationRequest, upload: SpooledUpload) -> str:
+    if request.file_name.lower().endswith('.pdf'):
+        print(f"Processing PDF file: {request.file_name}")
+        file_text = await extract_pdf_text(upload.path, request.page_start, request.page_end)
+    else:
+        print(f"Processing text file: {request.file_name}")
+        try:
+            file_text = upload.read_bytes().decode("utf-8")
+        except UnicodeDecodeError:
+            raise GenerationInputError("Invalid text file encoding. Please use UTF-8 encoding.")
+
+    if not file_text.strip():
+        raise GenerationInputError("No text content could be extracted from the file")
+
+    print(f"Extracted text length: {len(file_text)} characters")
+    return file_text
+
+
+def build_quiz_doc(quiz_id: ObjectId, user_id: ObjectId, title: str, request: GenerationRequest, generation_usage: List[dict]) -> dict:
+    quiz_doc = {
+        "_id": quiz_id,
+        "user_id": user_id,
+        "title": title,
+        "source_file": request.file_name if request.file_name else "N/A",
+        # Normalized like question bank keys, so seen-question lookups match
+        "difficulty": normalize_difficulty(request.difficulty),
+        "num_questions": request.num_questions,
+        "created_at": datetime.utcnow(),
+        "generation_usage": generation_usage
+    }
+    if request.subject and not request.file_name:
+        # Counts towards the subject's popularity for the question bank
+        quiz_doc["subject_key"] = normalize_subject(request.subject)
+    return quiz_doc
+
+
+def build_question_doc(quiz_id: ObjectId, question_data: dict, order: int) -> dict:
+    """Build the stored question and tag `question_data` with its new ID"""
+    question_id = ObjectId()
+    question_data['id'] = str(question_id)
+    sig = near_duplicates.signature(question_data)
+    return {
+        "_id": question_id,
+        "quiz_id": quiz_id,
+        "question_text": question_data['question'],
+        "options": question_data['options'],
+        "correct_answers": question_data['correct_answers'],
+        "order": order,
+        "minhash": sig,
+        "lsh_bands": near_duplicates.band_keys(sig)
+    }
+
+
+async def share_stored_duplicates(question_docs: List[dict], questions: List[dict]):
+    """
+    With QUESTION_DEDUP_STORAGE, turn questions that nearly duplicate one
+    already stored into references to it (see db.stored_question). They take
+    on the stored wording, in `questions` too, so the quiz shows what is kept.
+    Embedded quizzes keep their questions inline and are left alone.
+    """
+    if not config.QUESTION_DEDUP_STORAGE or config.QUIZ_EMBED_QUESTIONS or not question_docs:
+        return
+    keys = sorted({key for doc in question_docs for key in doc["lsh_bands"]})
+    index = near_duplicates.NearDuplicateIndex()
+    for candidate in await db.find_near_duplicate_candidates(keys, question_docs[0]["quiz_id"]):
+        index.add(candidate["minhash"], candidate, candidate["lsh_bands"])
+    for doc, question in zip(question_docs, questions):
+        match = index.query(doc["minhash"], doc["lsh_bands"])
+        if match is None:
+            continue
+        shared, _ = match
+        doc.update({field: shared[field] for field in db.QUESTION_CONTENT_FIELDS}, duplicate_of=shared["_id"])
+        question.update(question=shared["question_text"], options=shared["options"], correct_answers=shared["correct_answers"])
+
+
+async def store_questions(question_docs: List[dict], questions: List[dict]):
+    """Add questions to a quiz that is already stored, sharing near-duplicates first"""
+    await share_stored_duplicates(question_docs, questions)
+    await db.insert_questions(question_docs)
+
+
+async def create_quiz(
+    user_id: ObjectId,
+    request: GenerationRequest,
+    upload: Optional[SpooledUpload] = None,
+    progress: Optional[ProgressCallback] = None,
+) -> dict:
+    """
+    Generate (or fetch from the generation cache) and store a quiz, returning
+    the /generate-quiz response body. `progress(stage, percent)` is awaited
+    as the pipeline moves through extracting, generating and saving.
+    """
+    async def report(stage: str, percent: int):
+        if progress:
+            await progress(stage, percent)
+
+    # Completions for this quiz queue fairly against other users' (see llm_dispatcher)
+    current_owner.set(str(user_id))
+    source_identifier, cache_key = resolve_source(request, upload)
+
+    cached_generation = None
+    bank_draw = None
+    bank_questions = 0
+    if uses_question_bank(request, upload):
+        bank_draw = await question_bank.draw(user_id, request.subject, request.difficulty, request.num_questions)
+        bank_questions = len(bank_draw.questions)
+    elif config.GENERATION_CACHE_ENABLED and not request.fresh:
+        cached_generation = await db.find_cached_generation(cache_key)
+
+    generation_usage = []
+    if bank_draw is not None:
+        if bank_questions < request.num_questions:
+            await report("generating", 30)
+        generation = await complete_from_bank(request, bank_draw)
+        quiz_text = generation.quiz_text
+        parsed_questions = generation.questions
+        generation_usage = generation.usage
+    elif cached_generation:
+        print(f"Generation cache hit for {source_identifier}")
+        quiz_text = cached_generation["quiz_text"]
+        parsed_questions = cached_generation["questions"]
+    else:
+        if upload and request.file_name:
+            await report("extracting", 10)
+            file_text = await load_source_text(request, upload)
+            await report("generating", 30)
+            generation = await generate_from_text(file_text, request.num_questions, request.difficulty)
+        else:
+            print(f"Generating quiz for subject: {request.subject}")
+            await report("generating", 30)
+            generation = await generate_from_subject(request.subject, request.num_questions, request.difficulty)
+
+        quiz_text = generation.quiz_text
+        parsed_questions = generation.questions
+        generation_usage = generation.usage
+        if config.GENERATION_CACHE_ENABLED and is_cacheable(request, parsed_questions):
+            await db.store_cached_generation(cache_key, quiz_text, parsed_questions)
+
+    await report("saving", 90)
+
+    # IDs are assigned client-side so the quiz and all of its questions
+    # can be written in one batch and the response built without waiting
+    # on individual inserts.
+    quiz_id = ObjectId()
+    quiz_doc = build_quiz_doc(quiz_id, user_id, source_identifier, request, generation_usage)
+    if bank_draw is not None:
+        quiz_doc["bank_question_ids"] = bank_draw.ids
+    question_docs = [
+        build_question_doc(quiz_id, question_data, i + 1)
+        for i, question_data in enumerate(parsed_questions)
+    ]
+    await share_stored_duplicates(question_docs, parsed_questions)
+    quiz_doc["answer_key"] = build_answer_key(question_docs)
+
+    await db.insert_quiz_with_questions(quiz_doc, question_docs)
+
+    return {
+        "quiz": quiz_text,
+        "quiz_id": str(quiz_id),
+        "parsed_questions": parsed_questions, # Return questions with IDs
+        "cached": cached_generation is not None,
+        "bank_questions": bank_questions
+    }
+
+
+async def stream_questions(
+    prompts: List[Tuple[int, PromptBuilder, int]],
+    num_questions: int,
+    result: GenerationResult,
+    exclude: List[dict] = (),
+) -> AsyncIterator[dict]:
+    """
+    Stream (chunk index, prompt builder, quota) completions concurrently and
+    yield questions in arrival order, skipping near-duplicates of each other
+    and of `exclude`, stopping at `num_questions`. Items that fail validation
+    are replaced once the chunk's stream ends; questions dropped because they
+    nearly duplicate one from another chunk are regenerated from their own
+    chunk once every stream has ended. Completion text and usage are
+    collected into `result`.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    semaphore = asyncio.Semaphore(config.GENERATION_CHUNK_CONCURRENCY)
+    texts = {}
+
+    async def run_stream(index: int, build_prompt: PromptBuilder, quota: int):
+        try:
+            async with semaphore:
+                prompt = build_prompt(quota)
+                stream = llm.CompletionStream(prompt, response_format=quiz_schema.RESPONSE_FORMAT)
+                scanner = quiz_schema.StreamingQuestionScanner()
+                accepted = []
+                invalid = 0
+                finished = False
+                try:
+                    async for delta in stream:
+                        for item in scanner.feed(delta):
+                            question = quiz_schema.validate_question(item)
+                            if question is None:
+                                invalid += 1
+                                continue
+                            accepted.append(question)
+                            await queue.put((index, question))
+                    finished = True
+                finally:
+                    # Streams cut off once enough questions arrived report no
+                    # usage; estimate the completion side from the text received
+                    completion = stream.completion
+                    texts[index] = completion.text
+                    usage = completion.usage()
+                    if not finished:
+                        usage = {"prompt_tokens": estimate_tokens(prompt), "completion_tokens": estimate_tokens(completion.text), "truncated": True}
+                    result.usage.append({"chunk": index, "questions_requested": quota, **usage})
+
+                missing = min(invalid + scanner.malformed, quota - len(accepted))
+                if not accepted and not invalid:
+                    # Nothing recognizable came through the scanner; count the whole quota as lost
+                    missing = quota
+                if missing > 0:
+                    print(f"Regenerating {missing} invalid questions for chunk {index}")
+                    completions, replacements = await _generate(build_prompt, missing, exclude=accepted)
+                    result.usage.append(_usage_entry(index, missing, completions))
+                    for question in replacements:
+                        await queue.put((index, question))
+            await queue.put(None)
+        except BaseException as e:
+            await queue.put(e)
+            raise
+
+    tasks = [asyncio.create_task(run_stream(index, build_prompt, quota)) for index, build_prompt, quota in prompts]
+    builders = {index: build_prompt for index, build_prompt, _ in prompts}
+    try:
+        seen = question_index(exclude)
+        dropped = {}
+        running = len(tasks)
+        while running and len(result.questions) < num_questions:
+            item = await queue.get()
+            if item is None:
+                running -= 1
+                continue
+            if isinstance(item, BaseException):
+                raise item
+            chunk, question = item
+            if not admit_question(seen, question):
+                dropped[chunk] = dropped.get(chunk, 0) + 1
+                continue
+            result.questions.append(question)
+            yield question
+
+        # Chunks cover overlapping material, so their questions can collide;
+        # ask each chunk again for the ones it lost to another chunk
+        for chunk, count in sorted(dropped.items()):
+            missing = min(count, num_questions - len(result.questions))
+            if missing <= 0:
+                break
+            print(f"Regenerating {missing} duplicate questions for chunk {chunk}")
+            completions, replacements = await _generate(builders[chunk], missing, exclude=[*exclude, *result.questions])
+            result.usage.append(_usage_entry(chunk, missing, completions))
+            for question in replacements:
+                if admit_question(seen, question):
+                    result.questions.append(question)
+                    yield question
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        result.quiz_text = "\n\n".join(texts[index] for index in sorted(texts))
+
+
+async def stream_quiz(user_id: ObjectId, request: GenerationRequest, upload: Optional[SpooledUpload] = None) -> AsyncIterator[dict]:
+    """
+    Generate a quiz as a stream of events:
+
+        {"type": "quiz", "quiz_id", "title"}       quiz record created
+        {"type": "question", "index", "question"}  question stored (with its ID)
+        {"type": "done", "quiz_id", "num_questions", "requested", "cached", "bank_questions"}
+
+    Subject quizzes emit their question bank draw first and stream only the
+    rest from the LLM. The quiz is stored up front with status "generating"
+    and each question is inserted as it is parsed. `num_questions` in the done
+    event is how many were stored, which is less than `requested` when the
+    model could not produce enough distinct questions. If generation fails or
+    the client goes away, a quiz with no questions is removed and one with
+    some is kept as "partial".
+    """
+    current_owner.set(str(user_id))
+    source_identifier, cache_key = resolve_source(request, upload)
+
+    cached_generation = None
+    bank_draw = None
+    if uses_question_bank(request, upload):
+        bank_draw = await question_bank.draw(user_id, request.subject, request.difficulty, request.num_questions)
+    elif config.GENERATION_CACHE_ENABLED and not request.fresh:
+        cached_generation = await db.find_cached_generation(cache_key)
+    bank_questions = list(bank_draw.questions) if bank_draw is not None else []
+
+    quiz_id = ObjectId()
+    quiz_doc = build_quiz_doc(quiz_id, user_id, source_identifier, request, [])
+    quiz_doc["status"] = "generating"
+    if bank_draw is not None:
+        quiz_doc["bank_question_ids"] = list(bank_draw.ids)
+    await db.insert_quiz(quiz_doc)
+    yield {"type": "quiz", "quiz_id": str(quiz_id), "title": source_identifier}
+
+    result = GenerationResult(quiz_text="", questions=[])
+    question_docs = []
+    stored = 0
+    try:
+        if cached_generation:
+            print(f"Generation cache hit for {source_identifier}")
+            questions = cached_generation["questions"]
+            question_docs = [build_question_doc(quiz_id, q, i + 1) for i, q in enumerate(questions)]
+            await store_questions(question_docs, questions)
+            stored = len(questions)
+            for i, question in enumerate(questions):
+                yield {"type": "question", "index": i, "question": question}
+        else:
+            if bank_questions:
+                question_docs = [build_question_doc(quiz_id, q, i + 1) for i, q in enumerate(bank_questions)]
+                await store_questions(question_docs, bank_questions)
+                stored = len(bank_questions)
+                for i, question in enumerate(bank_questions):
+                    yield {"type": "question", "index": i, "question": question}
+
+            if bank_draw is not None:
+                missing = request.num_questions - stored
+                if missing > 0:
+                    print(f"Question bank had {stored} of {request.num_questions} questions on {request.subject}; streaming {missing}")
+                def build_prompt(n: int) -> str:
+                    return with_exclusions(build_subject_prompt(request.subject, n, request.difficulty), bank_questions)
+                prompts = [(0, build_prompt, missing)] if missing > 0 else []
+            elif upload and request.file_name:
+                file_text = await load_source_text(request, upload)
+                chunks = split_into_chunks(file_text, config.GENERATION_CHUNK_TOKENS)
+                if len(chunks) <= 1:
+                    chunks = [file_text]
+                quotas = allocate_questions([estimate_tokens(chunk) for chunk in chunks], request.num_questions)
+                prompts = [
+                    (index, partial(build_text_prompt, chunk, difficulty=request.difficulty), quota)
+                    for index, (chunk, quota) in enumerate(zip(chunks, quotas)) if quota > 0
+                ]
+            else:
+                print(f"Streaming quiz for subject: {request.subject}")
+                prompts = [(0, partial(build_subject_prompt, request.subject, difficulty=request.difficulty), request.num_questions)]
+
+            async for question in stream_questions(prompts, request.num_questions - stored, result, exclude=bank_questions):
+                question_docs.append(build_question_doc(quiz_id, question, stored + 1))
+                await store_questions(question_docs[-1:], [question])
+                yield {"type": "question", "index": stored, "question": question}
+                stored += 1
+
+            if bank_draw is not None:
+                bank_draw.ids.extend(await question_bank.deposit(request.subject, request.difficulty, result.questions, "fallback"))
+            elif config.GENERATION_CACHE_ENABLED and is_cacheable(request, result.questions):
+                cacheable = [{k: v for k, v in q.items() if k != 'id'} for q in result.questions]
+                await db.store_cached_generation(cache_key, result.quiz_text, cacheable)
+    except BaseException:
+        if stored == 0:
+            await db.delete_quiz_with_questions(quiz_id)
+        else:
+            await db.update_quiz(quiz_id, {
+                "status": "partial",
+                "num_questions": stored,
+                "generation_usage": result.usage,
+                "answer_key": build_answer_key(question_docs[:stored])
+            })
+        raise
+
+    ready = {
+        "status": "ready",
+        "num_questions": stored,
+        "generation_usage": result.usage,
+        "answer_key": build_answer_key(question_docs)
+    }
+    if bank_draw is not None:
+        ready["bank_question_ids"] = bank_draw.ids
+    await db.update_quiz(quiz_id, ready)
+    yield {
+        "type": "done",
+        "quiz_id": str(quiz_id),
+        "num_questions": stored,
+        "requested": request.num_questions,
+        "cached": cached_generation is not None,
+        "bank_questions": len(bank_questions)
+    }
@@ -0,0 +1,257 @@
+"""
+Structured quiz output: the JSON schema the model is asked to follow and the
+validator for what comes back.
+
+Completions are requested with a strict JSON-schema response format:
+
+    {"questions": [{"question": "...", "options": ["...", ...], "correct_answers": ["A", ...]}]}
+
+Well-formed documents are decoded and validated in a single pass by a
+validator compiled at import time. When that fails, the document is decoded
+and each question validated on its own: items that fail are repaired locally (answer
+letters in the wrong case or given as option text, "A. " prefixes left on
+options); only items that still fail are counted as invalid so the caller
+can regenerate that many questions instead of failing the whole quiz.
+Streamed completions go through StreamingQuestionScanner, which hands over
+each question object as soon as its closing brace arrives.
+"""
+import json
+import re
+from dataclasses import dataclass
+from typing import List, Optional
+
+from pydantic import BaseModel, ConfigDict, Field, StringConstraints, TypeAdapter, ValidationError, model_validator
+from pydantic_core import from_json
+from typing_extensions import Annotated
+
+MIN_OPTIONS = 2
+MAX_OPTIONS = 8
+OPTION_LETTERS = [chr(65 + i) for i in range(MAX_OPTIONS)]
+
+QUIZ_JSON_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "questions": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "question": {"type": "string"},
+                    "options": {"type": "array", "items": {"type": "string"}},
+                    "correct_answers": {"type": "array", "items": {"type": "string", "enum": OPTION_LETTERS}}
+                },
+                "required": ["question", "options", "correct_answers"],
+                "additionalProperties": False
+            }
+        }
+    },
+    "required": ["questions"],
+    "additionalProperties": False
+}
+
+RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {"name": "quiz", "strict": True, "schema": QUIZ_JSON_SCHEMA}
+}
+
+NonEmptyStr = Annotated[str, StringConstraints(strip_whitespace=True, min_length=1)]
+
+
+class QuizFormatError(ValueError):
+    """Raised when a completion is not a JSON quiz document at all"""
+
+
+class GeneratedQuestion(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
+    question: NonEmptyStr
+    options: List[NonEmptyStr] = Field(min_length=MIN_OPTIONS, max_length=MAX_OPTIONS)
+    correct_answers: List[NonEmptyStr] = Field(min_length=1)
+
+    @model_validator(mode="after")
+    def check_correct_answers(self) -> "GeneratedQuestion":
+        valid_letters = OPTION_LETTERS[:len(self.options)]
+        unknown = [answer for answer in self.correct_answers if answer not in valid_letters]
+        if unknown:
+            raise ValueError(f"correct_answers {unknown} do not name one of the {len(self.options)} options")
+        self.correct_answers = sorted(set(self.correct_answers))
+        return self
+
+
+class GeneratedQuiz(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
+    questions: List[GeneratedQuestion]
+
+
+_question_validator = TypeAdapter(GeneratedQuestion)
+_quiz_validator = TypeAdapter(GeneratedQuiz)
+
+_OPTION_PREFIX = re.compile(r"^\(?[A-Ha-h][.):]\s+")
+_ANSWER_LETTER = re.compile(r"^\(?([A-Ha-h])(?:[.):]|\s|$)")
+
+
+def repair_question(raw: dict) -> dict:
+    """Best-effort fixes for the mistakes models make most often; never raises"""
+    repaired = dict(raw)
+    options = raw.get("options")
+    if isinstance(options, list):
+        repaired["options"] = [
+            _OPTION_PREFIX.sub("", option) if isinstance(option, str) else option
+            for option in options
+        ]
+    answers = raw.get("correct_answers")
+    if isinstance(answers, str):
+        answers = re.split(r"[,\s]+", answers)
+    if isinstance(answers, list):
+        option_texts = [o.strip().casefold() for o in repaired.get("options") or [] if isinstance(o, str)]
+        letters = []
+        for answer in answers:
+            if not isinstance(answer, str) or not answer.strip():
+                continue
+            answer = answer.strip()
+            if answer.casefold() in option_texts:
+                letters.append(OPTION_LETTERS[option_texts.index(answer.casefold())])
+                continue
+            match = _ANSWER_LETTER.match(answer)
+            if match:
+                letters.append(match.group(1).upper())
+        repaired["correct_answers"] = letters
+    return repaired
+
+
+def validate_question(raw) -> Optional[dict]:
+    """Return the question in stored form, repairing it if needed, or None if it is unusable"""
+    if not isinstance(raw, dict):
+        return None
+    try:
+        return _question_validator.validate_python(raw).model_dump()
+    except ValidationError:
+        pass
+    try:
+        return _question_validator.validate_python(repair_question(raw)).model_dump()
+    except ValidationError:
+        return None
+
+
+def question_key(question: dict) -> str:
+    """Normalized question text, for spotting the same question worded with different case or punctuation"""
+    return re.sub(r"[^a-z0-9]+", " ", (question.get("question") or "").casefold()).strip()
+
+
+@dataclass
+class ParsedQuiz:
+    questions: List[dict]
+    invalid: int = 0
+
+
+def _strip_code_fence(text: str) -> str:
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.split("\n", 1)[1] if "\n" in text else ""
+        text = text.rsplit("```", 1)[0]
+    return text
+
+
+def parse_quiz_json(text: str) -> ParsedQuiz:
+    """Decode a quiz document and validate each question independently"""
+    try:
+        quiz = _quiz_validator.validate_json(text)
+        return ParsedQuiz(questions=[question.model_dump() for question in quiz.questions])
+    except ValidationError:
+        pass
+
+    try:
+        document = from_json(text)
+    except ValueError:
+        try:
+            document = json.loads(_strip_code_fence(text))
+        except ValueError:
+            raise QuizFormatError("Completion is not valid JSON")
+
+    items = document.get("questions") if isinstance(document, dict) else document
+    if not isinstance(items, list):
+        raise QuizFormatError("Completion has no questions array")
+
+    questions = []
+    invalid = 0
+    for item in items:
+        question = validate_question(item)
+        if question is None:
+            invalid += 1
+        else:
+            questions.append(question)
+    return ParsedQuiz(questions=questions, invalid=invalid)
+
+
+_STRUCTURAL = re.compile(r'[{}\[\]"]')
+_STRING_SPECIAL = re.compile(r'["\\]')
+
+
+class StreamingQuestionScanner:
+    """
+    Incremental scanner for a streamed quiz document. Tracks string and
+    nesting state across deltas and returns each question object (decoded,
+    not yet validated) as soon as it closes, without re-scanning earlier text.
+    """
+
+    # Question objects open at depth 3: {"questions": [ {...} ]}
+    ITEM_DEPTH = 3
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._item_start = None
+        self.malformed = 0
+
+    def feed(self, delta: str) -> List[dict]:
+        buffer = self._buffer + delta
+        pos = self._pos
+        items = []
+        while True:
+            if self._in_string:
+                match = _STRING_SPECIAL.search(buffer, pos)
+                if not match:
+                    pos = len(buffer)
+                    break
+                if match.group() == "\\":
+                    if match.end() >= len(buffer):
+                        # Escape split across deltas: resume from the backslash
+                        pos = match.start()
+                        break
+                    pos = match.end() + 1
+                    continue
+                self._in_string = False
+                pos = match.end()
+                continue
+
+            match = _STRUCTURAL.search(buffer, pos)
+            if not match:
+                pos = len(buffer)
+                break
+            char = match.group()
+            pos = match.end()
+            if char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+                if char == "{" and self._depth == self.ITEM_DEPTH:
+                    self._item_start = match.start()
+            else:
+                if char == "}" and self._depth == self.ITEM_DEPTH and self._item_start is not None:
+                    try:
+                        items.append(from_json(buffer[self._item_start:pos]))
+                    except ValueError:
+                        self.malformed += 1
+                    self._item_start = None
+                self._depth -= 1
+
+        # Keep only the unfinished item (if any) so the buffer stays small
+        keep_from = self._item_start if self._item_start is not None else pos
+        self._buffer = buffer[keep_from:]
+        self._pos = pos - keep_from
+        if self._item_start is not None:
+            self._item_start = 0
+        return items
@@ -0,0 +1,67 @@
+"""
+Request handling of /generate-quiz and /generate-quiz/stream for uploads
+that cannot be used, and of job lookups with malformed IDs. Run with pytest;
+no database or LLM is needed because these requests fail before anything is
+stored, generated or looked up.
+"""
+import json
+
+import pytest
+from bson import ObjectId
+from fastapi.testclient import TestClient
+
+import main
+from config import config
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(config, "GENERATION_CACHE_ENABLED", False)
+    main.app.dependency_overrides[main.get_current_user] = lambda: main.UserResponse(_id=str(ObjectId()), username="tester")
+    try:
+        yield TestClient(main.app)
+    finally:
+        main.app.dependency_overrides.clear()
+
+
+CORRUPT_PDF = b"%PDF-1.4\nthis is not really a pdf"
+
+
+def test_corrupt_pdf_is_rejected(client):
+    response = client.post("/generate-quiz", files={"file": ("notes.pdf", CORRUPT_PDF, "application/pdf")})
+    assert response.status_code == 400
+    assert "PDF" in response.json()["detail"]
+
+
+def test_non_pdf_bytes_are_rejected(client):
+    response = client.post("/generate-quiz", files={"file": ("notes.pdf", b"\x00\x01 plain bytes", "application/pdf")})
+    assert response.status_code == 400
+
+
+def test_corrupt_pdf_stream_reports_400(client, monkeypatch):
+    async def ignore(*args):
+        pass
+
+    # The stream stores its quiz up front and removes it again on failure
+    monkeypatch.setattr(main.db, "insert_quiz", ignore)
+    monkeypatch.setattr(main.db, "delete_quiz_with_questions", ignore)
+    response = client.post("/generate-quiz/stream", files={"file": ("notes.pdf", CORRUPT_PDF, "application/pdf")})
+    events = [json.loads(line) for line in response.text.splitlines() if line]
+    assert events[-1]["type"] == "error"
+    assert events[-1]["status"] == 400
+
+
+@pytest.mark.parametrize("field", ["num_questions", "page_start", "page_end"])
+def test_non_integer_form_fields_are_rejected(client, field):
+    response = client.post(
+        "/generate-quiz",
+        data={field: "ten"},
+        files={"file": ("notes.pdf", CORRUPT_PDF, "application/pdf")},
+    )
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize("path", ["/jobs/not-an-id", "/jobs/not-an-id/events"])
+def test_malformed_job_id_is_not_found(client, path):
+    response = client.get(path)
+    assert response.status_code == 404
@@ -0,0 +1,145 @@
+"""
+Exercise the LLM dispatcher against the rate-limited fake OpenAI server.
+
+Two API keys share a fake server that allows REQUESTS_PER_WINDOW requests
+per key every WINDOW seconds. The tests check that completions spread over
+both keys, that a burst larger than the combined budget completes without
+tripping the limits once the budgets are known, that a blind burst recovers
+from 429s, and that a user queued behind a large generation is still served
+promptly. No MongoDB or network access is needed.
+
+Usage:
+    python -m pytest test_llm_dispatcher.py
+"""
+import asyncio
+import time
+
+import pytest
+
+import fake_openai
+import llm
+import llm_dispatcher
+from api_keys import key_provider
+from config import config
+
+FAKE_PORT = 8766
+REQUESTS_PER_WINDOW = 10
+WINDOW = 2.0
+LATENCY = 0.05
+
+
+@pytest.fixture(scope="module")
+def loop():
+    """One event loop for the module, so the dispatcher and HTTP clients outlive a single test"""
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+@pytest.fixture(scope="module")
+def state(loop):
+    """Start the fake server with two keys configured and yield its app.state"""
+    patch = pytest.MonkeyPatch()
+    patch.setattr(config, "OPENAI_API_KEY", "sk-test-key-alpha,sk-test-key-bravo")
+    patch.setattr(config, "OPENAI_BASE_URL", f"http://127.0.0.1:{FAKE_PORT}/v1")
+    patch.setattr(config, "LLM_BACKOFF_BASE_SECONDS", 0.2)
+    patch.setattr(config, "LLM_MAX_CONCURRENCY", config.LLM_MAX_CONCURRENCY)
+    server = fake_openai.start_in_thread(
+        FAKE_PORT,
+        latency=LATENCY,
+        requests_per_minute=REQUESTS_PER_WINDOW,
+        window=WINDOW,
+    )
+    loop.run_until_complete(key_provider.refresh())
+    try:
+        yield server.config.app.state
+    finally:
+        loop.run_until_complete(llm.close_client())
+        server.should_exit = True
+        patch.undo()
+        reset_dispatcher()
+        # Forget the test keys so later users reload them from the configuration
+        key_provider._loaded_at = None
+
+
+def reset_dispatcher():
+    llm.dispatcher = llm_dispatcher.dispatcher = llm_dispatcher.Dispatcher()
+
+
+async def run_completions(count: int, owner: str = "") -> list:
+    async def one():
+        llm_dispatcher.current_owner.set(owner)
+        await llm.create_completion("Generate a quiz about rate limits")
+        return time.monotonic()
+    return await asyncio.gather(*(one() for _ in range(count)))
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("20ms", 0.02), ("1.5s", 1.5), ("6m0s", 360.0), ("1h2m3s", 3723.0), ("7", 7.0), ("", None),
+])
+def test_parse_duration(value, expected):
+    parsed = llm_dispatcher.parse_duration(value)
+    if expected is None:
+        assert parsed is None
+    else:
+        assert parsed == pytest.approx(expected)
+
+
+def test_spread(loop, state):
+    reset_dispatcher()
+    config.LLM_MAX_CONCURRENCY = 1
+    state.requests_by_key.clear()
+    loop.run_until_complete(run_completions(6))
+    assert sorted(state.requests_by_key.values()) == [3, 3], state.requests_by_key
+
+
+def test_saturated_burst(loop, state):
+    # Once the budgets are known the dispatcher should wait instead of hitting 429s
+    reset_dispatcher()
+    config.LLM_MAX_CONCURRENCY = 1
+    loop.run_until_complete(run_completions(2))
+    config.LLM_MAX_CONCURRENCY = 8
+    loop.run_until_complete(asyncio.sleep(WINDOW))
+    rejected_before = state.rate_limiter.rejected
+    count = 3 * REQUESTS_PER_WINDOW
+    start = time.monotonic()
+    finished = loop.run_until_complete(run_completions(count))
+    elapsed = time.monotonic() - start
+    rejected = state.rate_limiter.rejected - rejected_before
+    # 2 keys x REQUESTS_PER_WINDOW immediately, the rest as the budgets refill
+    expected = (count - 2 * REQUESTS_PER_WINDOW) / (2 * REQUESTS_PER_WINDOW / WINDOW)
+    assert len(finished) == count
+    assert rejected <= 2
+    assert elapsed >= expected * 0.7, f"{elapsed:.2f}s, refill bound {expected:.2f}s"
+
+
+def test_blind_burst_recovers(loop, state):
+    # A fresh dispatcher knows nothing about the limits, so the first wave overshoots
+    reset_dispatcher()
+    config.LLM_MAX_CONCURRENCY = 30
+    loop.run_until_complete(asyncio.sleep(WINDOW))
+    rejected_before = state.rate_limiter.rejected
+    finished = loop.run_until_complete(run_completions(30))
+    rejected = state.rate_limiter.rejected - rejected_before
+    cooled = sum(key["rate_limited"] for key in llm.dispatcher.stats()["keys"].values())
+    assert len(finished) == 30
+    assert rejected > 0
+    # Every 429 put its key into cool-down and was retried
+    assert cooled == rejected
+
+
+def test_fair_queue(loop, state):
+    # One user floods the queue; a second user's requests must not wait behind all of it
+    reset_dispatcher()
+    config.LLM_MAX_CONCURRENCY = 2
+    loop.run_until_complete(asyncio.sleep(WINDOW))
+
+    async def race():
+        flood = asyncio.create_task(run_completions(16, owner="flooding-user"))
+        await asyncio.sleep(0.01)
+        light_done = await run_completions(2, owner="light-user")
+        return light_done, await flood
+
+    light_done, flood_done = loop.run_until_complete(race())
+    finished_before = sum(1 for t in flood_done if t < max(light_done))
+    assert finished_before <= 6, f"second user served after {finished_before} of 16"
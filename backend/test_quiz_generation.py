@@ -0,0 +1,154 @@
+"""
+Question generation against scripted completions. Run with pytest; the LLM
+is replaced by a queue of canned responses, so no API key is needed.
+"""
+import asyncio
+import json
+
+import pytest
+from bson import ObjectId
+
+import llm
+import question_bank
+import quiz_generation
+from config import config
+
+TOPICS = ["photosynthesis", "plate tectonics", "the French Revolution", "binary search", "supply and demand",
+          "the water cycle", "prime numbers", "Shakespeare's sonnets", "vaccination", "compound interest"]
+
+
+def make_questions(topics):
+    return [
+        {"question": f"Which statement about {topic} is correct?", "options": [f"{topic} {word}" for word in ("alpha", "beta", "gamma", "delta")], "correct_answers": ["A"]}
+        for topic in topics
+    ]
+
+
+class ScriptedStream:
+    def __init__(self, text):
+        self.text = text
+        self.completion = llm.Completion(text="")
+
+    async def __aiter__(self):
+        for start in range(0, len(self.text), 40):
+            await asyncio.sleep(0)
+            yield self.text[start:start + 40]
+        self.completion.text = self.text
+
+
+class ScriptedLLM:
+    """
+    Answers each create_completion call with the next queued list of
+    questions, and each streamed prompt with the questions listed for it
+    """
+
+    def __init__(self):
+        self.responses = []
+        self.prompts = []
+        self.streams = {}
+
+    def append(self, questions):
+        self.responses.append(questions)
+
+    async def create_completion(self, prompt, **kwargs):
+        self.prompts.append(prompt)
+        questions = self.responses.pop(0) if self.responses else []
+        return llm.Completion(text=json.dumps({"questions": questions}))
+
+    def stream(self, prompt, **kwargs):
+        return ScriptedStream(json.dumps({"questions": self.streams.get(prompt, [])}))
+
+
+@pytest.fixture
+def completions(monkeypatch):
+    scripted = ScriptedLLM()
+    monkeypatch.setattr(llm, "create_completion", scripted.create_completion)
+    monkeypatch.setattr(llm, "CompletionStream", scripted.stream)
+    monkeypatch.setattr(config, "GENERATION_REPAIR_ATTEMPTS", 2)
+    return scripted
+
+
+def test_short_completion_is_topped_up(completions):
+    completions.append(make_questions(TOPICS[:4]))
+    completions.append(make_questions(TOPICS[4:5]))
+
+    result = asyncio.run(quiz_generation.generate_from_subject("science", 5, "medium"))
+
+    assert len(result.questions) == 5
+    assert len(completions.prompts) == 2
+    assert "Generate 1 " in completions.prompts[1]
+    assert result.usage[0]["repair_completions"] == 1
+
+
+def test_near_duplicates_are_replaced(completions):
+    questions = make_questions(TOPICS[:3])
+    duplicate = dict(questions[0], question=questions[0]["question"].upper().rstrip("?"))
+    completions.append(questions + [duplicate])
+    completions.append(make_questions(TOPICS[3:4]))
+
+    result = asyncio.run(quiz_generation.generate_from_subject("science", 4, "medium"))
+
+    assert [q["question"] for q in result.questions] == [q["question"] for q in make_questions(TOPICS[:4])]
+
+
+def test_repairs_are_bounded(completions):
+    completions.append(make_questions(TOPICS[:2]))
+
+    result = asyncio.run(quiz_generation.generate_from_subject("science", 5, "medium"))
+
+    assert len(result.questions) == 2
+    assert len(completions.prompts) == 1 + config.GENERATION_REPAIR_ATTEMPTS
+
+
+def test_stream_replaces_duplicates_across_chunks(completions):
+    first, second = make_questions(TOPICS[:2]), make_questions(TOPICS[2:3])
+    # The second chunk repeats a question of the first one
+    completions.streams["chunk 0: 2"] = first
+    completions.streams["chunk 1: 2"] = second + [dict(first[0], question=first[0]["question"].upper())]
+    completions.append(make_questions(TOPICS[3:4]))
+    prompts = [(chunk, lambda n, chunk=chunk: f"chunk {chunk}: {n}", 2) for chunk in (0, 1)]
+    result = quiz_generation.GenerationResult(quiz_text="", questions=[])
+
+    async def collect():
+        return [question async for question in quiz_generation.stream_questions(prompts, 4, result)]
+
+    streamed = asyncio.run(collect())
+
+    assert len(streamed) == 4
+    assert {q["question"] for q in streamed} == {q["question"] for q in make_questions(TOPICS[:4])}
+    assert len(completions.prompts) == 1
+    assert completions.prompts[0].startswith("chunk 1: 1")
+
+
+def test_bank_draw_near_duplicates_keep_ids_aligned(completions, monkeypatch):
+    bank = make_questions(TOPICS[:3])
+    bank.insert(1, dict(bank[0], question=bank[0]["question"].upper()))
+    docs = [{"_id": ObjectId(), **question} for question in bank]
+    deposited = []
+
+    async def sample(*args):
+        return docs
+
+    async def no_seen(*args):
+        return []
+
+    async def deposit(subject, difficulty, questions, source):
+        deposited.extend(questions)
+        return [ObjectId() for _ in questions]
+
+    monkeypatch.setattr(question_bank.db, "find_seen_bank_question_ids", no_seen)
+    monkeypatch.setattr(question_bank.db, "sample_bank_questions", sample)
+    monkeypatch.setattr(question_bank, "deposit", deposit)
+    completions.append(make_questions(TOPICS[3:5]))
+    request = quiz_generation.GenerationRequest(num_questions=5, subject="science")
+
+    async def run():
+        bank_draw = await question_bank.draw(ObjectId(), "science", "medium", 5)
+        return bank_draw, await quiz_generation.complete_from_bank(request, bank_draw)
+
+    bank_draw, result = asyncio.run(run())
+
+    assert bank_draw.ids[:3] == [docs[0]["_id"], docs[2]["_id"], docs[3]["_id"]]
+    assert len(bank_draw.ids) == len(result.questions) == 5
+    assert "Generate 2 " in completions.prompts[0]
+    assert deposited == result.questions[3:]
@@ -0,0 +1,88 @@
+"""
+Materialized per-user attempt statistics.
+
+Each user has one user_stats document (`_id` is the user's ID) holding
+running totals over their attempts, overall and per difficulty:
+
+    {
+        "_id": user_id,
+        "total_attempts": 12, "total_correct": 87, "total_questions": 120,
+        "total_time_seconds": 3410.5, "total_score": 871.7, "best_score": 100.0,
+        "by_difficulty": {"medium": {"total_attempts": 7, ..., "best_score": 90.0}, ...},
+        "updated_at": ...
+    }
+
+db.insert_attempt adds an attempt with $inc and $max and deleting attempts
+subtracts them again (see db.delete_attempt), so reading the stats is a
+single _id lookup however long the history is. Averages are derived from the
+totals when the document is served. backfill_user_stats.py rebuilds the
+documents from the attempts themselves.
+"""
+from typing import Iterable, Optional
+
+from generation_cache import normalize_difficulty
+
+COUNTERS = ("total_attempts", "total_correct", "total_questions", "total_time_seconds", "total_score")
+UNKNOWN_DIFFICULTY = "unknown"
+
+
+def difficulty_key(difficulty: Optional[str]) -> str:
+    """Difficulties are field names under by_difficulty, so they must not contain '.' or start with '$'"""
+    key = normalize_difficulty(difficulty or "").replace(".", "_").lstrip("$")
+    return key or UNKNOWN_DIFFICULTY
+
+
+def attempt_counters(attempt: dict) -> dict:
+    """What one attempt adds to each counter"""
+    return {
+        "total_attempts": 1,
+        "total_correct": attempt["correct_answers"],
+        "total_questions": attempt["total_questions"],
+        "total_time_seconds": attempt.get("time_taken_seconds") or 0,
+        "total_score": attempt["score"],
+    }
+
+
+def increments(attempts: Iterable[dict], sign: int = 1) -> dict:
+    """
+    A $inc document for the overall and per-difficulty counters of
+    `attempts`, which must carry their `difficulty`; sign -1 subtracts them.
+    """
+    inc = {}
+    for attempt in attempts:
+        prefix = f"by_difficulty.{difficulty_key(attempt.get('difficulty'))}."
+        for name, value in attempt_counters(attempt).items():
+            for field in (name, prefix + name):
+                inc[field] = inc.get(field, 0) + sign * value
+    return inc
+
+
+def summarize(totals: dict) -> dict:
+    """Counters of one level of a stats document plus the values derived from them"""
+    attempts = totals.get("total_attempts", 0)
+    questions = totals.get("total_questions", 0)
+    correct = totals.get("total_correct", 0)
+    return {
+        "total_attempts": attempts,
+        "total_correct": correct,
+        "total_questions": questions,
+        "total_incorrect": questions - correct,
+        "total_time_seconds": totals.get("total_time_seconds", 0),
+        "average_score": totals.get("total_score", 0) / attempts if attempts else 0,
+        "best_score": totals.get("best_score", 0) if attempts else 0,
+        "global_score": correct / questions * 100 if questions else 0,
+        "average_time_seconds": totals.get("total_time_seconds", 0) / attempts if attempts else 0,
+    }
+
+
+def serialize(stats_doc: Optional[dict]) -> dict:
+    """The API form of a user_stats document; a user without one has no attempts yet"""
+    stats_doc = stats_doc or {}
+    return {
+        **summarize(stats_doc),
+        "by_difficulty": {
+            difficulty: summarize(totals)
+            for difficulty, totals in sorted((stats_doc.get("by_difficulty") or {}).items())
+            if totals.get("total_attempts", 0) > 0
+        },
+    }
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Background worker for queued quiz generation jobs.
+
+Each worker loop claims one job at a time from the generation_jobs
+collection, renews the job's lease while it runs, and reports progress that
+the /jobs endpoints surface to the client. Input errors (bad files, empty
+text) fail the job immediately; anything else is retried with backoff until
+JOB_MAX_ATTEMPTS is reached. A job whose worker dies is picked up again once
+its lease lapses.
+
+Run standalone (scale by starting more processes or raising --concurrency):
+    python worker.py --concurrency 4
+
+or inside the API process by setting JOB_INPROCESS_WORKERS.
+"""
+import argparse
+import asyncio
+import os
+import signal
+import socket
+import tempfile
+import traceback
+from typing import List, Optional
+
+from config import config
+import db
+import llm
+from ingest import SpooledUpload, PdfExtractionError, UploadTooLargeError, shutdown_pdf_executor
+from quiz_generation import GenerationRequest, GenerationInputError, create_quiz
+
+# Errors that will fail the same way on every attempt
+PERMANENT_ERRORS = (GenerationInputError, PdfExtractionError, UploadTooLargeError)
+
+SWEEP_EVERY_POLLS = 30
+
+
+class JobLeaseLostError(Exception):
+    """Raised when another worker has taken over the job being processed"""
+
+
+async def _materialize_upload(job_doc: dict) -> Optional[SpooledUpload]:
+    if not job_doc.get("upload_id"):
+        return None
+    fd, path = tempfile.mkstemp(prefix="quiz-job-")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            size = await db.download_job_upload(job_doc["upload_id"], out)
+    except BaseException:
+        os.unlink(path)
+        raise
+    return SpooledUpload(path=path, size=size, sha256=job_doc["upload_sha256"])
+
+
+class GenerationWorker:
+    def __init__(self, worker_id: str):
+        self.worker_id = worker_id
+
+    async def run(self, stop: asyncio.Event):
+        print(f"Generation worker {self.worker_id} started")
+        polls = 0
+        while not stop.is_set():
+            try:
+                job_doc = await db.claim_generation_job(self.worker_id)
+                if job_doc:
+                    await self.process(job_doc)
+                    continue
+                polls += 1
+                if polls % SWEEP_EVERY_POLLS == 0:
+                    swept = await db.fail_abandoned_generation_jobs()
+                    if swept:
+                        print(f"Marked {swept} abandoned generation jobs as failed")
+            except Exception as e:
+                print(f"Error in generation worker {self.worker_id}: {str(e)}")
+                traceback.print_exc()
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=config.JOB_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+        print(f"Generation worker {self.worker_id} stopped")
+
+    async def process(self, job_doc: dict):
+        job_id = job_doc["_id"]
+        print(f"Worker {self.worker_id} running job {job_id} (attempt {job_doc['attempts']})")
+
+        async def report(stage: str, percent: int):
+            await db.update_generation_job_progress(job_id, self.worker_id, stage, percent)
+
+        task = asyncio.create_task(self._run_job(job_doc, report))
+        heartbeat = asyncio.create_task(self._heartbeat(job_id, task))
+        try:
+            quiz_id = await task
+            await db.complete_generation_job(job_id, self.worker_id, quiz_id)
+            print(f"Job {job_id} succeeded: quiz {quiz_id}")
+        except asyncio.CancelledError:
+            if heartbeat.done() and isinstance(heartbeat.exception(), JobLeaseLostError):
+                print(f"Job {job_id} lease was lost; abandoning it")
+                return
+            # Shutting down mid-job: requeue it now rather than waiting for the lease to lapse
+            await db.fail_generation_job(job_id, self.worker_id, "Worker shut down", retry=True)
+            raise
+        except PERMANENT_ERRORS as e:
+            print(f"Job {job_id} failed: {str(e)}")
+            await db.fail_generation_job(job_id, self.worker_id, str(e), retry=False)
+        except Exception as e:
+            print(f"Job {job_id} errored: {str(e)}")
+            traceback.print_exc()
+            await db.fail_generation_job(job_id, self.worker_id, str(e), retry=True)
+        finally:
+            heartbeat.cancel()
+
+    async def _run_job(self, job_doc: dict, report) -> str:
+        upload = await _materialize_upload(job_doc)
+        try:
+            request = GenerationRequest.from_doc(job_doc["request"])
+            response = await create_quiz(job_doc["user_id"], request, upload, progress=report)
+            return response["quiz_id"]
+        finally:
+            if upload:
+                upload.cleanup()
+
+    async def _heartbeat(self, job_id, task: asyncio.Task):
+        while True:
+            await asyncio.sleep(config.JOB_HEARTBEAT_SECONDS)
+            if not await db.renew_generation_job_lease(job_id, self.worker_id):
+                task.cancel()
+                raise JobLeaseLostError(str(job_id))
+
+
+def start_workers(concurrency: int, stop: asyncio.Event, prefix: Optional[str] = None) -> List[asyncio.Task]:
+    """Start `concurrency` worker loops on the running event loop"""
+    prefix = prefix or f"{socket.gethostname()}:{os.getpid()}"
+    return [
+        asyncio.create_task(GenerationWorker(f"{prefix}:{i}").run(stop))
+        for i in range(concurrency)
+    ]
+
+
+async def main(concurrency: int):
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    workers = start_workers(concurrency, stop)
+    try:
+        await asyncio.gather(*workers)
+    finally:
+        shutdown_pdf_executor()
+        await llm.close_client()
+        await db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run quiz generation job workers")
+    parser.add_argument("--concurrency", type=int, default=config.JOB_WORKER_CONCURRENCY,
+                        help="Jobs processed at the same time by this process")
+    args = parser.parse_args()
+    asyncio.run(main(args.concurrency))
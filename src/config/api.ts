@@ -15,6 +15,7 @@ export const API_ENDPOINTS = {
   
   // Quiz Management
   CREATE_QUIZ: `${API_BASE_URL}/generate-quiz`,
+  CREATE_QUIZ_STREAM: `${API_BASE_URL}/generate-quiz/stream`,
   GET_QUIZ: (quizId: string) => `${API_BASE_URL}/quiz/${quizId}`,
   SUBMIT_QUIZ: (quizId: string) => `${API_BASE_URL}/quiz/${quizId}/submit`,
   GET_ALL_QUIZZES: `${API_BASE_URL}/quizzes`,
@@ -28,6 +29,7 @@ export const API_ENDPOINTS = {
   
   // User History
   GET_USER_HISTORY: (username: string) => `${API_BASE_URL}/users/${username}/history`,
+  GET_DASHBOARD: (fields?: string) => `${API_BASE_URL}/me/dashboard${fields ? `?fields=${fields}` : ''}`,
 };
 
 export default API_BASE_URL; 
\ No newline at end of file
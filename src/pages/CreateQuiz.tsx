@@ -10,14 +10,22 @@ interface Question {
   correct_answers: string[];
 }
 
-interface Quiz {
-  quiz: string;
-  quiz_id: string;
-  parsed_questions: Question[];
-}
+// One line of the newline-delimited JSON stream from /generate-quiz/stream
+type StreamEvent =
+  | { type: 'quiz'; quiz_id: string; title: string }
+  | { type: 'question'; index: number; question: Question }
+  | { type: 'done'; quiz_id: string; num_questions: number; requested: number; cached: boolean; bank_questions: number }
+  | { type: 'error'; status: number; detail: string };
 
 type QuizMode = 'file' | 'subject';
 
+// A finished quiz that came out with fewer questions than requested
+interface ShortQuiz {
+  quizId: string;
+  numQuestions: number;
+  requested: number;
+}
+
 const CreateQuiz = () => {
   const [mode, setMode] = useState<QuizMode>('file');
   const [dragActive, setDragActive] = useState(false);
@@ -28,6 +36,8 @@ const CreateQuiz = () => {
   const [numQuestions, setNumQuestions] = useState<number>(10);
   const [difficulty, setDifficulty] = useState<string>("medium");
   const [error, setError] = useState<string | null>(null);
+  const [streamedQuestions, setStreamedQuestions] = useState<Question[]>([]);
+  const [shortQuiz, setShortQuiz] = useState<ShortQuiz | null>(null);
 
   const navigate = useNavigate();
   const { user, token } = useAuth();
@@ -101,6 +111,7 @@ const CreateQuiz = () => {
 
   const handleGenerateQuiz = async () => {
     setError(null);
+    setShortQuiz(null);
 
     if (!user || !token) {
       setError("User not authenticated. Please sign in.");
@@ -126,7 +137,8 @@ const CreateQuiz = () => {
 
     try {
       setIsGenerating(true);
-      const apiUrl = API_ENDPOINTS.CREATE_QUIZ;
+      setStreamedQuestions([]);
+      const apiUrl = API_ENDPOINTS.CREATE_QUIZ_STREAM;
 
       let body;
       const headers: HeadersInit = {
@@ -154,13 +166,54 @@ const CreateQuiz = () => {
         body: body,
       });
 
-      if (!response.ok) {
+      if (!response.ok || !response.body) {
         const errorData = await response.json();
         throw new Error(errorData.detail || response.statusText);
       }
 
-      const data: Quiz = await response.json();
-      navigate(`/quiz/${data.quiz_id}`);
+      // Questions are shown as soon as each one is generated
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      let quizId: string | null = null;
+      let finished = false;
+      let generated = 0;
+      let requested = 0;
+
+      while (!finished) {
+        const { value, done } = await reader.read();
+        buffer += decoder.decode(value, { stream: !done });
+        const lines = buffer.split('\n');
+        buffer = done ? '' : lines.pop()!;
+
+        for (const line of lines) {
+          if (!line.trim()) continue;
+          const event: StreamEvent = JSON.parse(line);
+          if (event.type === 'quiz') {
+            quizId = event.quiz_id;
+          } else if (event.type === 'question') {
+            setStreamedQuestions((previous) => [...previous, event.question]);
+          } else if (event.type === 'error') {
+            throw new Error(event.detail);
+          } else if (event.type === 'done') {
+            quizId = event.quiz_id;
+            generated = event.num_questions;
+            requested = event.requested;
+            finished = true;
+          }
+        }
+        if (done) break;
+      }
+
+      if (!finished || !quizId) {
+        throw new Error('Quiz generation was interrupted. Please try again.');
+      }
+      if (generated < requested) {
+        // Let the user see the shortfall before starting the quiz
+        setShortQuiz({ quizId, numQuestions: generated, requested });
+        return;
+      }
+      navigate(`/quiz/${quizId}`);
     } catch (error) {
       console.error('Error generating quiz:', error);
       setError(error instanceof Error ? error.message : 'Failed to generate quiz. Please try again.');
@@ -187,6 +240,23 @@ const CreateQuiz = () => {
             </div>
           )}
 
+          {shortQuiz && (
+            <div className="mb-6 bg-yellow-900/50 border border-yellow-500 rounded-lg p-4 flex items-center justify-between gap-4">
+              <div className="flex items-center space-x-3">
+                <AlertCircle className="text-yellow-400" size={20} />
+                <p className="text-yellow-400">
+                  Only {shortQuiz.numQuestions} of the {shortQuiz.requested} requested questions could be generated.
+                </p>
+              </div>
+              <button
+                onClick={() => navigate(`/quiz/${shortQuiz.quizId}`)}
+                className="bg-yellow-600 hover:bg-yellow-700 text-white font-bold py-2 px-4 rounded-lg transition-colors whitespace-nowrap"
+              >
+                Start Quiz
+              </button>
+            </div>
+          )}
+
           {/* Mode Selection */}
           <div className="flex flex-col sm:flex-row gap-4 mb-8">
             <button
@@ -367,6 +437,24 @@ const CreateQuiz = () => {
                   )}
                 </button>
               </div>
+
+              {streamedQuestions.length > 0 && (
+                <div className="mt-8 space-y-3">
+                  <p className="text-gray-400 text-sm">
+                    {streamedQuestions.length} of {numQuestions} questions ready
+                  </p>
+                  {streamedQuestions.map((question, index) => (
+                    <div key={index} className="bg-gray-700 rounded-lg p-4">
+                      <p className="text-white font-medium">{index + 1}. {question.question}</p>
+                      <ul className="mt-2 text-gray-300 text-sm space-y-1">
+                        {question.options.map((option, optionIndex) => (
+                          <li key={optionIndex}>{String.fromCharCode(65 + optionIndex)}. {option}</li>
+                        ))}
+                      </ul>
+                    </div>
+                  ))}
+                </div>
+              )}
             </div>
           )}
         </div>
@@ -26,166 +26,134 @@ interface CreatedQuiz {
   user_id?: string;
 }
 
+interface DifficultyStats {
+  totalAttempts: number;
+  averageScore: number;
+  bestScore: number;
+  globalScore: number;
+}
+
+interface DashboardStats {
+  globalScore: number;
+  totalCorrect: number;
+  totalQuestions: number;
+  totalIncorrect: number;
+  averageScore: number;
+  totalTime: number;
+  totalAttempts: number;
+  bestScore: number;
+  averageTime: number;
+  byDifficulty: Record<string, DifficultyStats>;
+}
+
+const EMPTY_STATS: DashboardStats = {
+  globalScore: 0,
+  totalCorrect: 0,
+  totalQuestions: 0,
+  totalIncorrect: 0,
+  averageScore: 0,
+  totalTime: 0,
+  totalAttempts: 0,
+  bestScore: 0,
+  averageTime: 0,
+  byDifficulty: {}
+};
+
+const HISTORY_PAGE_SIZE = 20;
+
 const Profile = () => {
   const { user, token, updateUser } = useAuth();
   const navigate = useNavigate();
   const [activeTab, setActiveTab] = useState('overview');
   const [userQuizHistory, setUserQuizHistory] = useState<QuizAttempt[]>([]);
+  // Cursor of the next history page; null once every attempt is loaded
+  const [historyCursor, setHistoryCursor] = useState<string | null>(null);
+  const [loadingMoreHistory, setLoadingMoreHistory] = useState(false);
   const [loadingHistory, setLoadingHistory] = useState(true);
   const [errorHistory, setErrorHistory] = useState<string | null>(null);
   const [totalCreatedQuizzes, setTotalCreatedQuizzes] = useState<number>(0);
   const [userCreatedQuizzes, setUserCreatedQuizzes] = useState<CreatedQuiz[]>([]);
-  const [allAvailableQuizzes, setAllAvailableQuizzes] = useState<CreatedQuiz[]>([]);
-  const [loadingCreatedQuizzes, setLoadingCreatedQuizzes] = useState(true);
-  const [loadingAllQuizzes, setLoadingAllQuizzes] = useState(true);
-
-  useEffect(() => {
-    const fetchUserHistory = async () => {
-      if (!user || !token) {
-        setLoadingHistory(false);
-        return;
-      }
-
-      try {
-        const response = await fetch(API_ENDPOINTS.GET_USER_HISTORY(user.username), {
-          headers: {
-            'Content-Type': 'application/json',
-            Authorization: `Bearer ${token}`,
-          },
-        });
-        if (!response.ok) {
-          throw new Error(`HTTP error! status: ${response.status}`);
-        }
-        const data = await response.json();
-        setUserQuizHistory(data);
-      } catch (error) {
-        console.error("Error fetching quiz history:", error);
-        setErrorHistory("Failed to load quiz history.");
-      } finally {
-        setLoadingHistory(false);
-      }
-    };
+  const [stats, setStats] = useState<DashboardStats>(EMPTY_STATS);
 
-    const fetchTotalCreatedQuizzes = async () => {
-      if (!user || !token) return;
-
-      try {
-        const response = await fetch(API_ENDPOINTS.GET_USER_QUIZZES_COUNT, {
-          headers: {
-            Authorization: `Bearer ${token}`,
-          },
-        });
-        if (!response.ok) {
-          throw new Error(`HTTP error! status: ${response.status}`);
-        }
-        const data = await response.json();
-        setTotalCreatedQuizzes(data.total_created_quizzes);
-      } catch (error) {
-        console.error("Error fetching total created quizzes:", error);
-      }
-    };
+  // One request for the whole page; `fields` narrows it when only part needs refreshing
+  const fetchDashboard = async (fields?: string) => {
+    if (!user || !token) {
+      setLoadingHistory(false);
+      return;
+    }
 
-    const fetchUserCreatedQuizzes = async () => {
-      if (!user || !token) {
-        setLoadingCreatedQuizzes(false);
-        return;
-      }
-      try {
-        const response = await fetch(API_ENDPOINTS.GET_USER_QUIZZES, {
-          headers: {
-            'Content-Type': 'application/json',
-            Authorization: `Bearer ${token}`,
-          },
-        });
-        if (!response.ok) {
-          throw new Error(`HTTP error! status: ${response.status}`);
-        }
-        const data = await response.json();
-        setUserCreatedQuizzes(data);
-      } catch (error) {
-        console.error("Error fetching user created quizzes:", error);
-      } finally {
-        setLoadingCreatedQuizzes(false);
+    try {
+      const response = await fetch(API_ENDPOINTS.GET_DASHBOARD(fields), {
+        headers: {
+          Authorization: `Bearer ${token}`,
+        },
+      });
+      if (!response.ok) {
+        throw new Error(`HTTP error! status: ${response.status}`);
       }
-    };
-
-    const fetchAllAvailableQuizzes = async () => {
-      if (!user || !token) {
-        setLoadingAllQuizzes(false);
-        return;
+      const data = await response.json();
+      if (data.attempts) {
+        setUserQuizHistory(data.attempts.items);
+        setHistoryCursor(data.attempts.next_cursor);
       }
-      try {
-        const response = await fetch(API_ENDPOINTS.GET_ALL_QUIZZES, {
-          headers: {
-            Authorization: `Bearer ${token}`,
-          },
+      if (data.created_quizzes) setUserCreatedQuizzes(data.created_quizzes.items);
+      if (data.counts) setTotalCreatedQuizzes(data.counts.created_quizzes);
+      if (data.stats) {
+        setStats({
+          globalScore: data.stats.global_score,
+          totalCorrect: data.stats.total_correct,
+          totalQuestions: data.stats.total_questions,
+          totalIncorrect: data.stats.total_incorrect,
+          averageScore: data.stats.average_score,
+          totalTime: data.stats.total_time_seconds,
+          totalAttempts: data.stats.total_attempts,
+          bestScore: data.stats.best_score,
+          averageTime: data.stats.average_time_seconds,
+          byDifficulty: Object.fromEntries(
+            Object.entries(data.stats.by_difficulty || {}).map(([difficulty, totals]: [string, any]) => [difficulty, {
+              totalAttempts: totals.total_attempts,
+              averageScore: totals.average_score,
+              bestScore: totals.best_score,
+              globalScore: totals.global_score
+            }])
+          )
         });
-        if (!response.ok) {
-          throw new Error(`HTTP error! status: ${response.status}`);
-        }
-        const data = await response.json();
-        setAllAvailableQuizzes(data);
-      } catch (error) {
-        console.error("Error fetching all available quizzes:", error);
-      } finally {
-        setLoadingAllQuizzes(false);
       }
-    };
+    } catch (error) {
+      console.error("Error fetching profile dashboard:", error);
+      if (!fields) setErrorHistory("Failed to load quiz history.");
+    } finally {
+      setLoadingHistory(false);
+    }
+  };
 
-    fetchUserHistory();
-    fetchTotalCreatedQuizzes();
-    fetchUserCreatedQuizzes();
-    fetchAllAvailableQuizzes();
+  useEffect(() => {
+    fetchDashboard();
   }, [user, token]);
 
-  // Calculate comprehensive stats
-  const calculateStats = () => {
-    if (userQuizHistory.length === 0) {
-      return {
-        globalScore: 0,
-        totalCorrect: 0,
-        totalQuestions: 0,
-        totalIncorrect: 0,
-        averageScore: 0,
-        totalTime: 0,
-        totalAttempts: 0,
-        bestScore: 0,
-        averageTime: 0
-      };
+  // Continue the dashboard's first page through the paginated history endpoint
+  const loadMoreHistory = async () => {
+    if (!user || !token || !historyCursor) return;
+    setLoadingMoreHistory(true);
+    try {
+      const response = await fetch(
+        `${API_ENDPOINTS.GET_USER_HISTORY(user.username)}?limit=${HISTORY_PAGE_SIZE}&cursor=${encodeURIComponent(historyCursor)}`,
+        { headers: { Authorization: `Bearer ${token}` } }
+      );
+      if (!response.ok) {
+        throw new Error(`HTTP error! status: ${response.status}`);
+      }
+      const page: QuizAttempt[] = await response.json();
+      setUserQuizHistory(prevHistory => [...prevHistory, ...page]);
+      setHistoryCursor(response.headers.get('X-Next-Cursor'));
+    } catch (error) {
+      console.error("Error loading more quiz history:", error);
+      alert("Could not load more quiz history.");
+    } finally {
+      setLoadingMoreHistory(false);
     }
-
-    let totalCorrect = 0;
-    let totalQuestions = 0;
-    let totalTime = 0;
-    let bestScore = 0;
-
-    userQuizHistory.forEach(attempt => {
-      totalCorrect += attempt.correct_answers;
-      totalQuestions += attempt.total_questions;
-      totalTime += attempt.time_taken_seconds || 0;
-      if (attempt.score > bestScore) bestScore = attempt.score;
-    });
-
-    const globalScore = totalQuestions > 0 ? (totalCorrect / totalQuestions) * 100 : 0;
-    const totalIncorrect = totalQuestions - totalCorrect;
-    const averageScore = userQuizHistory.reduce((sum, attempt) => sum + attempt.score, 0) / userQuizHistory.length;
-    const averageTime = totalTime / userQuizHistory.length;
-
-    return {
-      globalScore,
-      totalCorrect,
-      totalQuestions,
-      totalIncorrect,
-      averageScore,
-      totalTime,
-      totalAttempts: userQuizHistory.length,
-      bestScore,
-      averageTime
-    };
   };
 
-  const stats = calculateStats();
-
   const handleDeleteAttempt = async (attemptId: string) => {
     if (!token || !window.confirm("Are you sure you want to delete this quiz attempt?")) {
       return;
@@ -200,6 +168,7 @@ const Profile = () => {
         throw new Error(`Failed to delete quiz attempt: ${response.statusText}`);
       }
       setUserQuizHistory(prevHistory => prevHistory.filter(attempt => attempt.id !== attemptId));
+      fetchDashboard('stats,counts');
       alert("Quiz attempt deleted successfully!");
     } catch (error) {
       console.error("Error deleting quiz attempt:", error);
@@ -220,7 +189,8 @@ const Profile = () => {
       if (!response.ok) {
         throw new Error(`Failed to delete created quiz: ${response.statusText}`);
       }
-      setUserCreatedQuizzes(prevQuizzes => prevQuizzes.filter(quiz => quiz.id !== quizId));
+      // Deleting a quiz also deletes every attempt at it
+      fetchDashboard();
       alert("Created quiz and associated data deleted successfully!");
     } catch (error) {
       console.error("Error deleting created quiz:", error);
@@ -257,6 +227,20 @@ const Profile = () => {
 
   const groupedAttempts = groupAttemptsByQuiz();
 
+  const loadMoreHistoryButton = historyCursor && (
+    <div className="mt-6 text-center">
+      <p className="text-gray-400 text-sm mb-3">Showing your {userQuizHistory.length} most recent attempts</p>
+      <button
+        onClick={loadMoreHistory}
+        disabled={loadingMoreHistory}
+        className="inline-flex items-center space-x-2 bg-gray-600 hover:bg-gray-500 disabled:opacity-60 text-white px-6 py-2 rounded-lg transition-colors"
+      >
+        {loadingMoreHistory && <Loader2 size={16} className="animate-spin" />}
+        <span>{loadingMoreHistory ? 'Loading...' : 'Load more attempts'}</span>
+      </button>
+    </div>
+  );
+
   const formatTime = (seconds: number) => {
     if (!seconds) return 'N/A';
     const hours = Math.floor(seconds / 3600);
@@ -508,7 +492,7 @@ const Profile = () => {
   };
 
   // Show loading state while fetching data
-  if (loadingHistory || loadingCreatedQuizzes || loadingAllQuizzes) {
+  if (loadingHistory) {
     return (
       <div className="min-h-screen bg-gray-900 flex items-center justify-center">
         <div className="text-center">
@@ -672,6 +656,22 @@ const Profile = () => {
                         <div className="text-gray-300">Average Time</div>
                       </div>
                     </div>
+
+                    {Object.keys(stats.byDifficulty).length > 0 && (
+                      <div className="mt-6 grid md:grid-cols-3 gap-4">
+                        {Object.entries(stats.byDifficulty).map(([difficulty, difficultyStats]) => (
+                          <div key={difficulty} className="bg-gray-800 rounded-lg p-4">
+                            <div className="text-white font-semibold capitalize mb-2">{difficulty}</div>
+                            <div className={`text-2xl font-bold ${getScoreColor(difficultyStats.globalScore)}`}>
+                              {difficultyStats.globalScore.toFixed(1)}%
+                            </div>
+                            <div className="text-gray-400 text-sm">
+                              {difficultyStats.totalAttempts} attempt{difficultyStats.totalAttempts !== 1 ? 's' : ''} • best {difficultyStats.bestScore.toFixed(1)}%
+                            </div>
+                          </div>
+                        ))}
+                      </div>
+                    )}
                     
                     <div className="mt-6 flex justify-center">
                       <button 
@@ -801,6 +801,7 @@ const Profile = () => {
                     </button>
                   </div>
                 )}
+                {loadMoreHistoryButton}
               </div>
             )}
 
@@ -889,6 +890,7 @@ const Profile = () => {
                     ))}
                   </div>
                 )}
+                {!loadingHistory && !errorHistory && loadMoreHistoryButton}
                 
                 {/* Quick Actions */}
                 <div className="mt-8 text-center">
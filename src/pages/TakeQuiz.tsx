@@ -46,7 +46,8 @@ const TakeQuiz = () => {
   const { quiz, quizId, parsed_questions } = (location.state || {}) as LocationState;
   const [quizData, setQuizData] = useState<QuizData | null>(null);
   const [currentQuestionIndex, setCurrentQuestionIndex] = useState(0);
-  const [userAnswers, setUserAnswers] = useState<Record<string, string[]>>({});
+  // Selected option indices per question (0 = A), as the submit API expects
+  const [userAnswers, setUserAnswers] = useState<Record<string, number[]>>({});
   const [showResults, setShowResults] = useState(false);
   const [results, setResults] = useState<QuizResultsData | null>(null);
   const [loading, setLoading] = useState(true);
@@ -160,18 +161,18 @@ const TakeQuiz = () => {
     }
   }, [quizData, location.state, urlQuizId, quizId, loading, navigate]);
 
-  const handleCheckboxChange = (questionId: string, option: string) => {
+  const handleCheckboxChange = (questionId: string, optionIndex: number) => {
     setUserAnswers((prevAnswers) => {
       const currentAnswers = prevAnswers[questionId] || [];
-      if (currentAnswers.includes(option)) {
+      if (currentAnswers.includes(optionIndex)) {
         return {
           ...prevAnswers,
-          [questionId]: currentAnswers.filter((item) => item !== option),
+          [questionId]: currentAnswers.filter((item) => item !== optionIndex),
         };
       } else {
         return {
           ...prevAnswers,
-          [questionId]: [...currentAnswers, option],
+          [questionId]: [...currentAnswers, optionIndex],
         };
       }
     });
@@ -233,10 +234,11 @@ const TakeQuiz = () => {
     setError(null);
 
     try {
-      const answersToSend: Record<string, string[]> = {};
+      // Answers are sent as option indices (0 = A)
+      const answersToSend: Record<string, number[]> = {};
       quizData.parsed_questions.forEach(q => {
         if (q.id) {
-          answersToSend[q.id] = userAnswers[q.id] || [];
+          answersToSend[q.id] = [...(userAnswers[q.id] || [])].sort((a, b) => a - b);
         }
       });
 
@@ -372,8 +374,8 @@ const TakeQuiz = () => {
                     <input
                       type="checkbox"
                       value={option}
-                      checked={(userAnswers[currentQuestion.id || ''] || []).includes(option)}
-                      onChange={() => handleCheckboxChange(currentQuestion.id || '', option)}
+                      checked={(userAnswers[currentQuestion.id || ''] || []).includes(index)}
+                      onChange={() => handleCheckboxChange(currentQuestion.id || '', index)}
                       className="form-checkbox h-5 w-5 text-blue-500 bg-gray-600 border-gray-500 rounded focus:ring-blue-500"
                     />
                     <span className="ml-4 text-lg">{String.fromCharCode(65 + index)}. {option}</span>